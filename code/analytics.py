@@ -0,0 +1,356 @@
+# analytics.py
+# Offline analysis of exported interviews (runs on a multiprocessing pool, no Streamlit needed).
+#
+# Input: a CSV export of the results sheet (utils.RESULTS_SHEET_NAME, File > Download > CSV), one row per respondent
+# laid out as in utils.save_survey_data_to_gsheet (survey answers in columns A-M, transcript chunks in N-R, or a
+# blob reference in N when config.TRANSCRIPT_BLOB_STORE is set; --blob-store names the store to read it from).
+# For a study bundle's sheet pass --study <id>: its survey columns, numeric (slider) columns and interview outline
+# come from the bundle (studies.py).
+#
+# For every interview the transcript is split into turns (interviewer question + respondent answer), each turn is
+# aligned to a part of config.INTERVIEW_OUTLINE, and skill / AI mentions are extracted from the answers with a
+# lexicon (DEFAULT_LEXICON or --lexicon file.json). Outputs in --out:
+#   turns.csv            one row per turn: username, turn, part, word counts, mention counts
+#   mentions.csv         one row per mention: term, category, username, turn, part
+#   inverted_index.json  term -> {"category", "postings": [[username, turn], ...]}
+#   features.csv         per-interview features joined with the survey responses (student number left out)
+#   errors.csv           rows that could not be analysed (missing blob, malformed transcript): line, username, error;
+#                        the run skips them and carries on
+#
+# Usage:  python analytics.py pilot_survey_results.csv --out data/analytics --processes 8 [--blob-store gs://bucket/transcripts]
+#         python analytics.py housing_survey_results.csv --study housing
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import blob_store
+import config
+import studies
+
+DEFAULT_OUTPUT_DIR = os.path.join("data", "analytics")
+
+# Column layout of the built-in study's results sheet (see utils.save_survey_data_to_gsheet; bundles: export_layout)
+SURVEY_COLUMNS = ["username", "submission_time_utc", "consent_given", "age", "gender", "major", "year", "gpa",
+                  "student_nis", "learning_enjoyment", "university_enjoyment", "ai_usage_percentage", "ai_model"]
+TRANSCRIPT_COLUMNS = [f"{studies.TRANSCRIPT_COLUMN_PREFIX}{i}" for i in range(1, 6)]
+RESULT_COLUMNS = SURVEY_COLUMNS + TRANSCRIPT_COLUMNS
+NUMERIC_SURVEY_COLUMNS = ["gpa", "learning_enjoyment", "university_enjoyment", "ai_usage_percentage"]
+PRIVATE_SURVEY_COLUMNS = ["student_nis"] # Left out of features.csv
+
+TURN_SEPARATOR = "\n---\n" # As written by message_store.format_transcript
+ROLE_PREFIXES = {"Assistant: ": "assistant", "User: ": "user"}
+
+# Lexicon: category -> term -> phrases. Phrases match on word boundaries, case-insensitively; a trailing '*' matches
+# any word continuation ("programm*" -> programming, programmer) and '?' any single character.
+DEFAULT_LEXICON = {
+    "skill": {
+        "communication": ["communication", "communicat*", "presentation*", "public speaking"],
+        "teamwork": ["teamwork", "team work", "collaborat*", "working in teams", "working with others"],
+        "leadership": ["leadership", "leading a team", "manage people", "managing people"],
+        "critical thinking": ["critical thinking", "think critically", "analytical thinking", "reasoning"],
+        "problem solving": ["problem solving", "problem-solving", "solve problems", "solving problems"],
+        "creativity": ["creativ*", "innovat*"],
+        "adaptability": ["adaptab*", "adapt to", "flexib*", "resilien*"],
+        "programming": ["programm*", "coding", "python", "sql", "software development"],
+        "data analysis": ["data analys*", "data science", "statistic*", "econometric*", "excel"],
+        "quantitative": ["quantitative", "math*", "financial modell*", "financial model*"],
+        "languages": ["language skills", "english", "languages"],
+        "networking": ["networking", "connections", "contacts"],
+        "negotiation": ["negotiat*"],
+        "time management": ["time management", "organi?ation", "organi?ed"],
+        "emotional intelligence": ["emotional intelligence", "empathy", "interpersonal", "soft skills"],
+    },
+    "ai": {
+        "ai": ["ai", "artificial intelligence", "a.i."],
+        "chatgpt": ["chatgpt", "chat gpt", "gpt*"],
+        "llm": ["llm*", "large language model*", "language model*"],
+        "automation": ["automat*"],
+        "machine learning": ["machine learning", "deep learning", "neural network*"],
+        "ai tools": ["copilot", "gemini", "claude", "midjourney", "prompt*"],
+    },
+}
+
+
+# --- Outline Parts ---
+OUTLINE_QUOTE_PATTERN = re.compile(r"'([A-Z][^\n]*?[?.)])'(?=[\s).,*]|$)")
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset("a an and are as at be but by can could do does for from have how i if in is it its me my of "
+                      "on or so that the this to was what when where which who why will with would you your".split())
+ALIGNMENT_THRESHOLD = 0.5 # Share of the shorter question's content words an anchor question must cover
+RATING_PATTERN = re.compile(r"\s*([1-4])(?!\d)") # Answer to the summary evaluation question
+
+
+def content_words(text):
+    return {w for w in WORD_PATTERN.findall(text.lower()) if w not in STOPWORDS}
+
+
+def outline_parts(outline=None):
+    """[(part name, [anchor question word sets])] in outline order, from the quoted questions of each part."""
+    outline = outline or config.INTERVIEW_OUTLINE
+    # Headings in bold: '**Part I: ...**', '**Summary and evaluation**'; the text before Part I is the opening
+    sections = re.split(r"\*\*(Part [IVX]+: [^*]+|Summary and evaluation)\*\*", outline)
+    parts = [("Opening", sections[0])] + [(sections[i].split(":")[0].strip() if sections[i].startswith("Part") else "Summary",
+                                            sections[i + 1]) for i in range(1, len(sections) - 1, 2)]
+    aligned = []
+    for name, text in parts:
+        anchors = [content_words(q) for q in OUTLINE_QUOTE_PATTERN.findall(text)]
+        anchors = [a for a in anchors if len(a) >= 3]
+        if anchors: aligned.append((name, anchors))
+    return aligned
+
+
+def align_parts(questions, parts):
+    """Outline part of each interviewer question; parts only move forward, on a close match with an anchor question."""
+    labels, current = [], 0
+    for question in questions:
+        words = content_words(question)
+        best_index, best_score = current, 0.0
+        for index in range(current, len(parts)):
+            for anchor in parts[index][1]:
+                overlap = len(words & anchor) / max(1, min(len(words), len(anchor)))
+                if overlap > best_score: best_index, best_score = index, overlap
+        if best_score >= ALIGNMENT_THRESHOLD: current = best_index
+        labels.append(parts[current][0])
+    return labels
+
+
+# --- Transcript Parsing ---
+def transcript_from_row(row):
+    """Full transcript: from the blob store when the first transcript column holds a reference (blob_store.py), else
+    from the chunk columns (chunks were cut at fixed widths, so they join without separator)."""
+    first_part = (row.get(TRANSCRIPT_COLUMNS[0]) or "").strip()
+    if blob_store.is_reference(first_part):
+        store = blob_store.default_store()
+        if store is None: raise blob_store.BlobStoreError("The export holds transcript references: pass --blob-store or set config.TRANSCRIPT_BLOB_STORE.")
+        return blob_store.get_text(store, first_part)
+    return "".join(row.get(column) or "" for column in TRANSCRIPT_COLUMNS)
+
+
+def split_turns(transcript):
+    """[(question, answer)] pairs; blocks without a role prefix belong to the previous block."""
+    blocks = []
+    for block in transcript.split(TURN_SEPARATOR):
+        for prefix, role in ROLE_PREFIXES.items():
+            if block.startswith(prefix):
+                blocks.append([role, block[len(prefix):]]); break
+        else:
+            if blocks: blocks[-1][1] += TURN_SEPARATOR + block
+    turns, question, answered = [], "", False
+    for role, content in blocks:
+        if role == "assistant":
+            question, answered = content, False
+        elif answered: # Several answers to one question
+            turns[-1] = (question, turns[-1][1] + "\n" + content)
+        else:
+            turns.append((question, content)); answered = True
+    return turns
+
+
+# --- Lexicon ---
+def compile_lexicon(lexicon):
+    """category -> (regex, [(phrase pattern, term)]); one alternation per category, longest phrases first."""
+    compiled = {}
+    for category, terms in lexicon.items():
+        phrase_terms, alternatives = [], []
+        for term, phrases in terms.items():
+            for phrase in phrases:
+                phrase = phrase.lower()
+                pattern = re.escape(phrase.rstrip("*")).replace(r"\?", ".") + (r"\w*" if phrase.endswith("*") else "")
+                phrase_terms.append((re.compile(rf"(?:{pattern})$"), term))
+                alternatives.append(pattern)
+        alternatives.sort(key=len, reverse=True)
+        regex = re.compile(r"(?<![\w.])(?:" + "|".join(alternatives) + r")(?!\w)")
+        compiled[category] = (regex, phrase_terms)
+    return compiled
+
+
+def find_mentions(text, compiled_lexicon):
+    """[(term, category)] for every lexicon match in the text."""
+    text = text.lower()
+    mentions = []
+    for category, (regex, phrase_terms) in compiled_lexicon.items():
+        for match in regex.finditer(text):
+            surface = match.group(0)
+            term = next((t for p, t in phrase_terms if p.match(surface)), None)
+            if term: mentions.append((term, category))
+    return mentions
+
+
+# --- Worker ---
+_worker_lexicon = None
+_worker_parts = None
+
+
+def _init_worker(lexicon, blob_store_spec=None, outline=None):
+    global _worker_lexicon, _worker_parts
+    if blob_store_spec: blob_store.configure(blob_store_spec)
+    _worker_lexicon = compile_lexicon(lexicon)
+    _worker_parts = outline_parts(outline)
+
+
+def analyse_interview(item):
+    """(row index, username, turn rows, mention rows, error) for one exported row; error is None, or the reason the row
+    was skipped (one unreadable row must not abort the pool)."""
+    row_index, row = item
+    username = row.get("username", "")
+    try:
+        turn_rows, mention_rows = _analyse_transcript(username, transcript_from_row(row))
+    except Exception as e:
+        return row_index, username, [], [], f"{type(e).__name__}: {e}"
+    return row_index, username, turn_rows, mention_rows, None
+
+
+def _analyse_transcript(username, transcript):
+    turns = split_turns(transcript)
+    parts = align_parts([question for question, _ in turns], _worker_parts)
+    turn_rows, mention_rows = [], []
+    for turn_number, ((question, answer), part) in enumerate(zip(turns, parts), start=1):
+        mentions = find_mentions(answer, _worker_lexicon)
+        skill_mentions = sum(1 for _, category in mentions if category == "skill")
+        rating = RATING_PATTERN.match(answer) if part == "Summary" else None
+        turn_rows.append((username, turn_number, part, len(question.split()), len(answer.split()),
+                          skill_mentions, len(mentions) - skill_mentions, int(rating.group(1)) if rating else None))
+        mention_rows.extend((term, category, username, turn_number, part) for term, category in mentions)
+    return turn_rows, mention_rows
+
+
+def export_layout(study=None):
+    """(survey columns, numeric survey columns, private columns) of a study's results sheet (default: built-in)."""
+    if study is None or study.survey is None: return SURVEY_COLUMNS, NUMERIC_SURVEY_COLUMNS, PRIVATE_SURVEY_COLUMNS
+    return study.sheet_survey_columns, [q["key"] for q in study.survey if q["type"] == "slider"], []
+
+
+def study_outline(study=None):
+    """The interview outline turns are aligned to: the built-in outline, or a bundle's system prompt."""
+    return None if study is None or study.is_default else study.system_prompt
+
+
+def read_export(path, survey_columns=SURVEY_COLUMNS):
+    """Yields (row index, {column: value}) from the sheet export; a header row, if present, is skipped."""
+    result_columns = survey_columns + TRANSCRIPT_COLUMNS
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8") as f:
+        for index, values in enumerate(csv.reader(f)):
+            if not values or (index == 0 and values[0].strip().lower() in ("username", "user", "uuid")): continue
+            values = values + [""] * (len(result_columns) - len(values))
+            yield index, dict(zip(result_columns, values))
+
+
+# --- Features ---
+TURN_COLUMNS = ["username", "turn", "part", "question_words", "answer_words", "skill_mentions", "ai_mentions", "summary_rating"]
+
+
+def interview_features(turns, mentions, parts):
+    """Per-interview features, computed column-wise over the turn and mention tables."""
+    grouped = turns.groupby("username", sort=False)
+    features = pd.DataFrame({
+        "turns": grouped.size(),
+        "answer_words_total": grouped["answer_words"].sum(),
+        "answer_words_mean": grouped["answer_words"].mean(),
+        "answer_words_median": grouped["answer_words"].median(),
+        "skill_mentions": grouped["skill_mentions"].sum(),
+        "ai_mentions": grouped["ai_mentions"].sum(),
+    })
+    total_mentions = features["skill_mentions"] + features["ai_mentions"]
+    features["ai_mention_share"] = np.where(total_mentions > 0, features["ai_mentions"] / total_mentions.where(total_mentions > 0, 1), np.nan)
+
+    # Words per outline part, and the first turn in which the respondent mentioned AI
+    words_by_part = turns.pivot_table(index="username", columns="part", values="answer_words", aggfunc="sum", fill_value=0)
+    words_by_part = words_by_part.reindex(columns=[name for name, _ in parts], fill_value=0)
+    features = features.join(words_by_part.add_prefix("answer_words_").rename(columns=lambda c: c.lower().replace(" ", "_")))
+    features["first_ai_mention_turn"] = turns[turns["ai_mentions"] > 0].groupby("username")["turn"].min()
+
+    if not mentions.empty:
+        distinct = mentions.groupby(["username", "category"])["term"].nunique().unstack(fill_value=0)
+        features = features.join(distinct.reindex(columns=["skill", "ai"], fill_value=0).add_prefix("distinct_").add_suffix("_terms"))
+
+    features["summary_rating"] = turns.dropna(subset=["summary_rating"]).groupby("username")["summary_rating"].last()
+    return features.reset_index().rename(columns={"index": "username"})
+
+
+def survey_table(rows, study=None):
+    survey_columns, numeric_columns, private_columns = export_layout(study)
+    survey = pd.DataFrame(rows, columns=survey_columns).drop(columns=private_columns)
+    for column in numeric_columns:
+        survey[column] = pd.to_numeric(survey[column].astype(str).str.replace(",", ".", regex=False), errors="coerce")
+    return survey
+
+
+def build_inverted_index(mentions):
+    index = {}
+    for (term, category), group in mentions.groupby(["term", "category"], sort=True):
+        postings = group[["username", "turn"]].drop_duplicates().sort_values(["username", "turn"])
+        index[term] = {"category": category, "postings": postings.values.tolist()}
+    return index
+
+
+# --- Pipeline ---
+def run_pipeline(export_path, output_dir, processes=None, lexicon=None, chunksize=32, blob_store_spec=None, study=None):
+    started = time.perf_counter()
+    lexicon = lexicon or DEFAULT_LEXICON
+    survey_columns = export_layout(study)[0]
+    outline = study_outline(study)
+    parts = outline_parts(outline)
+    latest_row = {} # username -> row index of its latest submission (resubmissions replace earlier rows)
+    survey_rows, turn_rows, mention_rows, errors = {}, {}, {}, []
+
+    def rows_with_survey():
+        for row_index, row in read_export(export_path, survey_columns):
+            survey_rows[row_index] = [row[column] for column in survey_columns]
+            latest_row[row["username"]] = row_index
+            yield row_index, row
+
+    with Pool(processes=processes, initializer=_init_worker, initargs=(lexicon, blob_store_spec, outline)) as pool:
+        for row_index, username, turns, mentions, error in pool.imap_unordered(analyse_interview, rows_with_survey(), chunksize=chunksize):
+            if error: errors.append((row_index + 1, username, error)); continue
+            turn_rows[row_index] = turns; mention_rows[row_index] = mentions
+
+    kept = sorted(i for i in latest_row.values() if i in turn_rows) # A skipped latest row drops its interview, see errors.csv
+    turns = pd.DataFrame([t for i in kept for t in turn_rows[i]], columns=TURN_COLUMNS)
+    mentions = pd.DataFrame([m for i in kept for m in mention_rows[i]], columns=["term", "category", "username", "turn", "part"])
+    survey = survey_table([survey_rows[i] for i in kept], study)
+    features = survey.merge(interview_features(turns, mentions, parts), on="username", how="left")
+
+    os.makedirs(output_dir, exist_ok=True)
+    turns.to_csv(os.path.join(output_dir, "turns.csv"), index=False)
+    mentions.to_csv(os.path.join(output_dir, "mentions.csv"), index=False)
+    features.to_csv(os.path.join(output_dir, "features.csv"), index=False)
+    pd.DataFrame(sorted(errors), columns=["line", "username", "error"]).to_csv(os.path.join(output_dir, "errors.csv"), index=False)
+    with open(os.path.join(output_dir, "inverted_index.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(build_inverted_index(mentions), ensure_ascii=False)) # dumps() encodes in C, dump() does not
+
+    return {"interviews": len(kept), "rows_read": len(survey_rows), "skipped": len(errors), "turns": len(turns), "mentions": len(mentions),
+            "distinct_terms": int(mentions["term"].nunique()) if len(mentions) else 0,
+            "seconds": round(time.perf_counter() - started, 2), "output_dir": output_dir}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Turn/part alignment, skill & AI mention index and per-interview features from a results export.")
+    parser.add_argument("export", help="CSV export of the results sheet.")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT_DIR, help="Output directory.")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--lexicon", default=None, help="JSON file {category: {term: [phrases]}} replacing the default lexicon.")
+    parser.add_argument("--chunksize", type=int, default=32, help="Interviews handed to a worker at a time.")
+    parser.add_argument("--blob-store", default=None, help="Transcript blob store (local:<dir> or gs://<bucket>[/<prefix>]); default: config.TRANSCRIPT_BLOB_STORE.")
+    parser.add_argument("--study", default=studies.DEFAULT_STUDY_ID, help="Study bundle whose results sheet this is (default: the built-in study).")
+    args = parser.parse_args()
+
+    lexicon = None
+    if args.lexicon:
+        with open(args.lexicon, encoding="utf-8") as f: lexicon = json.load(f)
+    summary = run_pipeline(args.export, args.out, args.processes, lexicon, args.chunksize, args.blob_store, studies.load_study(args.study))
+    print(f"Analysed {summary['interviews']} interviews ({summary['rows_read']} rows, {summary['turns']} turns, "
+          f"{summary['mentions']} mentions of {summary['distinct_terms']} terms) in {summary['seconds']}s -> {summary['output_dir']}")
+    if summary["skipped"]: print(f"Skipped {summary['skipped']} row(s) that could not be analysed; see errors.csv.")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,38 +19,70 @@ from google.cloud import firestore
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 # --- END NEW Tenacity Imports ---
 
+import cassettes # LLM record/replay (off unless LLM_CASSETTE_MODE is set)
+import message_store # Compact chat history (slotted records, shared system prompt)
+import routing # Fast/strong model routing per turn
+import profiling # Opt-in span tracing (APP_PROFILE=1, or ?profile=1 with APP_PROFILE_ALLOW_QUERY=1)
+import studies # Study bundles selected with ?study=<id>
+
 # --- <<< NEW Local Storage Import >>> ---
 from streamlit_local_storage import LocalStorage
 # --- <<< END NEW Local Storage Import >>> ---
 
+profiling.begin_run() # No-op unless profiling is requested
+
 # --- Constants ---
+TURN_LEASE_BUSY_MESSAGE = "Your previous response is still being processed in another window. Please continue in one window only, or refresh this page in a moment."
 WELCOME_STAGE = "welcome"
 INTERVIEW_STAGE = "interview"
 # MANUAL_INTERVIEW_STAGE = "manual_interview" # REMOVED
 SURVEY_STAGE = "survey"
 COMPLETED_STAGE = "completed"
 
+# --- Study Selection ---
+# The session's study is fixed on its first run (?study=<id>, default: the built-in study from config.py). Bundles are
+# loaded and validated once per process (studies.py); prompt, models, survey and storage targets come from the study.
+study_id = st.session_state.get(studies.SESSION_KEY) or st.query_params.get(studies.STUDY_QUERY_PARAM) or studies.DEFAULT_STUDY_ID
+try:
+    study = studies.load_study(study_id)
+except studies.StudyError as e:
+    print(f"ERROR: {e}"); st.error("This study link is not valid. Please check the link you were given or contact the researcher."); st.stop()
+st.session_state[studies.SESSION_KEY] = study.study_id
+
 # --- API Setup & Retry Configuration ---
+# Turns are routed between the study's model and strong model (routing.py): a client is created for every provider
+# those models need. Clients are cached per process so reruns, sessions and studies share one connection pool each.
 openai_client = None
 anthropic_client = None
-api = None
+api = routing.provider_for_model(study.model) # Provider of the default model: decides how the history is stored
 RETRYABLE_ERRORS = () # Default empty
 
-if "gpt" in config.MODEL.lower():
-    api = "openai"; from openai import OpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError as OpenAIInternalServerError
-    try: openai_client = OpenAI(api_key=st.secrets["API_KEY_OPENAI"], timeout=60.0)
+@st.cache_resource(show_spinner=False) # No spinner: must not render anything before set_page_config
+def get_openai_client(api_key):
+    from openai import OpenAI
+    return cassettes.wrap_client(OpenAI(api_key=api_key, timeout=60.0), "openai")
+
+@st.cache_resource(show_spinner=False)
+def get_anthropic_client(api_key):
+    import anthropic
+    return cassettes.wrap_client(anthropic.Anthropic(api_key=api_key, timeout=60.0), "anthropic")
+
+if None in routing.providers_in_use(study):
+    st.error("Model name must contain 'gpt' or 'claude'."); st.stop()
+
+if "openai" in routing.providers_in_use(study):
+    from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError as OpenAIInternalServerError
+    try: openai_client = get_openai_client(st.secrets["API_KEY_OPENAI"])
     except KeyError: st.error("Error: OpenAI API key ('API_KEY_OPENAI') not found."); st.stop()
     except Exception as e: st.error(f"Error initializing OpenAI client: {e}"); st.stop()
-    RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, OpenAIInternalServerError)
+    RETRYABLE_ERRORS += (RateLimitError, APITimeoutError, APIConnectionError, OpenAIInternalServerError)
 
-elif "claude" in config.MODEL.lower():
-    api = "anthropic"; import anthropic
-    try: anthropic_client = anthropic.Anthropic(api_key=st.secrets["API_KEY_ANTHROPIC"], timeout=60.0)
+if "anthropic" in routing.providers_in_use(study):
+    import anthropic
+    try: anthropic_client = get_anthropic_client(st.secrets["API_KEY_ANTHROPIC"])
     except KeyError: st.error("Error: Anthropic API key ('API_KEY_ANTHROPIC') not found."); st.stop()
     except Exception as e: st.error(f"Error initializing Anthropic client: {e}"); st.stop()
-    RETRYABLE_ERRORS = (anthropic.RateLimitError, anthropic.APIConnectionError, anthropic.InternalServerError, anthropic.APITimeoutError)
-else:
-    st.error("Model name must contain 'gpt' or 'claude'."); st.stop()
+    RETRYABLE_ERRORS += (anthropic.RateLimitError, anthropic.APIConnectionError, anthropic.InternalServerError, anthropic.APITimeoutError)
 
 api_retry_decorator = retry(
     stop=stop_after_attempt(3), # Retry up to 3 times (initial call + 2 retries)
@@ -58,6 +90,57 @@ api_retry_decorator = retry(
     retry=retry_if_exception_type(RETRYABLE_ERRORS),
     reraise=True # Reraise the exception if all retries fail
 )
+
+# --- Streaming (one provider-agnostic path for the opening message and every chat turn) ---
+@api_retry_decorator
+def start_reply_stream(turn_api, api_kwargs):
+    """Sends the streaming request; retried like any API call until the response starts. Returns (stream, close)."""
+    if turn_api == "openai":
+        stream = openai_client.chat.completions.create(**api_kwargs, stream=True)
+        return stream, getattr(stream, "close", None)
+    manager = anthropic_client.messages.stream(**api_kwargs)
+    return manager.__enter__(), lambda: manager.__exit__(None, None, None)
+
+def reply_text_deltas(turn_api, api_kwargs):
+    """Yields the reply's text deltas from either provider; closing the generator closes the connection."""
+    stream, close = start_reply_stream(turn_api, api_kwargs)
+    try:
+        if turn_api == "openai":
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content: yield chunk.choices[0].delta.content
+        else:
+            for text_delta in stream.text_stream:
+                if text_delta: yield text_delta
+    finally:
+        if close: close()
+
+def stream_interviewer_reply(user_id, turn_model, api_messages, message_placeholder, lease_renewed_at, route_reason):
+    """Streams one interviewer reply into the placeholder, renewing the turn lease and stopping as soon as the reply
+    is exactly a closing code. Returns (full_response_content, message_interviewer, detected_code, first_token_seconds,
+    lease_renewed_at); message_interviewer is the text to show (empty for a bare closing code)."""
+    turn_api = routing.provider_for_model(turn_model)
+    api_kwargs = { "model": turn_model, "messages": api_messages, "max_tokens": config.MAX_OUTPUT_TOKENS }
+    if turn_api == "anthropic": api_kwargs["system"] = study.system_prompt
+    if config.TEMPERATURE is not None: api_kwargs["temperature"] = config.TEMPERATURE
+
+    full_response_content = ""; message_interviewer = ""; detected_code = None; first_token_seconds = None
+    turn_started = time.perf_counter()
+    llm_span = profiling.start_span("llm call", model=turn_model, route=route_reason, stream=True)
+    text_deltas = reply_text_deltas(turn_api, api_kwargs)
+    try:
+        for text_delta in text_deltas:
+            lease_renewed_at = utils.renew_turn_lease(user_id, st.session_state.tab_id, lease_renewed_at)
+            if first_token_seconds is None: first_token_seconds = time.perf_counter() - turn_started; profiling.instant("first token")
+            full_response_content += text_delta; current_content_stripped = full_response_content.strip()
+            if current_content_stripped in study.closing_messages:
+                detected_code = current_content_stripped
+                message_interviewer = full_response_content.replace(detected_code, "").strip(); break
+            message_interviewer = full_response_content; message_placeholder.markdown(message_interviewer + "▌")
+    finally:
+        text_deltas.close() # Also when stopped early at a closing code: release the connection now
+    if not detected_code: message_placeholder.markdown(message_interviewer)
+    profiling.end_span(llm_span, chars=len(full_response_content))
+    return full_response_content, message_interviewer, detected_code, first_token_seconds, lease_renewed_at
 # --- End API Setup & Retry ---
 
 # --- Manual Interview Questions Setup ---
@@ -66,7 +149,8 @@ api_retry_decorator = retry(
 
 
 # --- Page Config ---
-st.set_page_config(page_title="Skills & AI Interview", page_icon=config.AVATAR_INTERVIEWER)
+st.set_page_config(page_title=study.title, page_icon=config.AVATAR_INTERVIEWER)
+bootstrap_span = profiling.start_span("bootstrap")
 
 # --- <<< Initialize Local Storage >>> ---
 localS = LocalStorage()
@@ -82,7 +166,7 @@ if "username" not in st.session_state: st.session_state.username = None
 # --- <<< START REVISED USERNAME LOGIC (v3) >>> ---
 # Try to get username from local storage FIRST
 if st.session_state.username is None:
-    storage_key = "skills_survey_username_uuid"
+    storage_key = study.username_storage_key
     username_from_storage = localS.getItem(storage_key)
     print(f"Raw value retrieved from local storage for key '{storage_key}': {username_from_storage}") # DEBUG Print raw value
 
@@ -110,6 +194,12 @@ if st.session_state.username is None:
 username = st.session_state.username
 # --- <<< END REVISED USERNAME LOGIC >>> ---
 
+# Returning participant: start reading the saved state and messages now, in parallel (initialization waits on them)
+if username and not st.session_state.session_initialized: utils.prefetch_resume_state(username)
+
+# Tabs of one browser share the username; each tab is its own session (used as the turn lease holder)
+if "tab_id" not in st.session_state: st.session_state.tab_id = uuid.uuid4().hex
+
 
 # --- Directory Creation (for local backups - wrapped) ---
 if username:
@@ -123,7 +213,7 @@ def initialize_session_state_with_firestore(user_id):
     if st.session_state.get("session_initialized", False): return
     print(f"Attempting to initialize session for user: {user_id}")
     default_values = {
-        "messages": [], "current_stage": WELCOME_STAGE, "consent_given": False,
+        "messages": message_store.MessageStore(), "current_stage": WELCOME_STAGE, "consent_given": False,
         "start_time": None, "start_time_file_names": None, "interview_active": False,
         "interview_completed_flag": False, "survey_completed_flag": False, "welcome_shown": False
     }
@@ -132,13 +222,12 @@ def initialize_session_state_with_firestore(user_id):
     print("Initialized session state with default values.")
 
     loaded_state, loaded_messages = utils.load_interview_state_from_firestore(user_id)
-    st.session_state.messages = loaded_messages
+    st.session_state.messages = message_store.MessageStore(loaded_messages)
 
     if api == "openai":
         if not st.session_state.messages or st.session_state.messages[0].get("role") != "system":
             print("System prompt missing after loading messages for OpenAI. Re-injecting.")
-            sys_prompt_dict = {"role": "system", "content": config.SYSTEM_PROMPT}
-            st.session_state.messages.insert(0, sys_prompt_dict)
+            st.session_state.messages.insert(0, study.system_message)
 
     if loaded_state:
         print(f"Overwriting defaults with state loaded from Firestore for user: {user_id}")
@@ -158,7 +247,7 @@ def initialize_session_state_with_firestore(user_id):
 
     elif not loaded_messages:
         print(f"No previous state or messages found for {user_id}. Initializing fresh session.")
-        if 'messages' not in st.session_state or not isinstance(st.session_state.messages, list): st.session_state.messages = []
+        if 'messages' not in st.session_state or not isinstance(st.session_state.messages, message_store.MessageStore): st.session_state.messages = message_store.MessageStore()
 
     st.session_state.session_initialized = True
     print(f"Session initialized. Stage: {st.session_state.get('current_stage')}, Msgs: {len(st.session_state.get('messages', []))}, StartTime: {st.session_state.get('start_time')}")
@@ -187,6 +276,76 @@ def determine_current_stage(user_id):
          utils.save_interview_state_to_firestore(username, {"current_stage": new_stage})
 
 
+# --- Turn Lease Helpers (one LLM call per user at a time, across tabs and replicas) ---
+def sync_messages_from_firestore(user_id):
+    """Replaces the local history with the stored one, e.g. after another tab completed a turn."""
+    latest = utils.load_messages_from_firestore(user_id)
+    if latest is None: return False
+    messages = message_store.MessageStore(latest)
+    if api == "openai": messages.insert(0, study.system_message)
+    st.session_state.messages = messages
+    return True
+
+def stored_message_count():
+    """Messages of this session's history that are stored in Firestore (the system prompt is not)."""
+    return sum(1 for m in st.session_state.messages if m.get("role") != "system")
+
+def release_turn(user_id):
+    utils.release_turn_lease(user_id, st.session_state.tab_id, stored_message_count())
+
+def claim_turn(user_id):
+    """Acquires the user's turn lease. Returns (acquired, synced): if another tab holds it, waits for that turn
+    to finish and syncs its result into this session first. After acquiring, the history is also synced when the
+    stored message count (recorded on the lease) differs from this session's, e.g. a stale tab whose turns were
+    continued in another tab."""
+    holder_id = st.session_state.tab_id
+    acquired, message_count = utils.acquire_turn_lease(user_id, holder_id)
+    if acquired:
+        if message_count == stored_message_count(): return True, False
+        print(f"Stored history of {user_id} differs from this tab's ({message_count} vs {stored_message_count()} messages). Syncing.")
+        return True, sync_messages_from_firestore(user_id)
+    print(f"Turn lease for {user_id} held by another tab. Waiting for it to finish.")
+    with st.spinner("Your previous response is still being processed in another window..."):
+        finished = utils.wait_for_turn_lease(user_id, holder_id)
+    synced = sync_messages_from_firestore(user_id)
+    if not finished: return False, synced
+    acquired, message_count = utils.acquire_turn_lease(user_id, holder_id)
+    if acquired and message_count != stored_message_count(): synced = sync_messages_from_firestore(user_id) or synced
+    return acquired, synced
+
+
+# --- Study Survey (bundle studies with their own survey schema, see studies.py) ---
+STUDY_SURVEY_WIDGET_PREFIX = "study_survey_" # Bundle question keys never reach session state unprefixed
+
+def render_study_survey(current_study):
+    """Renders the study's survey form. Returns the responses once submitted and valid, else None."""
+    with st.form("survey_form"):
+        answers = {}
+        for question in current_study.survey:
+            key, label, help_text = question["key"], question["label"], question.get("help")
+            widget_key = f"{STUDY_SURVEY_WIDGET_PREFIX}{key}"
+            if question["type"] == "select":
+                answers[key] = st.selectbox(label, [studies.SELECT_PLACEHOLDER] + question["options"], key=widget_key, help=help_text)
+            elif question["type"] == "slider":
+                answers[key] = st.slider(label, min_value=question.get("min", 0), max_value=question.get("max", 100),
+                                         value=question.get("default", 50), key=widget_key, help=help_text)
+            else:
+                answers[key] = st.text_input(label, key=widget_key, help=help_text).strip()
+        submitted = st.form_submit_button("Submit Survey Responses")
+    if not submitted: return None
+    if any(answers[q["key"]] == studies.SELECT_PLACEHOLDER for q in current_study.survey if q["type"] == "select" and q.get("required", True)):
+        st.warning("Please answer all dropdown questions."); return None
+    return answers
+
+
+# --- Chat History Window (a long resumed interview renders only its latest messages) ---
+HISTORY_WINDOW_KEY = "history_window"
+
+def show_earlier_messages():
+    """Button callback: widens the history window before the rerun renders it."""
+    st.session_state[HISTORY_WINDOW_KEY] = st.session_state.get(HISTORY_WINDOW_KEY, config.HISTORY_WINDOW_MESSAGES) + config.HISTORY_WINDOW_MESSAGES
+
+
 # --- Initialize Session State ---
 if username is None:
     st.error("Username could not be determined. Please refresh.")
@@ -199,16 +358,26 @@ if not st.session_state.get("session_initialized", False):
 
 
 # --- === Main Application Logic === ---
+profiling.end_span(bootstrap_span)
 
 if not st.session_state.get("session_initialized", False):
     st.spinner("Initializing session...")
     st.stop() # Prevent rendering further until initialized
 
+stage_span = profiling.start_span("stage dispatch", stage=st.session_state.get("current_stage"))
+
 
 # --- Section 0: Welcome Stage ---
 if st.session_state.get("current_stage") == WELCOME_STAGE:
     st.title("Welcome")
-    st.markdown(f"""
+    if not study.is_default: # Bundle studies bring their own welcome text and consent form (studies.py)
+        st.markdown(study.welcome_markdown.replace("{username}", username))
+        st.markdown("---")
+        st.subheader("Information Sheet & Consent Form")
+        st.markdown(study.consent_markdown.replace("{username}", username))
+        consent_label = study.consent_label
+    else:
+        st.markdown(f"""
     Hi there, thanks for your interest in this research project!
 
     My name is Janik, and I'm a PhD Candidate at UPF. For my research, I'm exploring how university students like you think about valuable skills for the future, the role of Artificial Intelligence (AI), and how these views connect to educational choices.
@@ -217,10 +386,10 @@ if st.session_state.get("current_stage") == WELCOME_STAGE:
 
     Before we begin, please carefully read the **Information Sheet & Consent Form** below.
     """)
-    st.markdown("---")
-    st.subheader("Information Sheet & Consent Form")
-    # --- Consent Form Content (UPDATED NIS explanation) ---
-    st.markdown(f"""
+        st.markdown("---")
+        st.subheader("Information Sheet & Consent Form")
+        # --- Consent Form Content (UPDATED NIS explanation) ---
+        st.markdown(f"""
 **Study Title:** Student Perspectives on Skills, Careers, and Artificial Intelligence \n
 **Researcher:** Janik Deutscher (janik.deutscher@upf.edu), PhD Candidate, Universitat Pompeu Fabra
 
@@ -270,8 +439,9 @@ if st.session_state.get("current_stage") == WELCOME_STAGE:
     *   **Legal Basis:** Your explicit consent. You can withdraw consent at any time (though data withdrawal post-submission may be limited as explained above). The processing of NIS is based on your explicit consent to provide it.
     *   **Your Rights:** You have the right to access your data; request rectification, deletion, or portability (in certain cases); object to processing; or request limitation. Procedures are described at www.upf.edu/web/proteccio-dades/drets. Contact the DPO (dpd@upf.edu) for queries. If unsatisfied, you may contact the Catalan Data Protection Authority (apdcat.gencat.cat).
     """)
-    # --- End Consent Form Content ---
-    consent = st.checkbox("I confirm that I have read and understood the information sheet above, including the information about how the AI interview works, data logging, and the optional collection of the Student Number (NIS). I am 18 years or older, and I voluntarily consent to participate in this study.", key="consent_checkbox", value=st.session_state.get("consent_given", False))
+        # --- End Consent Form Content ---
+        consent_label = "I confirm that I have read and understood the information sheet above, including the information about how the AI interview works, data logging, and the optional collection of the Student Number (NIS). I am 18 years or older, and I voluntarily consent to participate in this study."
+    consent = st.checkbox(consent_label, key="consent_checkbox", value=st.session_state.get("consent_given", False))
     if consent != st.session_state.get("consent_given", False):
         st.session_state.consent_given = consent
         utils.save_interview_state_to_firestore(username, {'consent_given': consent})
@@ -300,24 +470,31 @@ elif st.session_state.get("current_stage") == INTERVIEW_STAGE:
         utils.save_interview_state_to_firestore(username, {"interview_active": False, "interview_completed_flag": True, "current_stage": SURVEY_STAGE})
         st.warning(quit_message); st.session_state.current_stage = SURVEY_STAGE; print("Moving to Survey Stage after Quit."); time.sleep(1); st.rerun()
 
-    # --- Display Chat History (No Changes) ---
-    for message in st.session_state.get("messages", []):
-        if message.get('role') == "system": continue;
-        if message.get('content', '') in config.CLOSING_MESSAGES.keys(): continue
-        is_closing_message_display = any(message.get('content', '') == display_text for code, display_text in config.CLOSING_MESSAGES.items())
-        if is_closing_message_display: continue
-        avatar = config.AVATAR_INTERVIEWER if message.get('role') == "assistant" else config.AVATAR_RESPONDENT
-        with st.chat_message(message.get('role', 'unknown'), avatar=avatar): st.markdown(message.get('content', ''))
+    # --- Display Chat History (latest messages only; earlier ones on request) ---
+    history = st.session_state.get("messages", [])
+    with profiling.span("history render", messages=len(history)):
+        window = st.session_state.get(HISTORY_WINDOW_KEY, config.HISTORY_WINDOW_MESSAGES)
+        first_shown, has_earlier = message_store.display_window(history, window, study.closing_messages)
+        if has_earlier: st.button("Show earlier messages", key="show_earlier_btn", on_click=show_earlier_messages)
+        for message in history[first_shown:]:
+            if not message_store.is_displayable(message, study.closing_messages): continue
+            avatar = config.AVATAR_INTERVIEWER if message.get('role') == "assistant" else config.AVATAR_RESPONDENT
+            with st.chat_message(message.get('role', 'unknown'), avatar=avatar): st.markdown(message.get('content', ''))
 
     # --- Initial Assistant Message Logic (No Manual Fallback) ---
     if not st.session_state.get("messages", []) or \
        (api == "openai" and len(st.session_state.get("messages", [])) == 1 and st.session_state.get("messages", [])[0].get("role") == "system"):
         print("No previous assistant/user messages found, attempting to get initial message.")
+        turn_claimed, synced = claim_turn(username)
+        if synced and any(m.get("role") == "assistant" for m in st.session_state.messages):
+            if turn_claimed: release_turn(username)
+            print("Opening message was obtained by another tab. Showing it."); st.rerun()
+        if not turn_claimed:
+            st.warning(TURN_LEASE_BUSY_MESSAGE); st.stop()
         try:
             if api == "openai":
                  if not st.session_state.messages or st.session_state.messages[0].get("role") != "system":
-                     sys_prompt_dict = {"role": "system", "content": config.SYSTEM_PROMPT}
-                     st.session_state.messages.insert(0, sys_prompt_dict)
+                     st.session_state.messages.insert(0, study.system_message)
                      utils.save_interview_state_to_firestore(username, {})
 
             with st.chat_message("assistant", avatar=config.AVATAR_INTERVIEWER):
@@ -325,26 +502,16 @@ elif st.session_state.get("current_stage") == INTERVIEW_STAGE:
                 api_messages = []; message_interviewer = ""
                 if api == "openai":
                     if st.session_state.messages and st.session_state.messages[0].get("role") == 'system':
-                         api_messages = [st.session_state.messages[0]]
+                         api_messages = [st.session_state.messages[0].to_dict()]
                 elif api == "anthropic":
                     api_messages = [{"role": "user", "content": "Please begin the interview."}]
 
-                api_kwargs = { "model": config.MODEL, "messages": api_messages, "max_tokens": config.MAX_OUTPUT_TOKENS, "stream": False }
-                if api == "anthropic": api_kwargs["system"] = config.SYSTEM_PROMPT
-                if config.TEMPERATURE is not None: api_kwargs["temperature"] = config.TEMPERATURE
-
                 try:
-                    print("Attempting initial API call with retry...")
-                    @api_retry_decorator
-                    def get_initial_completion():
-                        if api == "openai": return openai_client.chat.completions.create(**api_kwargs)
-                        elif api == "anthropic": return anthropic_client.messages.create(**api_kwargs)
-                        return None
-                    response = get_initial_completion()
-                    if api == "openai": message_interviewer = response.choices[0].message.content
-                    elif api == "anthropic": message_interviewer = response.content[0].text
-                    print("Initial API call success after retry logic.")
-                    message_placeholder.markdown(message_interviewer)
+                    turn_started = time.perf_counter()
+                    message_interviewer, _, _, first_token_seconds, _ = stream_interviewer_reply(
+                        username, study.model, api_messages, message_placeholder, time.time(), "opening")
+                    turn_seconds = time.perf_counter() - turn_started
+                    print(f"Opening message for {username}: model={study.model}, first token {first_token_seconds or 0:.2f}s, total {turn_seconds:.2f}s")
 
                 except RETRYABLE_ERRORS as e_retry:
                      print(f"Initial API call failed after retries: {e_retry}")
@@ -359,16 +526,29 @@ elif st.session_state.get("current_stage") == INTERVIEW_STAGE:
 
             assistant_msg_dict = {"role": "assistant", "content": message_interviewer.strip()}
             st.session_state.messages.append(assistant_msg_dict)
-            utils.save_message_to_firestore(username, assistant_msg_dict)
+            utils.save_message_to_firestore(username, {**assistant_msg_dict, "model": study.model, "route_reason": "opening",
+                                                       "first_token_seconds": round(first_token_seconds, 3) if first_token_seconds is not None else None,
+                                                       "latency_seconds": round(turn_seconds, 3)})
             print("Initial message obtained and saved."); time.sleep(0.1); st.rerun()
 
         except Exception as e:
             if 'message_placeholder' in locals(): message_placeholder.empty()
             st.error(f"Failed during initial message setup: {e}. Please refresh and try again.");
             st.stop()
+        finally:
+            release_turn(username) # Also runs on st.rerun()/st.stop()
 
     # --- Chat Input & Response Logic (No Manual Fallback) ---
     if prompt := st.chat_input("Your response..."):
+        turn_claimed, synced = claim_turn(username)
+        if synced and len(st.session_state.messages) >= 2 and st.session_state.messages[-1].get("role") == "assistant" \
+           and st.session_state.messages[-2] == {"role": "user", "content": prompt}:
+            # The same answer was already sent from another tab: attach to that result instead of a second LLM call
+            if turn_claimed: release_turn(username)
+            print("Turn already answered via another tab. Showing that result."); st.rerun()
+        if not turn_claimed:
+            st.warning(TURN_LEASE_BUSY_MESSAGE); st.stop()
+        lease_renewed_at = time.time()
         user_msg_dict = {"role": "user", "content": prompt}
         st.session_state.messages.append(user_msg_dict); utils.save_message_to_firestore(username, user_msg_dict)
         with st.chat_message("user", avatar=config.AVATAR_RESPONDENT): st.markdown(prompt)
@@ -376,55 +556,33 @@ elif st.session_state.get("current_stage") == INTERVIEW_STAGE:
         try:
             with st.chat_message("assistant", avatar=config.AVATAR_INTERVIEWER):
                  message_placeholder = st.empty(); message_placeholder.markdown("Thinking...")
-                 message_interviewer = ""; full_response_content = ""; stream_closed = False; detected_code = None
-
-                 if api == "openai": api_messages_for_call = st.session_state.messages
-                 elif api == "anthropic": api_messages_for_call = [m for m in st.session_state.messages if m.get("role") != "system"]
-
-                 api_kwargs = { "model": config.MODEL, "messages": api_messages_for_call, "max_tokens": config.MAX_OUTPUT_TOKENS, "stream": True }
-                 if api == "anthropic": api_kwargs["system"] = config.SYSTEM_PROMPT
-                 if config.TEMPERATURE is not None: api_kwargs["temperature"] = config.TEMPERATURE
+                 turn_model, route_reason = routing.choose_model(st.session_state.messages, study)
+                 turn_api = routing.provider_for_model(turn_model)
+                 api_messages_for_call = st.session_state.messages.for_api(turn_api, study.system_message)
 
                  try:
-                    if api == "openai":
-                        stream = openai_client.chat.completions.create(**api_kwargs)
-                        for chunk in stream:
-                             if chunk.choices and len(chunk.choices) > 0:
-                                 delta = chunk.choices[0].delta
-                                 if delta and delta.content:
-                                     text_delta = delta.content; full_response_content += text_delta; current_content_stripped = full_response_content.strip()
-                                     for code in config.CLOSING_MESSAGES.keys():
-                                         if code == current_content_stripped:
-                                             detected_code = code
-                                             message_interviewer = full_response_content.replace(code, "").strip(); stream_closed = True; break
-                                     if stream_closed: break
-                                     message_interviewer = full_response_content; message_placeholder.markdown(message_interviewer + "▌")
-                        if not stream_closed: message_placeholder.markdown(message_interviewer)
-
-                    elif api == "anthropic":
-                         with anthropic_client.messages.stream(**api_kwargs) as stream:
-                            for text_delta in stream.text_stream:
-                                 if text_delta is not None:
-                                     full_response_content += text_delta; current_content_stripped = full_response_content.strip()
-                                     for code in config.CLOSING_MESSAGES.keys():
-                                         if code == current_content_stripped:
-                                             detected_code = code
-                                             message_interviewer = full_response_content.replace(code,"").strip(); stream_closed = True; break
-                                     if stream_closed: break
-                                     message_interviewer = full_response_content; message_placeholder.markdown(message_interviewer + "▌")
-                         if not stream_closed: message_placeholder.markdown(message_interviewer)
+                    turn_started = time.perf_counter()
+                    full_response_content, message_interviewer, detected_code, first_token_seconds, lease_renewed_at = stream_interviewer_reply(
+                        username, turn_model, api_messages_for_call, message_placeholder, lease_renewed_at, route_reason)
 
                     assistant_msg_content = full_response_content.strip()
                     assistant_msg_dict = {"role": "assistant", "content": assistant_msg_content}
+                    turn_seconds = time.perf_counter() - turn_started
+                    print(f"Turn for {username}: model={turn_model} ({route_reason}), first token {first_token_seconds or 0:.2f}s, total {turn_seconds:.2f}s")
+                    # Routing decision and latency are kept on the stored message only (the session history holds role/content)
+                    turn_record = {**assistant_msg_dict, "model": turn_model, "route_reason": route_reason,
+                                   "first_token_seconds": round(first_token_seconds, 3) if first_token_seconds is not None else None,
+                                   "latency_seconds": round(turn_seconds, 3)}
 
                     if not detected_code or message_interviewer:
                         if not st.session_state.messages or st.session_state.messages[-1] != assistant_msg_dict:
                            st.session_state.messages.append(assistant_msg_dict)
-                           utils.save_message_to_firestore(username, assistant_msg_dict)
+                           utils.save_message_to_firestore(username, turn_record)
+                           utils.log_session_memory(username)
 
                     if detected_code:
                         st.session_state.interview_active = False; st.session_state.interview_completed_flag = True
-                        closing_message_display = config.CLOSING_MESSAGES[detected_code]
+                        closing_message_display = study.closing_messages[detected_code]
 
                         if message_interviewer: message_placeholder.markdown(message_interviewer)
                         else: message_placeholder.empty()
@@ -451,6 +609,8 @@ elif st.session_state.get("current_stage") == INTERVIEW_STAGE:
             st.error(f"An error occurred processing the chat response: {e}. Your progress is saved. Please try refreshing the page. If the problem persists, contact the researcher.")
             utils.save_interview_data(username=username, transcripts_directory=config.TRANSCRIPTS_DIRECTORY, times_directory=config.TIMES_DIRECTORY, is_final_save=False, messages_to_format=st.session_state.messages)
             st.stop()
+        finally:
+            release_turn(username) # Also runs on st.rerun()/st.stop()
 
 
 # --- Section 1.5: Manual Interview Fallback Stage ---
@@ -462,109 +622,114 @@ elif st.session_state.get("current_stage") == SURVEY_STAGE:
     st.title("Part 2: Survey")
     st.info(f"Thank you, please answer a few final questions.")
 
-    # --- Transcript Check Logic ---
-    if "current_formatted_transcript_for_gsheet" not in st.session_state:
-         print("WARNING: Formatted transcript key missing at survey stage entry. Attempting generation.")
+    # --- Transcript Check Logic (the transcript itself is formatted from the messages when saving) ---
+    if not st.session_state.get("transcript_final", False):
+         print("WARNING: Transcript not marked final at survey stage entry. Finalizing now.")
          utils.save_interview_data(username=username, transcripts_directory=config.TRANSCRIPTS_DIRECTORY, times_directory=config.TIMES_DIRECTORY, is_final_save=True, messages_to_format=st.session_state.get("messages", []))
-         if "current_formatted_transcript_for_gsheet" not in st.session_state:
+         if not st.session_state.get("transcript_final", False):
               st.error("Error: Could not generate the interview transcript for saving.")
-              st.session_state.current_formatted_transcript_for_gsheet = "ERROR: Transcript generation failed before survey."
               print("CRITICAL ERROR: Transcript generation failed before survey.")
 
-    # --- Survey Options ---
-    age_options = ["Select...", "Under 18"] + [str(i) for i in range(18, 36)] + ["Older than 35"]
-    gender_options = ["Select...", "Male", "Female", "Non-binary", "Prefer not to say"]
-    major_options = [
-        "Select...",
-        "Business Management and Administration",
-        "Economics",
-        "Business Sciences - Management",
-        "International Business Economics",
-        "Double Degree in Law-ECO/ADE",
-        "Industrial Technologies and Economic Analysis",
-        "Other"
-    ]
-    year_options = [
-        "Select...",
-        "First Year",
-        "Second Year",
-        "Third Year",
-        "Fourth Year",
-        "Fifth Year",
-        "Other/Not Applicable"
-    ]
-    gpa_values = np.round(np.arange(5.0, 10.01, 0.1), 1)
-    gpa_options = ["Select...", "Below 5.0"] + [f"{gpa:.1f}" for gpa in gpa_values] + ["Prefer not to say / Not applicable"]
-
-    with st.form("survey_form"):
-        st.subheader("Demographic Information")
-        age = st.selectbox("What is your age?", age_options, key="age")
-        gender = st.selectbox("What is your gender?", gender_options, key="gender")
-        major = st.selectbox("What is your main field of study (or double degree)?", major_options, key="major")
-        year_of_study = st.selectbox("What year of study are you currently in?", year_options, key="year")
-        gpa = st.selectbox("What is your approximate GPA or academic average (on a scale of 10)?", gpa_options, key="gpa")
-
-        # --- UPDATED NIS Field Help Text ---
-        student_nis_input = st.text_input("Student number (NIS)", key="student_nis", help="Providing your NIS is optional.")
-
-        st.subheader("University Experience")
-        learning_enjoyment_value = st.slider(
-            "From 0 to 100, how much do you enjoy learning just for the sake of it?",
-            min_value=0,
-            max_value=100,
-            value=50,
-            key="learning_enjoyment_slider",
-            help="0 = Not at all, 100 = Very much"
-        )
-        university_enjoyment_value = st.slider(
-            "From 0 to 100, how much are you enjoying your experience at university?",
-            min_value=0,
-            max_value=100,
-            value=50,
-            key="university_enjoyment_slider",
-            help="Considering everything (academics, social life, etc.). 0 = Not at all, 100 = Very much"
-        )
-
-        st.subheader("AI Usage")
-        ai_usage_percentage_value = st.slider(
-            "How much are you using AI for your university work?",
-            min_value=0,
-            max_value=100,
-            value=50,
-            key="ai_usage_slider",
-            help="Estimate the percentage of your university tasks where you utilize AI tools. 0 = Not at all, 100 = For almost all tasks."
-        )
-        ai_model = st.text_input("Which AI model are you mostly using?", key="ai_model")
-
-        submitted = st.form_submit_button("Submit Survey Responses")
-
-    if submitted:
-        # Validation
-        if (age == "Select..." or gender == "Select..." or major == "Select..." or year_of_study == "Select..." or gpa == "Select..."):
-            st.warning("Please answer all dropdown questions.")
-        else:
-            # --- Capture all responses ---
-            survey_responses = {
-                "age": age,
-                "gender": gender,
-                "major": major,
-                "year": year_of_study,
-                "gpa": gpa,
-                "student_nis": student_nis_input.strip(),
-                "learning_enjoyment": learning_enjoyment_value,
-                "university_enjoyment": university_enjoyment_value,
-                "ai_usage_percentage": ai_usage_percentage_value,
-                "ai_model": ai_model
-            }
-            # --- Pass to saving functions ---
-            save_successful = utils.save_survey_data(username, survey_responses)
-
-            if save_successful:
-                st.session_state.survey_completed_flag = True; st.session_state.current_stage = COMPLETED_STAGE
-                utils.save_interview_state_to_firestore(username, {"current_stage": COMPLETED_STAGE, "survey_completed_flag": True})
-                st.success("Survey submitted! Thank you."); st.balloons(); time.sleep(3); st.rerun()
+    survey_responses = None
+    if study.survey is not None:
+        survey_responses = render_study_survey(study)
+    else:
+        # --- Survey Options ---
+        age_options = ["Select...", "Under 18"] + [str(i) for i in range(18, 36)] + ["Older than 35"]
+        gender_options = ["Select...", "Male", "Female", "Non-binary", "Prefer not to say"]
+        major_options = [
+            "Select...",
+            "Business Management and Administration",
+            "Economics",
+            "Business Sciences - Management",
+            "International Business Economics",
+            "Double Degree in Law-ECO/ADE",
+            "Industrial Technologies and Economic Analysis",
+            "Other"
+        ]
+        year_options = [
+            "Select...",
+            "First Year",
+            "Second Year",
+            "Third Year",
+            "Fourth Year",
+            "Fifth Year",
+            "Other/Not Applicable"
+        ]
+        gpa_values = np.round(np.arange(5.0, 10.01, 0.1), 1)
+        gpa_options = ["Select...", "Below 5.0"] + [f"{gpa:.1f}" for gpa in gpa_values] + ["Prefer not to say / Not applicable"]
+
+        with st.form("survey_form"):
+            st.subheader("Demographic Information")
+            age = st.selectbox("What is your age?", age_options, key="age")
+            gender = st.selectbox("What is your gender?", gender_options, key="gender")
+            major = st.selectbox("What is your main field of study (or double degree)?", major_options, key="major")
+            year_of_study = st.selectbox("What year of study are you currently in?", year_options, key="year")
+            gpa = st.selectbox("What is your approximate GPA or academic average (on a scale of 10)?", gpa_options, key="gpa")
+
+            # --- UPDATED NIS Field Help Text ---
+            student_nis_input = st.text_input("Student number (NIS)", key="student_nis", help="Providing your NIS is optional.")
+
+            st.subheader("University Experience")
+            learning_enjoyment_value = st.slider(
+                "From 0 to 100, how much do you enjoy learning just for the sake of it?",
+                min_value=0,
+                max_value=100,
+                value=50,
+                key="learning_enjoyment_slider",
+                help="0 = Not at all, 100 = Very much"
+            )
+            university_enjoyment_value = st.slider(
+                "From 0 to 100, how much are you enjoying your experience at university?",
+                min_value=0,
+                max_value=100,
+                value=50,
+                key="university_enjoyment_slider",
+                help="Considering everything (academics, social life, etc.). 0 = Not at all, 100 = Very much"
+            )
+
+            st.subheader("AI Usage")
+            ai_usage_percentage_value = st.slider(
+                "How much are you using AI for your university work?",
+                min_value=0,
+                max_value=100,
+                value=50,
+                key="ai_usage_slider",
+                help="Estimate the percentage of your university tasks where you utilize AI tools. 0 = Not at all, 100 = For almost all tasks."
+            )
+            ai_model = st.text_input("Which AI model are you mostly using?", key="ai_model")
+
+            submitted = st.form_submit_button("Submit Survey Responses")
+
+        if submitted:
+            # Validation
+            if (age == "Select..." or gender == "Select..." or major == "Select..." or year_of_study == "Select..." or gpa == "Select..."):
+                st.warning("Please answer all dropdown questions.")
             else:
-                st.warning("Could not save survey results to primary storage (Google Sheets). Your responses may have been saved to our backup system. Please contact the researcher.")
+                # --- Capture all responses ---
+                survey_responses = {
+                    "age": age,
+                    "gender": gender,
+                    "major": major,
+                    "year": year_of_study,
+                    "gpa": gpa,
+                    "student_nis": student_nis_input.strip(),
+                    "learning_enjoyment": learning_enjoyment_value,
+                    "university_enjoyment": university_enjoyment_value,
+                    "ai_usage_percentage": ai_usage_percentage_value,
+                    "ai_model": ai_model
+                }
+
+    if survey_responses is not None:
+        # --- Pass to saving functions ---
+        save_successful = utils.save_survey_data(username, survey_responses)
+
+        if save_successful:
+            st.session_state.survey_completed_flag = True; st.session_state.current_stage = COMPLETED_STAGE
+            utils.save_interview_state_to_firestore(username, {"current_stage": COMPLETED_STAGE, "survey_completed_flag": True})
+            st.success("Survey submitted! Thank you."); st.balloons(); time.sleep(3); st.rerun()
+        else:
+            st.warning("Could not save survey results to primary storage (Google Sheets). Your responses may have been saved to our backup system. Please contact the researcher.")
 
 
 # --- Section 3: Completed Stage ---
@@ -585,4 +750,6 @@ else:
     time.sleep(1.0)
     if username and st.session_state.get("session_initialized"):
         determine_current_stage(username)
-    st.rerun()
\ No newline at end of file
+    st.rerun()
+
+profiling.end_run() # Runs cut short by st.stop()/st.rerun() are closed when the session's next run begins
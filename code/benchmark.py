@@ -0,0 +1,97 @@
+# benchmark.py
+# Reproducible end-to-end benchmark: replays recorded LLM cassettes (cassettes.py) through the load-test harness
+# (loadtest.py), so turn latency and CPU per session can be compared commit by commit without network access.
+#
+# 1. Record:  LLM_CASSETTE_MODE=record streamlit run app.py   (or: LLM_CASSETTE_MODE=record python loadtest.py ...)
+# 2. Replay:  python benchmark.py --cassettes data/cassettes --speed 10 --respondents 50
+#
+# Results are appended to data/benchmarks/results.jsonl, one line per run, tagged with the current git commit.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cassettes
+import loadtest
+
+DEFAULT_RESULTS_PATH = os.path.join("data", "benchmarks", "results.jsonl")
+COMPARED_METRICS = ["turn_latency_seconds.p50", "turn_latency_seconds.p95", "cpu_seconds_per_session", "rss_bytes_per_session"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=loadtest.CODE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def metric(report, dotted):
+    value = report
+    for part in dotted.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def load_baseline(path, commit=None):
+    """Last result in the results file (optionally: last one for a given commit)."""
+    if not os.path.exists(path): return None
+    baseline = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip(): continue
+            entry = json.loads(line)
+            if commit is None or entry.get("commit") == commit:
+                baseline = entry
+    return baseline
+
+
+def print_comparison(current, baseline):
+    print(f"\n=== Compared with {baseline.get('commit')} ({baseline.get('timestamp')}) ===")
+    for name in COMPARED_METRICS:
+        new, old = metric(current["report"], name), metric(baseline["report"], name)
+        if new is None or old is None:
+            print(f"{name:32s} n/a"); continue
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"{name:32s} {old:12.4f} -> {new:12.4f}  ({change:+.1f}%)")
+
+
+def main():
+    parser = loadtest.build_arg_parser()
+    parser.description = "Replay recorded LLM cassettes through the load-test harness and record the results."
+    parser.add_argument("--cassettes", default=cassettes.DEFAULT_CASSETTE_DIR, help="Cassette directory to replay.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed: 1 = recorded timing, 0 = instant.")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="JSONL file the result is appended to.")
+    parser.add_argument("--compare-to", default=None, help="Commit to compare against (default: previous run).")
+    args = parser.parse_args()
+
+    cassette_dir = os.path.abspath(args.cassettes)
+    journeys = cassettes.recorded_journeys(cassette_dir)
+    if not journeys:
+        print(f"No recorded conversations found in {cassette_dir}."); sys.exit(1)
+
+    os.environ[cassettes.CASSETTE_MODE_ENV] = "replay"
+    os.environ[cassettes.CASSETTE_DIR_ENV] = cassette_dir
+    os.environ[cassettes.CASSETTE_SPEED_ENV] = str(args.speed)
+    print(f"Replaying {len(journeys)} recorded journey(s) from {cassette_dir} at speed {args.speed}")
+
+    report = loadtest.run_load_test(args, journeys=journeys)
+    loadtest.print_report(report)
+
+    baseline = load_baseline(args.results, args.compare_to)
+    entry = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+             "speed": args.speed, "journeys": len(journeys), "respondents": args.respondents,
+             "concurrency": args.concurrency, "processes": args.processes, "report": report}
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    print(f"Result appended to {args.results}")
+    if baseline: print_comparison(entry, baseline)
+    if report["completed"] < report["respondents"]:
+        sys.exit(1)  # Replays are deterministic: an incomplete journey means the app changed behaviour
+
+
+if __name__ == "__main__":
+    main()
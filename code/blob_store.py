@@ -0,0 +1,143 @@
+# blob_store.py
+# Content-addressed, compressed storage for interview transcripts. With a store configured, the results sheet row
+# carries a reference ("blob:sha256:<hex>") in its first transcript column instead of the transcript cut into
+# 40,000-character cells, so transcripts of any length are kept whole and sheet rows stay small.
+#
+# The reference is the SHA-256 of the transcript's UTF-8 text: it finds the blob in any store holding it (blobs can
+# be copied between stores) and verifies the content on read. Blobs are zlib-compressed; identical transcripts are
+# stored once.
+#
+# Stores (config.TRANSCRIPT_BLOB_STORE; analytics.py and search_index.py also take --blob-store):
+#   local:<directory>          files <directory>/<hex[:2]>/<hex>.zz (tests, single host; ephemeral on Streamlit Cloud)
+#   gs://<bucket>[/<prefix>]   Google Cloud Storage objects <prefix>/<hex[:2]>/<hex>.zz (needs google-cloud-storage)
+import hashlib
+import os
+import threading
+import zlib
+
+import config
+
+REFERENCE_PREFIX = "blob:sha256:"
+COMPRESSION_LEVEL = 6
+
+
+class BlobStoreError(Exception):
+    """A blob is missing or corrupt, or the store is misconfigured."""
+
+
+def is_reference(value):
+    return isinstance(value, str) and value.startswith(REFERENCE_PREFIX)
+
+
+def _key(hex_digest):
+    return f"{hex_digest[:2]}/{hex_digest}.zz"
+
+
+# --- Stores ---
+class LocalBlobStore:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, hex_digest):
+        return os.path.join(self.directory, *_key(hex_digest).split("/"))
+
+    def write(self, hex_digest, compressed):
+        """Stores a blob unless it exists already (same digest, same content)."""
+        path = self._path(hex_digest)
+        if os.path.exists(path): return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f: f.write(compressed)
+        os.replace(tmp_path, path) # Atomic: readers never see a partial blob
+
+    def read(self, hex_digest):
+        try:
+            with open(self._path(hex_digest), "rb") as f: return f.read()
+        except FileNotFoundError:
+            raise BlobStoreError(f"Blob {hex_digest[:12]} not found in {self.directory}.") from None
+
+
+class GCSBlobStore:
+    def __init__(self, bucket_name, prefix="", credentials_info=None):
+        try:
+            from google.cloud import storage
+        except ImportError:
+            raise BlobStoreError("gs:// blob stores need the google-cloud-storage package.") from None
+        if credentials_info:
+            from google.oauth2 import service_account
+            credentials = service_account.Credentials.from_service_account_info(credentials_info)
+            client = storage.Client(credentials=credentials, project=credentials.project_id)
+        else:
+            client = storage.Client() # Application default credentials (e.g. offline analysis)
+        self._bucket = client.bucket(bucket_name)
+        self._prefix = prefix.strip("/")
+
+    def _blob(self, hex_digest):
+        return self._bucket.blob(f"{self._prefix}/{_key(hex_digest)}" if self._prefix else _key(hex_digest))
+
+    def write(self, hex_digest, compressed):
+        from google.api_core.exceptions import PreconditionFailed
+        try: # Create-only in one request: an existing object already holds this content
+            self._blob(hex_digest).upload_from_string(compressed, content_type="application/zlib", if_generation_match=0)
+        except PreconditionFailed:
+            pass
+
+    def read(self, hex_digest):
+        from google.api_core.exceptions import NotFound
+        try:
+            return self._blob(hex_digest).download_as_bytes()
+        except NotFound:
+            raise BlobStoreError(f"Blob {hex_digest[:12]} not found in gs://{self._bucket.name}/{self._prefix}.") from None
+
+
+def open_store(spec, credentials_info=None):
+    """Opens a store from its spec ('local:<directory>' or 'gs://<bucket>[/<prefix>]')."""
+    if spec.startswith("local:"): return LocalBlobStore(spec[len("local:"):])
+    if spec.startswith("gs://"):
+        bucket_name, _, prefix = spec[len("gs://"):].partition("/")
+        return GCSBlobStore(bucket_name, prefix, credentials_info)
+    raise BlobStoreError(f"Unknown blob store {spec!r}: use local:<directory> or gs://<bucket>[/<prefix>].")
+
+
+# --- Text Blobs ---
+def put_text(store, text):
+    """Stores text (once per distinct content). Returns its reference."""
+    data = text.encode("utf-8")
+    hex_digest = hashlib.sha256(data).hexdigest()
+    store.write(hex_digest, zlib.compress(data, COMPRESSION_LEVEL))
+    return REFERENCE_PREFIX + hex_digest
+
+
+def get_text(store, reference):
+    """The text behind a reference, checked against its digest. Raises BlobStoreError."""
+    if not is_reference(reference): raise BlobStoreError(f"Not a blob reference: {reference[:40]!r}")
+    hex_digest = reference[len(REFERENCE_PREFIX):]
+    try:
+        data = zlib.decompress(store.read(hex_digest))
+    except zlib.error as e:
+        raise BlobStoreError(f"Blob {hex_digest[:12]} is corrupt: {e}") from None
+    if hashlib.sha256(data).hexdigest() != hex_digest: raise BlobStoreError(f"Blob {hex_digest[:12]} does not match its digest.")
+    return data.decode("utf-8")
+
+
+# --- Default Store (offline readers) ---
+_default_lock = threading.Lock()
+_default_spec = None
+_default_store = None
+
+
+def configure(spec):
+    """Overrides config.TRANSCRIPT_BLOB_STORE for default_store() in this process (e.g. from --blob-store)."""
+    global _default_spec, _default_store
+    with _default_lock:
+        _default_spec, _default_store = spec, None
+
+
+def default_store():
+    """The configured store, opened once per process with application default credentials; None if none is set."""
+    global _default_store
+    with _default_lock:
+        spec = _default_spec or config.TRANSCRIPT_BLOB_STORE
+        if not spec: return None
+        if _default_store is None: _default_store = open_store(spec)
+        return _default_store
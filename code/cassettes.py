@@ -0,0 +1,279 @@
+# cassettes.py
+# Record/replay layer beneath the LLM provider clients used in app.py.
+#
+#   LLM_CASSETTE_MODE=record  -> calls go to the provider as usual; every request/response (with chunk timing) is saved
+#   LLM_CASSETTE_MODE=replay  -> no network: responses are served from saved cassettes, with the original timing
+#                                scaled by LLM_CASSETTE_SPEED (1 = original, 10 = ten times faster, 0 = instant)
+#   unset / "off"             -> wrap_client() returns the client untouched
+#
+# Cassettes are keyed by the conversation sent (system prompt + messages), not by user or model, so replayed journeys
+# hit as long as the respondent answers are the same (see benchmark.py).
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+CASSETTE_MODE_ENV = "LLM_CASSETTE_MODE"
+CASSETTE_DIR_ENV = "LLM_CASSETTE_DIR"
+CASSETTE_SPEED_ENV = "LLM_CASSETTE_SPEED"
+DEFAULT_CASSETTE_DIR = os.path.join("data", "cassettes")
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when no cassette matches the request."""
+
+
+def cassette_mode():
+    mode = os.environ.get(CASSETTE_MODE_ENV, "off").strip().lower()
+    return mode if mode in ("record", "replay") else "off"
+
+
+def request_key(messages, system=None):
+    """Stable key for a request: hash of the conversation content only."""
+    payload = {"system": system, "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages]}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# --- Storage ---
+class CassetteStore:
+    """One JSON file per recorded interaction, named by request key."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def save(self, cassette):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(cassette["key"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cassette, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._cache[cassette["key"]] = cassette
+
+    def load(self, key):
+        with self._lock:
+            if key in self._cache: return self._cache[key]
+        try:
+            with open(self.path_for(key), encoding="utf-8") as f:
+                cassette = json.load(f)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._cache[key] = cassette
+        return cassette
+
+    def iter_all(self):
+        if not os.path.isdir(self.directory): return
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    yield json.load(f)
+
+
+class _Recorder:
+    """Collects the chunks of one response with their offsets from the start of the request."""
+
+    def __init__(self, store, provider, kwargs, stream):
+        self.store = store
+        self.started = time.perf_counter()
+        self.cassette = {
+            "key": request_key(kwargs.get("messages", []), kwargs.get("system")),
+            "provider": provider, "model": kwargs.get("model"), "stream": stream,
+            "request": {"system": kwargs.get("system"), "messages": list(kwargs.get("messages", []))},
+            "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            "chunks": [],
+        }
+
+    def add(self, text):
+        if text: self.cassette["chunks"].append([round(time.perf_counter() - self.started, 4), text])
+
+    def finish(self):
+        if "total_seconds" in self.cassette: return  # Already saved
+        self.cassette["total_seconds"] = round(time.perf_counter() - self.started, 4)
+        try:
+            self.store.save(self.cassette)
+        except Exception as e:
+            print(f"Warning: Failed to save LLM cassette {self.cassette['key'][:12]}: {e}")
+
+
+def _replay_chunks(cassette, speed):
+    """Yields the recorded text chunks, sleeping to reproduce (scaled) timing."""
+    started = time.perf_counter()
+    for offset, text in cassette["chunks"]:
+        if speed > 0:
+            delay = offset / speed - (time.perf_counter() - started)
+            if delay > 0: time.sleep(delay)
+        yield text
+    if speed > 0:
+        delay = cassette.get("total_seconds", 0) / speed - (time.perf_counter() - started)
+        if delay > 0: time.sleep(delay)
+
+
+# --- OpenAI-shaped proxy ---
+class _OpenAICompletions:
+    def __init__(self, wrapper):
+        self._w = wrapper
+
+    def create(self, **kwargs):
+        stream = bool(kwargs.get("stream"))
+        if self._w.mode == "replay":
+            cassette = self._w.lookup(kwargs)
+            if stream:
+                return (SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+                        for text in _replay_chunks(cassette, self._w.speed))
+            text = "".join(_replay_chunks(cassette, self._w.speed))
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+        recorder = _Recorder(self._w.store, "openai", kwargs, stream)
+        response = self._w.client.chat.completions.create(**kwargs)
+        if not stream:
+            recorder.add(response.choices[0].message.content)
+            recorder.finish()
+            return response
+        return self._record_stream(response, recorder)
+
+    @staticmethod
+    def _record_stream(response, recorder):
+        # app.py stops reading early once a closing code is complete, so closing the generator also counts as done;
+        # a stream that fails part-way is not saved
+        done = False
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    recorder.add(chunk.choices[0].delta.content)
+                yield chunk
+            done = True
+        except GeneratorExit:
+            done = True
+            if hasattr(response, "close"): response.close()
+            raise
+        finally:
+            if done: recorder.finish()
+
+
+class _OpenAIProxy:
+    def __init__(self, wrapper):
+        self.chat = SimpleNamespace(completions=_OpenAICompletions(wrapper))
+
+
+# --- Anthropic-shaped proxy ---
+class _ReplayStream:
+    """Stands in for anthropic's MessageStreamManager/MessageStream: a context manager exposing .text_stream."""
+
+    def __init__(self, chunks):
+        self.text_stream = chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _RecordingStream:
+    def __init__(self, manager, recorder):
+        self._manager = manager
+        self._recorder = recorder
+
+    def __enter__(self):
+        stream = self._manager.__enter__()
+        self.text_stream = self._record(stream.text_stream)
+        return self
+
+    def _record(self, text_stream):
+        done = False
+        try:
+            for text in text_stream:
+                self._recorder.add(text)
+                yield text
+            done = True
+        except GeneratorExit:
+            done = True
+            raise
+        finally:
+            if done: self._recorder.finish()
+
+    def __exit__(self, *exc):
+        self.text_stream.close()
+        return self._manager.__exit__(*exc)
+
+
+class _AnthropicMessages:
+    def __init__(self, wrapper):
+        self._w = wrapper
+
+    def create(self, **kwargs):
+        if self._w.mode == "replay":
+            text = "".join(_replay_chunks(self._w.lookup(kwargs), self._w.speed))
+            return SimpleNamespace(content=[SimpleNamespace(text=text)])
+        recorder = _Recorder(self._w.store, "anthropic", kwargs, False)
+        response = self._w.client.messages.create(**kwargs)
+        recorder.add(response.content[0].text)
+        recorder.finish()
+        return response
+
+    def stream(self, **kwargs):
+        if self._w.mode == "replay":
+            return _ReplayStream(_replay_chunks(self._w.lookup(kwargs), self._w.speed))
+        return _RecordingStream(self._w.client.messages.stream(**kwargs), _Recorder(self._w.store, "anthropic", kwargs, True))
+
+
+class _AnthropicProxy:
+    def __init__(self, wrapper):
+        self.messages = _AnthropicMessages(wrapper)
+
+
+class _CassetteWrapper:
+    def __init__(self, client, mode, store, speed):
+        self.client = client
+        self.mode = mode
+        self.store = store
+        self.speed = speed
+
+    def lookup(self, kwargs):
+        key = request_key(kwargs.get("messages", []), kwargs.get("system"))
+        cassette = self.store.load(key)
+        if cassette is None:
+            raise CassetteMissError(f"No LLM cassette for request {key[:12]} in '{self.store.directory}'.")
+        return cassette
+
+
+def wrap_client(client, api):
+    """Returns the client wrapped for record/replay according to LLM_CASSETTE_MODE (unchanged when off)."""
+    mode = cassette_mode()
+    if mode == "off": return client
+    store = CassetteStore(os.environ.get(CASSETTE_DIR_ENV, DEFAULT_CASSETTE_DIR))
+    speed = float(os.environ.get(CASSETTE_SPEED_ENV, "1") or 1)
+    wrapper = _CassetteWrapper(client, mode, store, speed)
+    print(f"LLM cassettes: mode={mode}, dir={store.directory}, speed={speed}")
+    return _OpenAIProxy(wrapper) if api == "openai" else _AnthropicProxy(wrapper)
+
+
+# --- Journeys (used by benchmark.py) ---
+def recorded_journeys(directory):
+    """Respondent answer sequences of every complete recorded conversation.
+
+    A conversation is a recorded request that no other recorded request extends; its user messages
+    (minus the Anthropic kickoff message) are the answers to replay.
+    """
+    store = CassetteStore(directory)
+    conversations = []
+    for cassette in store.iter_all():
+        messages = [m for m in cassette["request"]["messages"] if m.get("role") != "system"]
+        conversations.append([(m.get("role"), m.get("content")) for m in messages])
+    conversations.sort(key=len, reverse=True)
+    leaves = []
+    for conversation in conversations:
+        if any(leaf[:len(conversation)] == conversation for leaf in leaves): continue
+        leaves.append(conversation)
+    journeys = [[content for role, content in leaf if role == "user" and content != "Please begin the interview."]
+                for leaf in leaves]
+    return [answers for answers in journeys if answers]
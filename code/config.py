@@ -103,12 +103,52 @@ SYSTEM_PROMPT = f"""{INTERVIEW_OUTLINE}
 #MODEL = "gpt-4o-2024-05-13"  # Or your preferred model
 MODEL = "gpt-4o-mini-2024-07-18"
 
+# Adaptive model routing (routing.py): MODEL handles routine probing turns, MODEL_STRONG the summary step.
+# Models may be from different providers ('gpt...' -> OpenAI, 'claude...' -> Anthropic).
+# Off by default: every turn uses MODEL. Enabling it sends the routed turns to MODEL_STRONG, at that model's price.
+ROUTING_ENABLED = False
+MODEL_STRONG = "gpt-4o-2024-05-13"
+# Phrases in an interviewer question that mean the summary comes next (the Information Gap Q of Part IV)
+ROUTING_SUMMARY_TRIGGERS = ["wish you understood better", "felt clearer about"]
+# Phrases in a respondent message explicitly asking for the summary (the bare word "summary" also occurs in answers)
+ROUTING_USER_TRIGGERS = ["give me a summary", "give me the summary", "can you summarise", "can you summarize",
+                         "please summarise", "please summarize", "could you summarise", "could you summarize"]
+# Use MODEL_STRONG for every turn from this respondent turn on (None = never)
+ROUTING_ESCALATE_AFTER_TURNS = None
+
+# Researcher dashboard (dashboard.py)
+DASHBOARD_CACHE_TTL_SECONDS = 30 # Count queries are shared by all viewers for this long
+DASHBOARD_REFRESH_SECONDS = 30
+DASHBOARD_ACTIVE_WINDOW_MINUTES = 30 # An active interview counts as live if its state changed within this window
+DASHBOARD_LATENCY_WINDOW_MINUTES = 60
+
+# Survey aggregates (survey_aggregates.py): counter shards, each sustaining about one write per second
+AGGREGATE_SHARDS = 10
+
+# Chat history (app.py): a resumed interview shows its latest messages; "Show earlier messages" adds this many more
+HISTORY_WINDOW_MESSAGES = 12 # Displayed messages (a question and its answer are two)
+
+# Resume prefetch (utils.prefetch_resume_state): messages read on a worker while the script thread reads the state document
+RESUME_PREFETCH_TTL_SECONDS = 10 # A prefetched read serves later reads in this process for this long (writes drop it)
+RESUME_PREFETCH_WORKERS = 64 # Threads per process (one per resuming session; sized to the sessions a replica serves)
+
 # --- SET EXPLICIT, LOWER TEMPERATURE ---
 TEMPERATURE = 0.3 # Make AI more focused, less creative (adjust 0.2-0.5 if needed)
 # --- END TEMPERATURE CHANGE ---
 MAX_OUTPUT_TOKENS = 2048
 
 
+# Per-user turn lease (utils.acquire_turn_lease): one LLM turn at a time per participant across tabs/replicas
+TURN_LEASE_TTL_SECONDS = 90 # A lease not renewed for this long is considered abandoned
+TURN_LEASE_WAIT_SECONDS = 120 # How long a second tab waits for the running turn before giving up
+TURN_LEASE_POLL_SECONDS = 0.5 # First poll interval while waiting; doubles after each poll
+TURN_LEASE_POLL_MAX_SECONDS = 8
+
+
+# Print the bytes held by each session's state after every turn (see utils.log_session_memory)
+MEMORY_ACCOUNTING = False
+
+
 # Display login screen
 LOGINS = False # Set to True if you implement logins
 
@@ -120,6 +160,10 @@ TIMES_DIRECTORY = f"{DATA_BASE_DIR}/times/"
 BACKUPS_DIRECTORY = f"{DATA_BASE_DIR}/backups/"
 SURVEY_DIRECTORY = f"{DATA_BASE_DIR}/survey/" # For post-interview survey data
 
+# Transcript blob store (blob_store.py): the results sheet row then carries a reference instead of the transcript text.
+# "gs://<bucket>[/<prefix>]" (uses the Firestore service account) or "local:<directory>"; None keeps it inline.
+TRANSCRIPT_BLOB_STORE = None
+
 
 # Avatars displayed in the chat interface
 AVATAR_INTERVIEWER = "\U0001F393"
@@ -0,0 +1,270 @@
+# dashboard.py
+# Researcher live-operations dashboard (run separately from the interview app):
+#   streamlit run dashboard.py
+# Access needs DASHBOARD_PASSWORD in .streamlit/secrets.toml.
+#
+# Reads are kept flat regardless of how many researchers have it open:
+# - funnel, completion and GSheet failure figures are Firestore count() aggregation queries (no documents are read),
+#   cached per process for config.DASHBOARD_CACHE_TTL_SECONDS
+# - turn latencies come from one snapshot listener per process on recent message documents, which only receives
+#   changes after its first snapshot
+#
+# One deployment can serve several studies (studies.py); the sidebar picks the study whose collection and survey
+# aggregates are shown. Turn latencies cover every study.
+#
+# Firestore indexes needed: a composite index on interviews (interview_active, last_updated) for the recently-active
+# count, and collection-group scope on messages.timestamp for the latency listener. A missing index shows as "n/a"
+# and the error (with the link to create the index) is printed to the log.
+import hmac
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+import config
+import studies
+import survey_aggregates
+import utils
+
+STAGES = ["welcome", "interview", "survey", "completed"] # Values of current_stage written by app.py, in order
+
+
+# --- Count Aggregations ---
+def count_where(query):
+    """Number of documents matching the query via a count() aggregation (None if the query fails)."""
+    try:
+        return query.count(alias="n").get()[0][0].value
+    except Exception as e:
+        print(f"Dashboard count query failed: {e}")
+        return None
+
+
+@st.cache_data(ttl=config.DASHBOARD_CACHE_TTL_SECONDS, show_spinner=False)
+def load_counts(collection):
+    """All count figures shown on the dashboard for a study's collection, shared by every viewer until the TTL expires."""
+    db = utils.get_firestore_client()
+    if not db: return None
+    interviews = db.collection(collection)
+    active_since = datetime.now(timezone.utc) - timedelta(minutes=config.DASHBOARD_ACTIVE_WINDOW_MINUTES)
+    return {
+        "fetched_at": time.time(),
+        "total": count_where(interviews),
+        "stages": {stage: count_where(interviews.where(filter=FieldFilter("current_stage", "==", stage))) for stage in STAGES},
+        "active": count_where(interviews.where(filter=FieldFilter("interview_active", "==", True))),
+        "active_recent": count_where(interviews.where(filter=FieldFilter("interview_active", "==", True))
+                                     .where(filter=FieldFilter("last_updated", ">=", active_since))),
+        "survey_completed": count_where(interviews.where(filter=FieldFilter("survey_completed_flag", "==", True))),
+        "gsheet_ok": count_where(interviews.where(filter=FieldFilter("survey_data.saved_to_gsheet_successfully", "==", True))),
+        "gsheet_failed": count_where(interviews.where(filter=FieldFilter("survey_data.saved_to_gsheet_successfully", "==", False))),
+    }
+
+
+@st.cache_data(ttl=config.DASHBOARD_CACHE_TTL_SECONDS, show_spinner=False)
+def load_survey_aggregates(document):
+    """Precomputed survey counts (config.AGGREGATE_SHARDS document reads, independent of the number of respondents)."""
+    db = utils.get_firestore_client()
+    if not db: return None
+    try:
+        return survey_aggregates.read_aggregates(db, document)
+    except Exception as e:
+        print(f"Dashboard survey aggregates read failed: {e}")
+        return None
+
+
+# --- Turn Latency Listener ---
+class LatencyListener:
+    """Turn latencies of recent assistant messages, kept up to date by a Firestore snapshot listener."""
+
+    def __init__(self, db, window_minutes):
+        self.window_seconds = window_minutes * 60
+        self._db = db
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock() # Not _lock: unsubscribing waits for a running _on_snapshot
+        self._turns = {} # message document path -> (timestamp_unix, model, first_token_seconds, latency_seconds)
+        self._watch = None
+        self._listen()
+
+    def _listen(self):
+        """(Re)starts the listener on messages inside the window. A query's cutoff is fixed when it starts, so
+        recent_turns() restarts it once it lags a full window behind (the restart re-reads the turns in the window)."""
+        if self._watch is not None: self._watch.unsubscribe()
+        self._since = time.time() - self.window_seconds
+        since = datetime.fromtimestamp(self._since, timezone.utc)
+        query = self._db.collection_group("messages").where(filter=FieldFilter("timestamp", ">=", since))
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            for change in changes:
+                path = change.document.reference.path
+                if change.type.name == "REMOVED":
+                    self._turns.pop(path, None); continue
+                data = change.document.to_dict() or {}
+                if data.get("role") != "assistant" or data.get("latency_seconds") is None: continue
+                timestamp = data.get("timestamp")
+                timestamp_unix = timestamp.timestamp() if hasattr(timestamp, "timestamp") else time.time()
+                if timestamp_unix < cutoff: # e.g. an old message modified: outside the window, not a recent turn
+                    self._turns.pop(path, None); continue
+                self._turns[path] = (timestamp_unix, data.get("model") or "unknown", data.get("first_token_seconds"), data["latency_seconds"])
+
+    def recent_turns(self):
+        """Turns inside the window (ending now) as a DataFrame; older entries are dropped from memory."""
+        now = time.time()
+        if now - self._since > 2 * self.window_seconds:
+            with self._restart_lock:
+                if now - self._since > 2 * self.window_seconds: self._listen()
+        cutoff = now - self.window_seconds
+        with self._lock:
+            for path in [p for p, turn in self._turns.items() if turn[0] < cutoff]:
+                del self._turns[path]
+            rows = list(self._turns.values())
+        return pd.DataFrame(rows, columns=["timestamp_unix", "model", "first_token_seconds", "latency_seconds"])
+
+
+@st.cache_resource(show_spinner=False)
+def get_latency_listener():
+    """One listener per process, shared by all dashboard sessions."""
+    db = utils.get_firestore_client()
+    if not db: return None
+    try:
+        return LatencyListener(db, config.DASHBOARD_LATENCY_WINDOW_MINUTES)
+    except Exception as e:
+        print(f"Dashboard latency listener failed to start: {e}")
+        return None
+
+
+def latency_table(turns):
+    """p50/p90/p95/p99 of total and first-token latency, overall and per model."""
+    rows = []
+    for model, group in [("all", turns)] + list(turns.groupby("model")):
+        for column, label in (("latency_seconds", "total"), ("first_token_seconds", "first token")):
+            values = group[column].dropna().to_numpy(dtype=float)
+            if not len(values): continue
+            p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+            rows.append({"model": model, "latency": label, "turns": len(values),
+                         "p50 (s)": p50, "p90 (s)": p90, "p95 (s)": p95, "p99 (s)": p99})
+    return pd.DataFrame(rows)
+
+
+# --- Rendering ---
+def rate(numerator, denominator):
+    if numerator is None or not denominator: return "n/a"
+    return f"{numerator / denominator:.1%}"
+
+
+def show_value(value):
+    return "n/a" if value is None else value
+
+
+@st.fragment(run_every=config.DASHBOARD_REFRESH_SECONDS)
+def render_dashboard(study):
+    counts = load_counts(study.collection)
+    if counts is None:
+        st.error("Firestore is not available."); return
+    st.caption(f"Counts as of {time.strftime('%H:%M:%S', time.localtime(counts['fetched_at']))} "
+               f"(refreshed at most every {config.DASHBOARD_CACHE_TTL_SECONDS}s)")
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Interviews started", show_value(counts["total"]))
+    col2.metric(f"Active (last {config.DASHBOARD_ACTIVE_WINDOW_MINUTES} min)", show_value(counts["active_recent"]),
+                help=f"Marked active in total: {show_value(counts['active'])}")
+    col3.metric("Completion rate", rate(counts["survey_completed"], counts["total"]),
+                help=f"{show_value(counts['survey_completed'])} surveys completed")
+    gsheet_saves = None if counts["gsheet_ok"] is None or counts["gsheet_failed"] is None else counts["gsheet_ok"] + counts["gsheet_failed"]
+    col4.metric("GSheet failure rate", rate(counts["gsheet_failed"], gsheet_saves),
+                help=f"{show_value(counts['gsheet_failed'])} of {show_value(gsheet_saves)} survey saves fell back to Firestore only")
+
+    st.subheader("Funnel by current stage")
+    funnel = pd.DataFrame({"stage": STAGES, "currently at stage": [counts["stages"][s] for s in STAGES]})
+    # Reached = at this stage or any later one
+    at_stage = [c or 0 for c in funnel["currently at stage"]]
+    funnel["reached stage"] = [sum(at_stage[i:]) for i in range(len(STAGES))]
+    st.dataframe(funnel, hide_index=True, use_container_width=True)
+    st.bar_chart(funnel.set_index("stage")["reached stage"])
+
+    st.subheader(f"Turn latency (last {config.DASHBOARD_LATENCY_WINDOW_MINUTES} min)")
+    listener = get_latency_listener()
+    if listener is None:
+        st.info("Latency listener is not running (see the log)."); return
+    turns = listener.recent_turns()
+    if turns.empty:
+        st.info("No interview turns in the window yet."); return
+    st.dataframe(latency_table(turns).round(2), hide_index=True, use_container_width=True)
+
+
+def render_survey_aggregates(study):
+    st.subheader("Survey responses")
+    aggregates = load_survey_aggregates(study.aggregates_document)
+    if not aggregates:
+        st.info("No survey aggregates yet."); return
+    scope = aggregates
+    if aggregates.get("by_major"):
+        major = st.selectbox("Major", ["All majors"] + sorted(major for major, counts in aggregates["by_major"].items() if counts.get("respondents")))
+        if major != "All majors": scope = aggregates["by_major"][major]
+    stats = survey_aggregates.field_statistics(scope)
+    st.caption(f"{scope.get('respondents', 0)} respondents")
+    numeric = pd.DataFrame([{"field": field, "answers": s["numeric_count"], "mean": s["mean"], "std": s["std"]}
+                            for field, s in stats.items() if "mean" in s])
+    if not numeric.empty: st.dataframe(numeric.round(2), hide_index=True, use_container_width=True)
+    field = st.selectbox("Distribution of", sorted(stats))
+    st.bar_chart(pd.Series(stats[field]["hist"], name="respondents").sort_index())
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def open_search_index(directory, manifest_mtime):
+    """Memory-mapped index, reopened when `python search_index.py add` publishes a new manifest."""
+    import search_index
+    return search_index.SearchIndex(directory)
+
+
+def render_search():
+    st.subheader("Search answers")
+    try: # Imported here: a missing dependency (scipy) or a broken index only disables this panel
+        import search_index
+        manifest_path = os.path.join(search_index.DEFAULT_INDEX_DIR, "manifest.json")
+        if not os.path.exists(manifest_path):
+            st.caption(f"No search index in {search_index.DEFAULT_INDEX_DIR} (build it with `python search_index.py add <export.csv>`)."); return
+        index = open_search_index(search_index.DEFAULT_INDEX_DIR, os.path.getmtime(manifest_path))
+    except Exception as e:
+        st.warning(f"Answer search is unavailable: {e}"); return
+    query = st.text_input("Find answers similar to", placeholder="e.g. I learn more from internships than from my courses")
+    if not query: return
+    try:
+        results = index.search(query, k=20)
+    except Exception as e:
+        st.warning(f"Answer search failed: {e}"); return
+    if not results:
+        st.info("No matching answers."); return
+    st.dataframe(pd.DataFrame(results, columns=["score", "username", "turn", "part", "text"]), hide_index=True, use_container_width=True)
+
+
+def check_password():
+    """Gate on DASHBOARD_PASSWORD from the secrets; the result is kept in the session."""
+    if st.session_state.get("dashboard_authenticated"): return True
+    expected = st.secrets.get("DASHBOARD_PASSWORD")
+    if not expected:
+        st.error("Dashboard is disabled: set DASHBOARD_PASSWORD in the Streamlit secrets."); return False
+    password = st.text_input("Password", type="password")
+    if password and hmac.compare_digest(password, expected):
+        st.session_state.dashboard_authenticated = True; st.rerun()
+    elif password:
+        st.error("Incorrect password.")
+    return False
+
+
+st.set_page_config(page_title="Interview Operations", page_icon="📊", layout="wide")
+st.title("Interview Operations")
+if check_password():
+    try:
+        study = studies.load_study(st.sidebar.selectbox("Study", studies.available_studies()))
+    except studies.StudyError as e:
+        st.error(str(e)); st.stop()
+    render_dashboard(study)
+    render_survey_aggregates(study)
+    render_search()
@@ -0,0 +1,445 @@
+# fake_backends.py
+# In-process stand-ins for the storage backends used by utils.py, for load testing (loadtest.py), the Firestore
+# budget suite (firestore_budget.py) and the soak test (soak_test.py, which also injects faults through FaultInjector).
+# Nothing here is imported by the app itself.
+import copy
+import datetime
+import functools
+import json
+import random
+import threading
+import time
+import uuid
+
+import gspread
+import requests
+from google.api_core import exceptions as api_exceptions
+from google.api_core.exceptions import NotFound
+from google.cloud import firestore
+
+
+# --- Fault Injection ---
+class FaultInjector:
+    """Random faults for a fake backend, rolled once per call: an error (one of error_statuses), a timeout (waits
+    timeout_seconds, then fails) or a latency spike (waits spike_seconds, then succeeds). Off unless rates are set."""
+
+    def __init__(self, error_rate=0.0, timeout_rate=0.0, timeout_seconds=2.0, spike_rate=0.0, spike_seconds=2.0,
+                 error_statuses=(429, 503), seed=None):
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.spike_rate = spike_rate
+        self.spike_seconds = spike_seconds
+        self.error_statuses = tuple(error_statuses)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "spikes": 0}
+
+    def before_call(self, make_error, make_timeout):
+        """Call before the backend call. make_error(status) and make_timeout() build the exceptions to raise."""
+        with self.lock:
+            self.stats["calls"] += 1
+            roll = self.rng.random()
+            status = self.rng.choice(self.error_statuses)
+            fault = ("errors" if roll < self.error_rate else
+                     "timeouts" if roll < self.error_rate + self.timeout_rate else
+                     "spikes" if roll < self.error_rate + self.timeout_rate + self.spike_rate else None)
+            if fault: self.stats[fault] += 1
+        if fault == "errors": raise make_error(status)
+        if fault == "timeouts":
+            time.sleep(self.timeout_seconds); raise make_timeout()
+        if fault == "spikes": time.sleep(self.spike_seconds)
+
+
+# --- Fake Google Sheets ---
+def _sheets_api_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps({"error": {"code": status, "message": f"Injected error {status}", "status": "UNAVAILABLE"}}).encode()
+    return gspread.exceptions.APIError(response)
+
+
+def _sheets_timeout():
+    return requests.exceptions.ReadTimeout("Injected timeout")
+
+
+class FakeWorksheet:
+    """Records appended rows in memory; mimics the gspread Worksheet methods utils.py uses."""
+
+    def __init__(self, append_latency=0.0, faults=None):
+        self.append_latency = append_latency
+        self.faults = faults # Optional FaultInjector
+        self.rows = []
+        self._lock = threading.Lock()
+
+    def append_row(self, values, value_input_option=None, **kwargs):
+        if self.faults: self.faults.before_call(_sheets_api_error, _sheets_timeout)
+        if self.append_latency: time.sleep(self.append_latency)
+        with self._lock:
+            self.rows.append(list(values))
+        return {"updates": {"updatedRows": 1}}
+
+    def get_all_values(self):
+        with self._lock:
+            return [list(row) for row in self.rows]
+
+    def pop_rows(self, username):
+        """Removes and returns the rows of one respondent (first column), so long runs keep memory flat."""
+        with self._lock:
+            taken = [row for row in self.rows if row and row[0] == username]
+            self.rows = [row for row in self.rows if not row or row[0] != username]
+        return taken
+
+
+def install_fake_sheets(utils_module, worksheet=None):
+    """Routes utils' GSheet saves to a FakeWorksheet. Returns the worksheet so callers can inspect rows."""
+    worksheet = worksheet or FakeWorksheet()
+    utils_module.get_results_worksheet = lambda sheet_name=None: worksheet
+    return worksheet
+
+
+# --- Fake Firestore ---
+# Implements the parts of google.cloud.firestore that utils.py and survey_aggregates.py use, in memory, and counts
+# what the real service would bill and how many RPCs it would take:
+#   reads        documents returned (a get of a missing document and an empty query still cost one read)
+#   writes       documents written (set/update/delete/add; field transforms are part of their write)
+#   round_trips  RPCs: every get, query, write and batch commit; a transaction is begin + its gets + commit
+# Transactions run under one lock (serialisable, never retried); install_fake_firestore() swaps
+# firestore.transactional for fake_transactional so @firestore.transactional functions run through them.
+# With a FaultInjector in FakeFirestore.faults, every RPC may fail (ServiceUnavailable/ResourceExhausted, or
+# DeadlineExceeded after a wait) before it touches any data; a transaction can only fail as a whole, at its start.
+_COMPARISONS = {
+    "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b, "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+_MISSING = object()
+
+
+def _field(data, field_path):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value: return _MISSING
+        value = value[part]
+    return value
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _field(self._data or {}, field_path)
+        if value is _MISSING: raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias, value):
+        self.alias, self.value = alias, value
+
+
+class FakeQuery:
+    def __init__(self, db, parent_path, collection_id, all_descendants=False, filters=(), orders=(), limit=None):
+        self._db = db
+        self._parent_path = parent_path
+        self._collection_id = collection_id
+        self._all_descendants = all_descendants
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+
+    def _copy(self, **changes):
+        fields = {"filters": self._filters, "orders": self._orders, "limit": self._limit, **changes}
+        return FakeQuery(self._db, self._parent_path, self._collection_id, self._all_descendants, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None: field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, _COMPARISONS[op_string], value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def _matches(self):
+        docs = []
+        for path, data in self._db._documents.items():
+            parent, _, doc_id = path.rpartition("/")
+            parent_of_collection, _, collection_id = parent.rpartition("/")
+            if collection_id != self._collection_id: continue
+            if not self._all_descendants and parent_of_collection != self._parent_path: continue
+            if any(_field(data, f) is _MISSING for f, _ in self._orders): continue # Firestore drops these
+            if all((v := _field(data, f)) is not _MISSING and compare(v, value) for f, compare, value in self._filters):
+                docs.append((path, data))
+        docs.sort(key=lambda item: item[0].rpartition("/")[2])
+        for field_path, descending in reversed(self._orders):
+            docs.sort(key=lambda item: _field(item[1], field_path), reverse=descending)
+        return docs[:self._limit] if self._limit is not None else docs
+
+    def stream(self, transaction=None):
+        self._db._inject_fault()
+        with self._db._lock:
+            docs = [FakeSnapshot(FakeDocumentReference(self._db, path), copy.deepcopy(data)) for path, data in self._matches()]
+            self._db._count("query", self._description(), reads=max(1, len(docs)))
+        return iter(docs)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self, alias)
+
+    def _description(self):
+        if self._all_descendants: return f"**/{self._collection_id}"
+        return f"{self._parent_path}/{self._collection_id}".lstrip("/")
+
+
+class FakeAggregationQuery:
+    def __init__(self, query, alias):
+        self._query, self._alias = query, alias
+
+    def get(self, transaction=None):
+        self._query._db._inject_fault()
+        with self._query._db._lock:
+            n = len(self._query._matches())
+            self._query._db._count("count", self._query._description(), reads=max(1, -(-n // 1000))) # 1 read per 1000 entries
+        return [[FakeAggregationResult(self._alias, n)]]
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, path):
+        parent_path, _, collection_id = path.rpartition("/")
+        super().__init__(db, parent_path, collection_id)
+        self.id = collection_id
+        self._path = path
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._db, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        reference.set(document_data)
+        return self._db._last_timestamp, reference
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rpartition("/")[2]
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._db, self.path.rpartition("/")[0])
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self._db, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None):
+        self._db._inject_fault()
+        with self._db._lock:
+            data = self._db._documents.get(self.path)
+            self._db._count("get", self.path, reads=1)
+            return FakeSnapshot(self, copy.deepcopy(data))
+
+    def set(self, document_data, merge=False):
+        self._db._inject_fault()
+        with self._db._lock:
+            self._db._count("set", self.path, writes=1)
+            self._db._apply("set", self.path, document_data, merge)
+
+    def update(self, field_updates):
+        self._db._inject_fault()
+        with self._db._lock:
+            self._db._count("update", self.path, writes=1)
+            self._db._apply("update", self.path, field_updates)
+
+    def delete(self):
+        self._db._inject_fault()
+        with self._db._lock:
+            self._db._count("delete", self.path, writes=1)
+            self._db._apply("delete", self.path)
+
+
+class FakeWriteBatch:
+    """Buffers writes and applies them in one commit (also the base of FakeTransaction)."""
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference.path, copy.deepcopy(document_data), merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append(("update", reference.path, copy.deepcopy(field_updates), False))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference.path, None, False))
+
+    def commit(self):
+        self._db._inject_fault()
+        with self._db._lock:
+            self._db._count("commit", f"{len(self._writes)} write(s)", writes=len(self._writes))
+            for operation, path, data, merge in self._writes: # Validate first: a commit applies all or nothing
+                if operation == "update" and path not in self._db._documents: raise NotFound(f"No document to update: {path}")
+            for operation, path, data, merge in self._writes:
+                self._db._apply(operation, path, data, merge)
+            self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    def run(self, func, *args, **kwargs):
+        self._db._inject_fault()
+        with self._db._lock: # Held across the function: transactions never interleave, so none needs a retry
+            self._db._count("begin_transaction", "")
+            self._writes = []
+            self._db._in_transaction.active = True # Its gets and commit are not faulted separately
+            try:
+                result = func(self, *args, **kwargs)
+            except BaseException:
+                self._db._count("rollback", "")
+                self._writes = []
+                raise
+            else:
+                self.commit()
+            finally:
+                self._db._in_transaction.active = False
+            return result
+
+
+def fake_transactional(func):
+    """Stand-in for firestore.transactional that runs the function through FakeTransaction.run."""
+    @functools.wraps(func)
+    def wrapper(transaction, *args, **kwargs):
+        return transaction.run(func, *args, **kwargs)
+    return wrapper
+
+
+class FakeFirestore:
+    """In-memory Firestore client with read/write/round-trip counters (see the section comment above)."""
+
+    def __init__(self, keep_log=False, faults=None):
+        self._documents = {} # "collection/doc/collection/doc" -> data
+        self._lock = threading.RLock()
+        self._in_transaction = threading.local()
+        self._last_timestamp = None
+        self.counts = {"reads": 0, "writes": 0, "round_trips": 0}
+        self.log = [] if keep_log else None # (operation, path, reads, writes) per RPC
+        self.faults = faults # Optional FaultInjector
+
+    # --- Public API used by the app ---
+    def collection(self, collection_path):
+        return FakeCollectionReference(self, collection_path)
+
+    def collection_group(self, collection_id):
+        return FakeQuery(self, "", collection_id, all_descendants=True)
+
+    def document(self, document_path):
+        return FakeDocumentReference(self, document_path)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    # --- Inspection ---
+    def snapshot_counts(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def document_data(self, document_path):
+        with self._lock:
+            return copy.deepcopy(self._documents.get(document_path))
+
+    def document_paths(self):
+        with self._lock:
+            return sorted(self._documents)
+
+    def documents(self, prefix):
+        """{path: data} of every document whose path starts with prefix."""
+        with self._lock:
+            return {path: copy.deepcopy(data) for path, data in self._documents.items() if path.startswith(prefix)}
+
+    def purge(self, document_path):
+        """Drops a document and everything under it (uncounted), so long runs keep memory flat."""
+        with self._lock:
+            for path in [p for p in self._documents if p == document_path or p.startswith(document_path + "/")]:
+                del self._documents[path]
+
+    # --- Internals ---
+    def _inject_fault(self):
+        if self.faults is None or getattr(self._in_transaction, "active", False): return
+        self.faults.before_call(lambda status: api_exceptions.from_http_status(status, f"Injected error {status}"),
+                                lambda: api_exceptions.DeadlineExceeded("Injected timeout"))
+
+    def _count(self, operation, path, reads=0, writes=0):
+        self.counts["reads"] += reads
+        self.counts["writes"] += writes
+        self.counts["round_trips"] += 1
+        if self.log is not None: self.log.append((operation, path, reads, writes))
+
+    def _server_timestamp(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self._last_timestamp is not None and now <= self._last_timestamp: # Keep message order stable
+            now = self._last_timestamp + datetime.timedelta(microseconds=1)
+        self._last_timestamp = now
+        return now
+
+    def _resolve(self, value, current):
+        if value is firestore.SERVER_TIMESTAMP: return self._server_timestamp()
+        if isinstance(value, firestore.Increment):
+            return (current if isinstance(current, (int, float)) else 0) + value.value
+        return copy.deepcopy(value)
+
+    def _merge(self, target, data, merge):
+        for key, value in data.items():
+            if value is firestore.DELETE_FIELD: target.pop(key, None)
+            elif isinstance(value, dict) and merge: self._merge(target.setdefault(key, {}), value, merge)
+            elif isinstance(value, dict): target[key] = self._merge({}, value, merge)
+            else: target[key] = self._resolve(value, target.get(key, _MISSING))
+        return target
+
+    def _apply(self, operation, path, data=None, merge=False):
+        if operation == "delete":
+            self._documents.pop(path, None)
+        elif operation == "set":
+            base = copy.deepcopy(self._documents.get(path, {})) if merge else {}
+            self._documents[path] = self._merge(base, data, merge)
+        else: # update: keys are field paths, values replace whole fields
+            if path not in self._documents: raise NotFound(f"No document to update: {path}")
+            document = self._documents[path]
+            for field_path, value in data.items():
+                *parents, leaf = field_path.split(".")
+                target = document
+                for part in parents: target = target.setdefault(part, {})
+                if value is firestore.DELETE_FIELD: target.pop(leaf, None)
+                elif isinstance(value, dict): target[leaf] = self._merge({}, value, False)
+                else: target[leaf] = self._resolve(value, target.get(leaf, _MISSING))
+
+
+def install_fake_firestore(utils_module, db=None):
+    """Routes utils' Firestore client to a FakeFirestore and makes @firestore.transactional use fake transactions.
+
+    Patches the google.cloud.firestore module itself, so only use this in a harness process. Returns the fake client.
+    """
+    db = db or FakeFirestore()
+    utils_module.get_firestore_client = lambda: db
+    utils_module.firestore.transactional = fake_transactional
+    return db
@@ -0,0 +1,146 @@
+# firestore_budget.py
+# Firestore cost budget: replays a full participant journey against the instrumented in-memory Firestore
+# (fake_backends.FakeFirestore) and checks the document reads, writes and round trips of every step against BUDGETS.
+# Exits 1 when a step goes over budget, so a change that adds state writes or extra reads shows up in review.
+#
+# The journey: welcome page -> consent -> start (opening question) -> interview turns -> reload mid-interview ->
+# remaining turns -> closing turn (end code) -> survey submit -> reload after completion.
+#
+# Usage (from the code folder):
+#   python firestore_budget.py              # check against BUDGETS
+#   python firestore_budget.py --show-ops   # also list every Firestore call per step
+# When a change lowers the counts, tighten BUDGETS to the new numbers in the same commit.
+import argparse
+import io
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+import loadtest
+
+INTERVIEW_TURNS = 4 # Questions the mock interviewer asks before the summary (budgets below assume this)
+RELOAD_AFTER_TURNS = 2
+COUNTERS = ("reads", "writes", "round_trips")
+
+# Per-step maximum (an interview turn is checked on every occurrence).
+BUDGETS = {
+    "welcome":                 {"reads": 2, "writes": 0, "round_trips": 2},
+    "consent":                 {"reads": 0, "writes": 1, "round_trips": 1},
+    "start interview":         {"reads": 2, "writes": 6, "round_trips": 10},
+    "interview turn":          {"reads": 2, "writes": 4, "round_trips": 8},
+    "reload mid-interview":    {"reads": 6, "writes": 0, "round_trips": 2},
+    "closing turn":            {"reads": 2, "writes": 4, "round_trips": 8},
+    "survey submit":           {"reads": 1, "writes": 5, "round_trips": 6},
+    "reload after completion": {"reads": 11, "writes": 0, "round_trips": 2},
+}
+
+
+class Journey:
+    """Drives one respondent through the app and records the Firestore counter deltas of each step."""
+
+    def __init__(self, db, username, timeout):
+        self.db, self.username, self.timeout = db, username, timeout
+        self.steps = [] # (step, {counter: delta}, [(operation, path, reads, writes)])
+        self.at = None
+
+    def step(self, name, action):
+        before, log_start = self.db.snapshot_counts(), len(self.db.log)
+        with redirect_stdout(io.StringIO()):
+            at = action()
+        if at.exception: raise RuntimeError(f"{name}: {at.exception[0].message}")
+        after = self.db.snapshot_counts()
+        self.steps.append((name, {c: after[c] - before[c] for c in COUNTERS}, self.db.log[log_start:]))
+        return at
+
+    def open_session(self):
+        self.at = loadtest.new_app_test(self.username, self.timeout)
+        return self.at.run()
+
+    def answer(self, turn):
+        return self.at.chat_input[0].set_value(loadtest.RESPONDENT_ANSWERS[turn % len(loadtest.RESPONDENT_ANSWERS)]).run()
+
+    def submit_survey(self):
+        for key, value in loadtest.SURVEY_ANSWERS.items():
+            self.at.selectbox(key=key).select(value)
+        return self.at.button[0].click().run()
+
+    def run(self, max_turns=20):
+        self.step("welcome", self.open_session)
+        self.step("consent", lambda: self.at.checkbox(key="consent_checkbox").check().run())
+        self.step("start interview", lambda: self.at.button(key="start_interview_btn").click().run())
+        turn = 0
+        while loadtest.current_stage(self.at) == loadtest.INTERVIEW_STAGE and turn < max_turns:
+            if turn == RELOAD_AFTER_TURNS: self.step("reload mid-interview", self.open_session)
+            at = self.step("interview turn", lambda: self.answer(turn))
+            if loadtest.current_stage(at) != loadtest.INTERVIEW_STAGE: self.steps[-1] = ("closing turn", *self.steps[-1][1:])
+            turn += 1
+        if loadtest.current_stage(self.at) != loadtest.SURVEY_STAGE:
+            raise RuntimeError(f"Interview did not reach the survey (stage {loadtest.current_stage(self.at)!r})")
+        self.step("survey submit", self.submit_survey)
+        if loadtest.current_stage(self.at) != loadtest.COMPLETED_STAGE:
+            raise RuntimeError(f"Survey submit did not complete (stage {loadtest.current_stage(self.at)!r})")
+        self.step("reload after completion", self.open_session)
+        return self.steps
+
+
+def check(steps, budgets):
+    """Over-budget messages (empty when every step is within budget)."""
+    failures = []
+    for name, counts, _ in steps:
+        budget = budgets.get(name)
+        if budget is None:
+            failures.append(f"{name}: no budget defined"); continue
+        failures.extend(f"{name}: {c} {counts[c]} > budget {budget[c]}" for c in COUNTERS if counts[c] > budget[c])
+    return failures
+
+
+def print_steps(steps, budgets, show_ops=False):
+    print(f"{'step':<26}{'reads':>8}{'writes':>8}{'round trips':>13}   budget (r/w/rt)")
+    totals = dict.fromkeys(COUNTERS, 0)
+    for name, counts, ops in steps:
+        budget = budgets.get(name, {})
+        print(f"{name:<26}{counts['reads']:>8}{counts['writes']:>8}{counts['round_trips']:>13}   "
+              f"{'/'.join(str(budget.get(c, '-')) for c in COUNTERS)}")
+        for c in COUNTERS: totals[c] += counts[c]
+        if show_ops:
+            for operation, path, reads, writes in ops: print(f"    {operation:<18} {path}  (r{reads} w{writes})")
+    print(f"{'journey total':<26}{totals['reads']:>8}{totals['writes']:>8}{totals['round_trips']:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the Firestore reads/writes/round trips of a participant journey.")
+    parser.add_argument("--show-ops", action="store_true", help="List every Firestore call of each step.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest timeout per script run (s).")
+    args = parser.parse_args()
+
+    sys.path.insert(0, loadtest.CODE_DIR)
+    import fake_backends
+    import mock_llm
+    import utils
+
+    os.chdir(tempfile.mkdtemp(prefix="skills_survey_budget_")) # The app's local data/ backups
+    server, base_url = mock_llm.start_in_background(mock_llm.MockLLMSettings(
+        tokens_per_second=5000, first_token_latency=0.0, interview_turns=INTERVIEW_TURNS, seed=0))
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["ANTHROPIC_BASE_URL"] = base_url
+    fake_backends.install_fake_sheets(utils)
+    db = fake_backends.install_fake_firestore(utils, fake_backends.FakeFirestore(keep_log=True))
+    with redirect_stdout(io.StringIO()):
+        loadtest.install_shared_runtime()
+
+    try:
+        steps = Journey(db, "budget_respondent", args.timeout).run()
+    finally:
+        server.shutdown()
+    print_steps(steps, BUDGETS, args.show_ops)
+    failures = check(steps, BUDGETS)
+    if failures:
+        print("\nOver budget:")
+        for line in failures: print(f"  - {line}")
+        raise SystemExit(1)
+    print("\nAll steps within budget.")
+
+
+if __name__ == "__main__":
+    main()
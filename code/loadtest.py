@@ -0,0 +1,459 @@
+# loadtest.py
+# Headless load test: drives app.py through welcome -> interview -> survey -> completed with many simulated
+# respondents in parallel, using Streamlit's AppTest, the scriptable mock LLM (mock_llm.py) and a fake Sheets backend.
+#
+# Firestore: set FIRESTORE_EMULATOR_HOST (e.g. `gcloud emulators firestore start --host-port=127.0.0.1:8080`) to run
+# against the emulator, or pass --fake-firestore for the in-memory fake (which also counts reads, writes and round
+# trips); otherwise Firestore calls fail fast and are skipped, which under-reports storage cost.
+#
+# Example:  python loadtest.py --respondents 300 --concurrency 100 --processes 3 --tokens-per-second 40
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stdout
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(CODE_DIR, "app.py")
+USERNAME_STORAGE_KEY = "skills_survey_username_uuid"
+
+# Stage names as defined in app.py (not imported: app.py is a Streamlit script)
+INTERVIEW_STAGE = "interview"
+SURVEY_STAGE = "survey"
+COMPLETED_STAGE = "completed"
+
+RESPONDENT_ANSWERS = [
+    "I would like to work as a data analyst, maybe in consulting or at a central bank.",
+    "Mostly skills, but getting the degree and some connections matter too.",
+    "Statistics, programming in Python, and being able to explain results to non-experts.",
+    "Because employers look for people who can both analyse data and communicate it clearly.",
+    "Econometrics helped a lot, the rest was mostly theory.",
+    "Not really, I pick electives by schedule and by what friends recommend.",
+    "Internships and personal projects, university gives the foundations.",
+    "Practical coding and presentation skills are missing from my courses.",
+    "I follow it a bit, mostly through social media and news.",
+    "I think routine analysis becomes less valuable and judgement becomes more valuable.",
+]
+SURVEY_ANSWERS = {"age": "21", "gender": "Prefer not to say", "major": "Economics", "year": "Third Year", "gpa": "7.5"}
+
+
+# --- Process Metrics ---
+def current_rss_bytes():
+    """Resident set size of this process (Linux /proc, psutil fallback)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss
+        except ImportError:
+            return 0
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RssSampler(threading.Thread):
+    """Samples RSS in the background and keeps the peak."""
+
+    def __init__(self, interval=0.25):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss_bytes()
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            rss = current_rss_bytes()
+            self.samples.append((time.time(), rss))
+            self.peak = max(self.peak, rss)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (pct in 0-100) of a list of numbers; None when empty."""
+    if not values: return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(pct / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+# --- Thread-safe AppTest ---
+APP_SECRETS = {"API_KEY_OPENAI": "loadtest", "API_KEY_ANTHROPIC": "loadtest"}
+_shared_runtime_lock = threading.Lock()
+_shared_runtime_ready = False
+_shared_script_cache = None
+
+
+def install_shared_runtime():
+    """Installs one mock Runtime and the secrets process-wide, once.
+
+    AppTest swaps Runtime._instance and st.secrets in and out around every run and compiles the script once per
+    session, which breaks as soon as sessions run in parallel threads (concurrent compile() of the same AST is not
+    thread-safe on CPython 3.11). A real server process shares all of these between sessions, so sharing is faithful.
+    """
+    global _shared_runtime_ready, _shared_script_cache
+    with _shared_runtime_lock:
+        if _shared_runtime_ready: return
+        from unittest.mock import MagicMock
+        import streamlit as st
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+        from streamlit.runtime.media_file_manager import MediaFileManager
+        from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+        from streamlit.runtime.secrets import Secrets
+        from streamlit import config as st_config
+
+        runtime = MagicMock(spec=Runtime)
+        runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+        runtime.cache_storage_manager = MemoryCacheStorageManager()
+        Runtime._instance = runtime
+        secrets = Secrets()
+        secrets._secrets = dict(APP_SECRETS)
+        st.secrets = secrets
+        st_config.set_option("global.appTest", True)
+        _shared_script_cache = ScriptCache()
+        _shared_script_cache.get_bytecode(APP_PATH)
+        _shared_runtime_ready = True
+
+
+def make_concurrent_app_test_class():
+    from streamlit.runtime.pages_manager import PagesManager
+    from streamlit.testing.v1 import AppTest
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+    from streamlit.runtime.scriptrunner.script_runner import ScriptRunnerEvent
+    from urllib import parse
+
+    def _keep_last_run_only(sender, event, **kwargs):
+        if event == ScriptRunnerEvent.SCRIPT_STARTED: sender.forward_msg_queue.clear()
+
+    class ConcurrentAppTest(AppTest):
+        """AppTest whose runs leave the process-wide runtime/secrets alone (see install_shared_runtime)."""
+
+        def _run(self, widget_state=None, timeout=None):
+            install_shared_runtime()
+            timeout = self.default_timeout if timeout is None else timeout
+            pages_manager = PagesManager(self._script_path, setup_watcher=False)
+            script_runner = LocalScriptRunner(self._script_path, self.session_state, pages_manager,
+                                              args=self.args, kwargs=self.kwargs)
+            script_runner._script_cache = _shared_script_cache
+            # A browser drops elements that a st.rerun() replaced; AppTest keeps every run's deltas in one queue,
+            # so leftovers of the run before the rerun (e.g. the consent checkbox) would show up in the tree
+            script_runner.on_event.connect(_keep_last_run_only, weak=False)
+            self._tree = script_runner.run(widget_state, self.query_params, timeout, self._page_hash)
+            self._tree._runner = self
+            self.query_params = parse.parse_qs(script_runner.event_data[-1]["client_state"].query_string)
+            return self
+
+    return ConcurrentAppTest
+
+
+_app_test_class = None
+
+
+# --- Simulated Respondent ---
+def new_app_test(username, timeout):
+    """Fresh app session with a simulated browser local storage already holding the username."""
+    global _app_test_class
+    if _app_test_class is None: _app_test_class = make_concurrent_app_test_class()
+    at = _app_test_class(APP_PATH, default_timeout=timeout)
+    # streamlit_local_storage blocks until the browser answers; AppTest has no browser, so pre-seed its reply
+    at.session_state["storage_init"] = {USERNAME_STORAGE_KEY: username}
+    return at
+
+
+def current_stage(at):
+    return at.session_state["current_stage"] if "current_stage" in at.session_state else None
+
+
+def assistant_message_count(at):
+    if "messages" not in at.session_state: return 0
+    return sum(1 for m in at.session_state["messages"] if m.get("role") == "assistant")
+
+
+def simulate_respondent(index, options):
+    """Runs one participant journey. Returns a result dict (never raises).
+
+    After a failed turn or survey submit the respondent waits options["retry_wait"] seconds (if set), refreshes and
+    tries again; recovery_seconds holds the time from each first failure to the eventual success. With
+    options["audit"], the result also keeps the messages the respondent saw and whether the survey was submitted
+    (the submit reached the completed page; submits the app reported as failed are counted in survey_submit_failures).
+    """
+    rng = random.Random(options["seed"] + index)
+    journeys = options.get("journeys")
+    answers = journeys[index % len(journeys)] if journeys else None
+    username = f"loadtest_{options['run_id']}_{index:05d}"
+    result = {"username": username, "completed": False, "stage_reached": None, "turn_latencies": [],
+              "turn_finished_at": [], "errors": [], "turn_retries": 0, "survey_submit_failures": 0, "recovery_seconds": [], "journey_seconds": None}
+    started = time.perf_counter()
+    at = None
+    survey_submitted = False
+    try:
+        at = new_app_test(username, options["timeout"])
+        at.run()
+        at.checkbox(key="consent_checkbox").check().run()
+        at.button(key="start_interview_btn").click().run()  # Also fetches the opening question
+
+        turn = 0
+        while current_stage(at) == INTERVIEW_STAGE and turn < options["max_turns"]:
+            if options["think_time"]: time.sleep(rng.uniform(0, options["think_time"]))
+            if answers is not None and turn >= len(answers): break  # Scripted journey ends here (e.g. quit early)
+            answer = answers[turn] if answers is not None else RESPONDENT_ANSWERS[turn % len(RESPONDENT_ANSWERS)]
+            before = assistant_message_count(at)
+            first_failure = None
+            for attempt in range(options["turn_attempts"]):
+                turn_start = time.perf_counter()
+                at.chat_input[0].set_value(answer).run()
+                latency = time.perf_counter() - turn_start
+                if at.exception:
+                    result["errors"].append(f"turn {turn}: {at.exception[0].message}")
+                if assistant_message_count(at) > before or current_stage(at) != INTERVIEW_STAGE:
+                    result["turn_latencies"].append(latency)
+                    result["turn_finished_at"].append(time.time())
+                    if first_failure is not None: result["recovery_seconds"].append(time.perf_counter() - first_failure)
+                    break
+                result["turn_retries"] += 1
+                if first_failure is None: first_failure = turn_start
+                # The app stopped on an API error; a real participant would refresh and answer again
+                if options.get("retry_wait"): time.sleep(options["retry_wait"])
+                at.run()
+            else:
+                result["errors"].append(f"turn {turn}: no reply after {options['turn_attempts']} attempts")
+                break
+            turn += 1
+
+        first_failure = None
+        for attempt in range(options["turn_attempts"]):
+            if current_stage(at) != SURVEY_STAGE: break
+            if attempt:
+                if first_failure is None: first_failure = submit_start
+                if options.get("retry_wait"): time.sleep(options["retry_wait"])
+            for key, value in SURVEY_ANSWERS.items():
+                at.selectbox(key=key).select(value)
+            submit_start = time.perf_counter()
+            at.button[0].click().run()  # The only button on this page: the form submit
+            if current_stage(at) == COMPLETED_STAGE: # The app moves on only once the survey is saved
+                survey_submitted = True
+            else:
+                result["survey_submit_failures"] += 1 # Shown as failed to the respondent, who submits again
+            if first_failure is not None and current_stage(at) == COMPLETED_STAGE:
+                result["recovery_seconds"].append(time.perf_counter() - first_failure)
+
+        result["stage_reached"] = current_stage(at)
+        result["completed"] = result["stage_reached"] == COMPLETED_STAGE
+    except Exception as e:
+        result["errors"].append(f"{type(e).__name__}: {e}")
+        if options.get("verbose"):
+            traceback.print_exc(file=sys.__stderr__)
+            print(f"{username}: stage={current_stage(at)} titles={[t.value for t in at.title]} exc={at.exception}", file=sys.__stderr__)
+    result["journey_seconds"] = time.perf_counter() - started
+    if options.get("audit"):
+        messages = at.session_state["messages"] if at is not None and "messages" in at.session_state else []
+        result["audit"] = {"messages": [(m.get("role"), m.get("content")) for m in messages if m.get("role") != "system"],
+                           "survey_submitted": survey_submitted}
+    return result
+
+
+# --- Worker Process ---
+def run_worker(worker_index, indices, options):
+    """Runs a share of the respondents on a thread pool inside one process and reports process metrics."""
+    sys.path.insert(0, CODE_DIR)
+    os.chdir(options["workdir"])
+    import utils
+    import fake_backends
+    worksheet = fake_backends.install_fake_sheets(utils, fake_backends.FakeWorksheet(options["sheets_latency"]))
+    db = fake_backends.install_fake_firestore(utils) if options["fake_firestore"] else None
+
+    # Warm the interpreter (imports, shared runtime) before taking the baseline
+    with redirect_stdout(io.StringIO()):
+        install_shared_runtime()
+    baseline_rss = current_rss_bytes()
+    sampler = RssSampler(); sampler.start()
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+
+    from concurrent.futures import ThreadPoolExecutor
+    sink = open(os.devnull, "w") if options["quiet_app"] else sys.stdout
+    results = []
+    with redirect_stdout(sink):
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            results = list(pool.map(lambda i: simulate_respondent(i, options), indices))
+
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    sampler.stop()
+    return {
+        "worker": worker_index, "results": results, "wall_seconds": wall, "cpu_seconds": cpu,
+        "baseline_rss": baseline_rss, "peak_rss": sampler.peak, "sessions": len(indices),
+        "concurrency": min(options["concurrency"], len(indices)), "sheet_rows": len(worksheet.rows),
+        "firestore": db.snapshot_counts() if db else None,
+    }
+
+
+def _worker_entry(args):
+    return run_worker(*args)
+
+
+# --- Report ---
+def firestore_per_respondent(worker_reports, sessions):
+    """Average fake-Firestore reads/writes/round trips per respondent (None unless --fake-firestore)."""
+    counts = [w["firestore"] for w in worker_reports if w["firestore"]]
+    if not counts: return None
+    return {key: sum(c[key] for c in counts) / sessions for key in counts[0]}
+
+
+def build_report(worker_reports, wall_seconds, llm_stats):
+    results = [r for w in worker_reports for r in w["results"]]
+    latencies = [lat for r in results for lat in r["turn_latencies"]]
+    completed = sum(1 for r in results if r["completed"])
+    sessions = len(results) or 1
+    cpu_total = sum(w["cpu_seconds"] for w in worker_reports)
+    rss_per_session = [
+        (w["peak_rss"] - w["baseline_rss"]) / w["concurrency"] for w in worker_reports if w["concurrency"]
+    ]
+    return {
+        "respondents": len(results),
+        "completed": completed,
+        "completion_rate": completed / sessions,
+        "wall_seconds": wall_seconds,
+        "throughput_completed_per_minute": completed / wall_seconds * 60 if wall_seconds else None,
+        "throughput_turns_per_second": len(latencies) / wall_seconds if wall_seconds else None,
+        "turn_latency_seconds": {f"p{p}": percentile(latencies, p) for p in (50, 90, 95, 99)},
+        "turn_latency_max_seconds": max(latencies) if latencies else None,
+        "turn_retries": sum(r["turn_retries"] for r in results),
+        "survey_submit_failures": sum(r["survey_submit_failures"] for r in results),
+        "cpu_seconds_per_session": cpu_total / sessions,
+        "rss_bytes_per_session": sum(rss_per_session) / len(rss_per_session) if rss_per_session else None,
+        "peak_rss_bytes_per_process": max((w["peak_rss"] for w in worker_reports), default=None),
+        "sheet_rows_written": sum(w["sheet_rows"] for w in worker_reports),
+        "firestore_per_respondent": firestore_per_respondent(worker_reports, sessions),
+        "stages_reached": {s: sum(1 for r in results if str(r["stage_reached"]) == s) for s in sorted({str(r["stage_reached"]) for r in results})},
+        "errors_sample": [e for r in results for e in r["errors"]][:20],
+        "llm": llm_stats,
+    }
+
+
+def print_report(report):
+    mib = 1024 * 1024
+    lat = report["turn_latency_seconds"]
+    fmt = lambda v: f"{v:.3f}s" if v is not None else "n/a"
+    print("\n=== Load test report ===")
+    print(f"Respondents:       {report['respondents']} ({report['completed']} completed, {report['completion_rate']:.1%})")
+    print(f"Wall time:         {report['wall_seconds']:.1f}s")
+    print(f"Throughput:        {report['throughput_completed_per_minute']:.1f} completed/min, {report['throughput_turns_per_second']:.2f} turns/s")
+    print(f"Turn latency:      p50 {fmt(lat['p50'])}  p90 {fmt(lat['p90'])}  p95 {fmt(lat['p95'])}  p99 {fmt(lat['p99'])}  max {fmt(report['turn_latency_max_seconds'])}")
+    print(f"Turn retries:      {report['turn_retries']} (survey submit failures: {report['survey_submit_failures']})")
+    print(f"CPU per session:   {report['cpu_seconds_per_session']:.3f}s")
+    if report["rss_bytes_per_session"] is not None:
+        print(f"RSS per session:   {report['rss_bytes_per_session'] / mib:.2f} MiB (peak process RSS {report['peak_rss_bytes_per_process'] / mib:.0f} MiB)")
+    print(f"Stages reached:    {report['stages_reached']}")
+    if report["firestore_per_respondent"]:
+        fs = report["firestore_per_respondent"]
+        print(f"Firestore:         {fs['reads']:.1f} reads, {fs['writes']:.1f} writes, {fs['round_trips']:.1f} round trips per respondent")
+    print(f"Mock LLM:          {report['llm']}")
+    if report["errors_sample"]:
+        print("Errors (sample):")
+        for e in report["errors_sample"]: print(f"  - {e}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Load test the interview app with simulated respondents.")
+    parser.add_argument("--respondents", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent sessions per process.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes (each one models a container).")
+    parser.add_argument("--max-turns", type=int, default=20, help="Safety cap on respondent turns per interview.")
+    parser.add_argument("--turn-attempts", type=int, default=3, help="Times a respondent resubmits after an error.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause (s) before each answer.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="AppTest timeout per script run (s).")
+    parser.add_argument("--llm-url", default=None, help="Use an already running mock/real LLM endpoint instead of starting one.")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--interview-turns", type=int, default=6)
+    parser.add_argument("--sheets-latency", type=float, default=0.0, help="Simulated GSheet append latency (s).")
+    parser.add_argument("--fake-firestore", action="store_true", help="Use the in-memory Firestore and report its counters.")
+    parser.add_argument("--workdir", default=None, help="Directory for the app's local data/ backups (default: temp dir).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", default=None, help="Write the report as JSON to this path.")
+    parser.add_argument("--show-app-output", action="store_true", help="Do not silence the app's print output.")
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def run_load_test(args, llm_settings=None, journeys=None):
+    """Runs the configured load test and returns the report dict.
+
+    journeys: optional list of answer lists (one per simulated respondent, cycled), e.g. from recorded cassettes.
+    """
+    import tempfile
+    import cassettes
+    import mock_llm
+
+    server = None
+    llm_stats = None
+    if cassettes.cassette_mode() == "replay":
+        base_url = "cassettes"  # Served by the replay layer; nothing listens
+    elif args.llm_url:
+        base_url = args.llm_url.rstrip("/")
+    else:
+        llm_settings = llm_settings or mock_llm.MockLLMSettings(
+            tokens_per_second=args.tokens_per_second, first_token_latency=args.first_token_latency,
+            error_rate=args.error_rate, interview_turns=args.interview_turns, seed=args.seed)
+        server, base_url = mock_llm.start_in_background(llm_settings)
+    if base_url.startswith("http"):
+        os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+        os.environ["ANTHROPIC_BASE_URL"] = base_url
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST") and not args.fake_firestore:
+        print("Note: FIRESTORE_EMULATOR_HOST not set - Firestore reads/writes will fail fast and be skipped.")
+
+    options = {
+        "run_id": time.strftime("%Y%m%d%H%M%S"), "seed": args.seed, "timeout": args.timeout,
+        "max_turns": args.max_turns, "turn_attempts": args.turn_attempts, "think_time": args.think_time,
+        "sheets_latency": args.sheets_latency, "quiet_app": not args.show_app_output, "verbose": args.verbose,
+        "workdir": args.workdir or tempfile.mkdtemp(prefix="skills_survey_loadtest_"),
+        "concurrency": args.concurrency, "journeys": journeys, "fake_firestore": args.fake_firestore,
+    }
+    processes = max(1, args.processes)
+    shares = [list(range(i, args.respondents, processes)) for i in range(processes)]
+    print(f"Running {args.respondents} respondents in {processes} process(es), {args.concurrency} concurrent sessions each; LLM at {base_url}")
+
+    wall_start = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")  # Clean interpreters: per-process CPU/RSS is not polluted by the mock server
+    with ctx.Pool(processes) as pool:
+        worker_reports = pool.map(_worker_entry, [(i, share, options) for i, share in enumerate(shares) if share])
+    wall = time.perf_counter() - wall_start
+
+    if server:
+        llm_stats = dict(llm_settings.stats)
+        server.shutdown()
+    return build_report(worker_reports, wall, llm_stats)
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    sys.path.insert(0, CODE_DIR)
+    report = run_load_test(args)
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# memory_benchmark.py
+# Per-session memory of the chat history, before and after the compact message store.
+#
+#   legacy  -> session layout before message_store: one dict per message (incl. a per-session system prompt dict)
+#              plus the formatted transcript kept in session state for the GSheet save
+#   compact -> message_store.MessageStore of slotted records, shared system prompt record, transcript derived on demand
+#
+# Default: drives real app sessions (AppTest through loadtest, mock LLM, in-memory Sheets and Firestore) to the end of
+# the interview and measures message_store.session_footprint of their session state as the app holds it (compact),
+# and of the same state with the history converted back to the legacy layout.
+# --simulated: RSS of N sessions built directly in both layouts (no app code runs, so only the data structures are
+# compared); each (layout, N) pair runs in a fresh subprocess so RSS deltas are not polluted by earlier runs.
+#
+# Usage:  python memory_benchmark.py --app-sessions 20 --turns 30
+#         python memory_benchmark.py --simulated --sessions 100 500 1000 --turns 30
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def current_rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def simulated_turns(session_index, turns, answer_chars, question_chars):
+    """Unique (per session) respondent/interviewer texts of realistic length."""
+    for turn in range(turns):
+        question = f"[s{session_index} t{turn}] " + ("Could you tell me more about that experience? " * (question_chars // 46 + 1))[:question_chars]
+        answer = f"[s{session_index} t{turn}] " + ("I think it mostly depends on the kind of job and the team. " * (answer_chars // 59 + 1))[:answer_chars]
+        yield question, answer
+
+
+def widget_state():
+    # Survey widget values and flags that every session carries in both layouts
+    return {"age": "21", "gender": "Prefer not to say", "major": "Economics", "year": "Third Year", "gpa": "7.5",
+            "student_nis": "", "learning_enjoyment_slider": 50, "university_enjoyment_slider": 50,
+            "ai_usage_slider": 50, "ai_model": "", "consent_given": True, "current_stage": "survey",
+            "interview_active": False, "interview_completed_flag": True, "survey_completed_flag": False}
+
+
+def build_legacy_session(index, args, config):
+    messages = [{"role": "system", "content": config.SYSTEM_PROMPT}]
+    for question, answer in simulated_turns(index, args.turns, args.answer_chars, args.question_chars):
+        messages.append({"role": "assistant", "content": question})
+        messages.append({"role": "user", "content": answer})
+    transcript = "\n---\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages if m["role"] != "system")
+    return {"messages": messages, "current_formatted_transcript_for_gsheet": transcript, **widget_state()}
+
+
+def build_compact_session(index, args, message_store):
+    messages = message_store.MessageStore([message_store.SYSTEM_MESSAGE])
+    for question, answer in simulated_turns(index, args.turns, args.answer_chars, args.question_chars):
+        messages.append({"role": "assistant", "content": question})
+        messages.append({"role": "user", "content": answer})
+    return {"messages": messages, "transcript_final": True, **widget_state()}
+
+
+def measure(layout, sessions, args):
+    """Runs inside the child process: builds the sessions and reports RSS and accounted bytes."""
+    sys.path.insert(0, CODE_DIR)
+    import config
+    import message_store
+    baseline = current_rss_bytes()
+    if layout == "legacy":
+        store = [build_legacy_session(i, args, config) for i in range(sessions)]
+    else:
+        store = [build_compact_session(i, args, message_store) for i in range(sessions)]
+    rss_delta = current_rss_bytes() - baseline
+    accounted = message_store.session_footprint(store[0].items())[0]
+    return {"layout": layout, "sessions": sessions, "rss_delta_bytes": rss_delta,
+            "rss_bytes_per_session": rss_delta / sessions, "accounted_bytes_per_session": accounted}
+
+
+def legacy_state(state, config, message_store):
+    """The session state as the app held it before message_store: message dicts and the formatted transcript."""
+    messages = [m.to_dict() for m in state["messages"]]
+    if not messages or messages[0]["role"] != "system": messages.insert(0, {"role": "system", "content": config.SYSTEM_PROMPT})
+    transcript = message_store.format_transcript(messages)
+    return {**state, "messages": messages, "current_formatted_transcript_for_gsheet": transcript}
+
+
+def measure_app(args):
+    """Drives args.app_sessions app sessions to the end of the interview; accounted bytes per session, both layouts."""
+    sys.path.insert(0, CODE_DIR)
+    import config
+    import fake_backends
+    import loadtest
+    import message_store
+    import mock_llm
+    import utils
+    os.chdir(tempfile.mkdtemp(prefix="memory_benchmark_"))
+    settings = mock_llm.MockLLMSettings(tokens_per_second=1e6, first_token_latency=0, interview_turns=args.turns)
+    server, base_url = mock_llm.start_in_background(settings)
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"; os.environ["ANTHROPIC_BASE_URL"] = base_url
+    fake_backends.install_fake_sheets(utils); fake_backends.install_fake_firestore(utils)
+    loadtest.install_shared_runtime()
+    compact, legacy, message_counts = [], [], []
+    try:
+        for index in range(args.app_sessions):
+            with redirect_stdout(io.StringIO()):
+                at = loadtest.new_app_test(f"memory_{index}", 60); at.run()
+                at.checkbox(key="consent_checkbox").check().run()
+                at.button(key="start_interview_btn").click().run()
+                for _, answer in simulated_turns(index, args.turns + 2, args.answer_chars, 0):
+                    if loadtest.current_stage(at) != "interview": break
+                    at.chat_input[0].set_value(answer).run()
+            if at.exception: raise RuntimeError(f"session {index}: {at.exception[0].message}")
+            state = dict(at.session_state.filtered_state) # What st.session_state.items() yields in the app
+            compact.append(message_store.session_footprint(state.items())[0])
+            legacy.append(message_store.session_footprint(legacy_state(state, config, message_store).items())[0])
+            message_counts.append(len(state["messages"]))
+    finally:
+        server.shutdown()
+    return {"sessions": args.app_sessions, "messages_per_session": sum(message_counts) / len(message_counts),
+            "legacy_bytes_per_session": sum(legacy) / len(legacy), "compact_bytes_per_session": sum(compact) / len(compact)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-session memory: legacy dict history vs compact message store.")
+    parser.add_argument("--app-sessions", type=int, default=20, help="App sessions to drive (default mode).")
+    parser.add_argument("--simulated", action="store_true", help="Compare RSS of directly built sessions instead.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100, 500, 1000], help="Session counts (--simulated).")
+    parser.add_argument("--turns", type=int, default=30, help="Interview turns per session.")
+    parser.add_argument("--answer-chars", type=int, default=300)
+    parser.add_argument("--question-chars", type=int, default=250)
+    parser.add_argument("--child", nargs=2, metavar=("LAYOUT", "SESSIONS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], int(args.child[1]), args)))
+        return
+    if not args.simulated:
+        row = measure_app(args)
+        print(f"App sessions: {row['sessions']}, driven to the end of a {args.turns}-turn interview "
+              f"({row['messages_per_session']:.0f} messages each, answers ~{args.answer_chars} chars)\n")
+        print(f"{'layout':>8} {'accounted/session':>18}")
+        for layout in ("legacy", "compact"):
+            print(f"{layout:>8} {row[f'{layout}_bytes_per_session'] / 1024:>16.1f}KiB")
+        return
+
+    rows = []
+    for sessions in args.sessions:
+        for layout in ("legacy", "compact"):
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", layout, str(sessions), "--turns", str(args.turns),
+                   "--answer-chars", str(args.answer_chars), "--question-chars", str(args.question_chars)]
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+            rows.append(json.loads(out.strip().splitlines()[-1]))
+
+    mib = 1024 * 1024
+    print(f"Turns per session: {args.turns} (answers ~{args.answer_chars} chars, questions ~{args.question_chars} chars)\n")
+    print(f"{'sessions':>8} {'layout':>8} {'RSS delta':>12} {'RSS/session':>12} {'accounted/session':>18}")
+    for row in rows:
+        print(f"{row['sessions']:>8} {row['layout']:>8} {row['rss_delta_bytes'] / mib:>10.1f}MiB "
+              f"{row['rss_bytes_per_session'] / 1024:>10.1f}KiB {row['accounted_bytes_per_session'] / 1024:>16.1f}KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# message_store.py
+# Compact per-session chat history: slotted message records, one shared system prompt record per process and study,
+# transcript formatting on demand, and a memory-accounting helper (bytes held by one session).
+import sys
+
+import config
+
+
+class Message:
+    """One chat message. Slotted (no per-instance __dict__); supports the dict-style reads used across the app."""
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = sys.intern(role) if isinstance(role, str) else role
+        self.content = content
+
+    def get(self, key, default=None):
+        if key == "role": return self.role
+        if key == "content": return self.content
+        return default
+
+    def __getitem__(self, key):
+        if key in ("role", "content"): return getattr(self, key)
+        raise KeyError(key)
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+    def __eq__(self, other):
+        if isinstance(other, Message): return self.role == other.role and self.content == other.content
+        if isinstance(other, dict): return other == self.to_dict()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.role, self.content))
+
+    def __repr__(self):
+        return f"Message(role={self.role!r}, content={self.content[:40]!r}...)" if len(self.content) > 40 else f"Message(role={self.role!r}, content={self.content!r})"
+
+
+# Shared by every session in the process (a system prompt is never copied per session); one record per study prompt
+_system_messages = {}
+
+
+def shared_system_message(prompt):
+    """The process-wide system message record for a prompt (created on first use)."""
+    message = _system_messages.get(prompt)
+    if message is None:
+        message = _system_messages.setdefault(prompt, Message("system", sys.intern(prompt)))
+    return message
+
+
+SYSTEM_MESSAGE = shared_system_message(config.SYSTEM_PROMPT) # The built-in study's (studies.py)
+
+
+def to_message(message):
+    """Coerces a {'role', 'content'} dict (or Message) to a Message, reusing the shared system prompt records."""
+    if isinstance(message, Message): return message
+    role, content = message.get("role"), message.get("content", "")
+    if role == "system" and content in _system_messages: return _system_messages[content]
+    return Message(role, content)
+
+
+class MessageStore(list):
+    """List of Message records; dicts appended/inserted are converted on the way in."""
+    __slots__ = ()
+
+    def __init__(self, messages=()):
+        super().__init__(to_message(m) for m in messages)
+
+    def append(self, message):
+        super().append(to_message(message))
+
+    def insert(self, index, message):
+        super().insert(index, to_message(message))
+
+    def extend(self, messages):
+        super().extend(to_message(m) for m in messages)
+
+    def for_api(self, api, system_message=SYSTEM_MESSAGE):
+        """Message dicts for a provider call (Anthropic takes the system prompt separately)."""
+        if api == "anthropic":
+            return [m.to_dict() for m in self if m.role != "system"]
+        if not self or self[0].role != "system": # History stored for Anthropic, routed to OpenAI
+            return [system_message.to_dict()] + [m.to_dict() for m in self]
+        return [m.to_dict() for m in self]
+
+
+def is_displayable(message, closing_messages=None):
+    """False for the system prompt, closing codes and their pre-written closing messages."""
+    closing_messages = config.CLOSING_MESSAGES if closing_messages is None else closing_messages
+    content = message.get("content", "")
+    if message.get("role") == "system": return False
+    if content in closing_messages: return False
+    return content not in closing_messages.values()
+
+
+def display_window(messages, count, closing_messages=None):
+    """(start, has_earlier) for rendering the last `count` displayable messages: messages[start:] holds them, and
+    has_earlier tells whether displayable messages come before. Walks back from the end, so the cost depends on
+    `count`, not on the length of the interview."""
+    start, shown = len(messages), 0
+    while start > 0 and shown < count:
+        start -= 1
+        if is_displayable(messages[start], closing_messages): shown += 1
+    has_earlier = any(is_displayable(messages[i], closing_messages) for i in range(start - 1, -1, -1))
+    return start, has_earlier
+
+
+def format_transcript(messages, closing_messages=None):
+    """Formats the interview for storage ('Role: content' blocks separated by '---'), derived on demand."""
+    lines = [f"{(message.get('role') or 'Unknown').capitalize()}: {message.get('content', '')}"
+             for message in messages if is_displayable(message, closing_messages)]
+    return "\n---\n".join(lines)
+
+
+# --- Memory Accounting ---
+def _shared_object_ids():
+    return {id(obj) for message in list(_system_messages.values()) for obj in (message, message.content, message.role)}
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes reachable from obj (containers, Message records, strings), counting each object once.
+
+    Objects shared process-wide (the system prompt records) are excluded: they are not paid per session.
+    """
+    if seen is None: seen = _shared_object_ids()
+    stack, total = [obj], 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen: continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys()); stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif isinstance(current, Message):
+            stack.append(current.role); stack.append(current.content)
+    return total
+
+
+def session_footprint(state_items):
+    """Bytes per session-state key and in total, for an iterable of (key, value) pairs."""
+    seen = _shared_object_ids()
+    per_key = {str(key): deep_sizeof(value, seen) for key, value in state_items}
+    return sum(per_key.values()), per_key
@@ -0,0 +1,296 @@
+# mock_llm.py
+# Scriptable stand-in for the OpenAI / Anthropic HTTP APIs, used by the load-test harness (loadtest.py).
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 or ANTHROPIC_BASE_URL=http://127.0.0.1:<port>
+# (both SDKs read these environment variables when no base_url is passed).
+#
+# Run standalone:  python mock_llm.py --port 8765 --tokens-per-second 40 --error-rate 0.02
+#
+# Faults for chaos/soak testing (soak_test.py): injected HTTP errors (--error-rate), latency spikes before the first
+# token (--latency-spike-rate) and streams dropped mid-reply (--drop-stream-rate; the connection closes without the
+# final chunk, as when a proxy or the provider cuts it).
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Scripted Interview ---
+OPENING_QUESTION = (
+    "Hello! Thanks for taking the time to speak with me today. To begin, could you share a bit about your "
+    "career aspirations after university? What kind of job or field are you aiming for?"
+)
+DEFAULT_QUESTION = (
+    "Thank you, that is helpful. Could you tell me a bit more about why that matters to you, "
+    "and perhaps give a concrete example from your studies or work experience?"
+)
+SUMMARY_MESSAGE = (
+    "To summarise: you aim for a career in your field, you value analytical and communication skills, "
+    "and you see AI as changing which skills matter. To conclude our conversation, how well does this brief "
+    "summary capture our discussion about your perspectives: 1 (poorly), 2 (partially), 3 (well), 4 (very well). "
+    "Please only reply with the associated number."
+)
+END_CODE = "x7y8"
+ANTHROPIC_KICKOFF = "Please begin the interview."
+
+
+def count_respondent_turns(messages):
+    """Number of genuine respondent messages in a request (ignores the Anthropic kickoff message)."""
+    return sum(1 for m in messages if m.get("role") == "user" and m.get("content") != ANTHROPIC_KICKOFF)
+
+
+def scripted_reply(messages, interview_turns):
+    """Deterministic interviewer reply: questions, then the summary, then the end code."""
+    turns = count_respondent_turns(messages)
+    if turns < interview_turns:
+        return DEFAULT_QUESTION if turns else OPENING_QUESTION
+    if turns == interview_turns:
+        return SUMMARY_MESSAGE
+    return END_CODE
+
+
+class MockLLMSettings:
+    """Tunable behaviour of the mock server (read on every request, so it can be changed while running)."""
+
+    def __init__(self, tokens_per_second=50.0, first_token_latency=0.3, error_rate=0.0,
+                 error_statuses=(429, 500), interview_turns=6, seed=None,
+                 latency_spike_rate=0.0, latency_spike_seconds=5.0, drop_stream_rate=0.0):
+        self.tokens_per_second = tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.interview_turns = interview_turns
+        self.latency_spike_rate = latency_spike_rate
+        self.latency_spike_seconds = latency_spike_seconds
+        self.drop_stream_rate = drop_stream_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0, "streams": 0, "latency_spikes": 0, "streams_dropped": 0}
+
+    def record(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def roll_error(self):
+        """Returns an HTTP status to fail this request with, or None."""
+        with self.lock:
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return self.rng.choice(self.error_statuses)
+        return None
+
+    def roll_latency_spike(self):
+        """Returns extra seconds to wait before the first token (0 when no spike)."""
+        with self.lock:
+            if self.latency_spike_rate and self.rng.random() < self.latency_spike_rate:
+                self.stats["latency_spikes"] += 1
+                return self.latency_spike_seconds
+        return 0.0
+
+    def roll_drop_stream(self):
+        """Returns the fraction of the reply to stream before dropping the connection, or None."""
+        with self.lock:
+            if self.drop_stream_rate and self.rng.random() < self.drop_stream_rate:
+                self.stats["streams_dropped"] += 1
+                return self.rng.uniform(0.1, 0.9)
+        return None
+
+
+def split_tokens(text):
+    """Splits a reply into word-sized chunks that keep their whitespace (so concatenation is lossless)."""
+    tokens, current = [], ""
+    for ch in text:
+        current += ch
+        if ch == " ":
+            tokens.append(current); current = ""
+    if current: tokens.append(current)
+    return tokens
+
+
+class _DroppedStream(Exception):
+    """Raised inside a handler to cut a stream short (injected fault)."""
+
+
+# --- HTTP Handler ---
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = None  # Set by make_server
+
+    def log_message(self, format, *args):
+        pass  # Keep load-test output readable
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client dropped an idle keep-alive connection (e.g. the SDK retrying after a dropped stream)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_sse(self):
+        # Chunked like the real APIs, so a dropped stream (no final chunk) is an error for the client, not a short reply
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _write_sse(self, data, event=None):
+        prefix = f"event: {event}\n" if event else ""
+        payload = f"{prefix}data: {data}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _end_sse(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _stream_tokens(self, reply):
+        """Yields the reply's tokens at the configured rate; stops early (without ending the stream) on a drop."""
+        tokens = split_tokens(reply)
+        drop_at = self.settings.roll_drop_stream()
+        cutoff = int(len(tokens) * drop_at) if drop_at is not None else None
+        for i, token in enumerate(tokens):
+            if cutoff is not None and i >= cutoff: raise _DroppedStream()
+            time.sleep(self._token_delay())
+            yield token
+        if cutoff is not None: raise _DroppedStream() # Empty reply
+
+    def _token_delay(self):
+        rate = self.settings.tokens_per_second
+        return 1.0 / rate if rate and rate > 0 else 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON", "type": "invalid_request_error"}}); return
+
+        self.settings.record("requests")
+        error_status = self.settings.roll_error()
+        if error_status:
+            self.settings.record("errors_injected")
+            self._send_json(error_status, {"error": {"message": f"Injected error {error_status}", "type": "mock_error"}})
+            return
+
+        reply = scripted_reply(request.get("messages", []), self.settings.interview_turns)
+        time.sleep(self.settings.first_token_latency + self.settings.roll_latency_spike())
+
+        try:
+            if self.path.rstrip("/").endswith("/chat/completions"):
+                self._handle_openai(request, reply)
+            elif self.path.rstrip("/").endswith("/messages"):
+                self._handle_anthropic(request, reply)
+            else:
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # Client stopped reading early (e.g. after a closing code)
+        except _DroppedStream:
+            self.close_connection = True  # Injected fault: close without the final chunk
+
+    def _handle_openai(self, request, reply):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "mock")
+        created = int(time.time())
+        if not request.get("stream"):
+            time.sleep(self._token_delay() * len(split_tokens(reply)))
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+        self.settings.record("streams")
+        self._start_sse()
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+        self._write_sse(json.dumps({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}))
+        for token in self._stream_tokens(reply):
+            self._write_sse(json.dumps({**base, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}))
+        self._write_sse(json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        self._write_sse("[DONE]")
+        self._end_sse()
+
+    def _handle_anthropic(self, request, reply):
+        message_id = f"msg_{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "mock")
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        if not request.get("stream"):
+            time.sleep(self._token_delay() * len(split_tokens(reply)))
+            self._send_json(200, {
+                "id": message_id, "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": reply}], "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+            })
+            return
+        self.settings.record("streams")
+        self._start_sse()
+        self._write_sse(json.dumps({"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+            "stop_reason": None, "stop_sequence": None, "usage": usage}}), event="message_start")
+        self._write_sse(json.dumps({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}), event="content_block_start")
+        for token in self._stream_tokens(reply):
+            self._write_sse(json.dumps({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}), event="content_block_delta")
+        self._write_sse(json.dumps({"type": "content_block_stop", "index": 0}), event="content_block_stop")
+        self._write_sse(json.dumps({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 0}}), event="message_delta")
+        self._write_sse(json.dumps({"type": "message_stop"}), event="message_stop")
+        self._end_sse()
+
+
+def make_server(settings, host="127.0.0.1", port=0):
+    """Creates (but does not start) a threaded mock server; port 0 picks a free port."""
+    handler = type("BoundMockLLMHandler", (MockLLMHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(settings, host="127.0.0.1", port=0):
+    """Starts the mock server on a daemon thread. Returns (server, base_url)."""
+    server = make_server(settings, host, port)
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Anthropic server for load testing the interview app.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="Seconds before the first token.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed with an injected error.")
+    parser.add_argument("--error-statuses", default="429,500", help="Comma-separated HTTP statuses to inject.")
+    parser.add_argument("--interview-turns", type=int, default=6, help="Respondent turns before the summary.")
+    parser.add_argument("--latency-spike-rate", type=float, default=0.0, help="Fraction of requests delayed by a latency spike.")
+    parser.add_argument("--latency-spike-seconds", type=float, default=5.0)
+    parser.add_argument("--drop-stream-rate", type=float, default=0.0, help="Fraction of streams cut off mid-reply.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = MockLLMSettings(
+        tokens_per_second=args.tokens_per_second, first_token_latency=args.first_token_latency,
+        error_rate=args.error_rate, error_statuses=[int(s) for s in args.error_statuses.split(",") if s],
+        interview_turns=args.interview_turns, seed=args.seed, latency_spike_rate=args.latency_spike_rate,
+        latency_spike_seconds=args.latency_spike_seconds, drop_stream_rate=args.drop_stream_rate,
+    )
+    server = make_server(settings, args.host, args.port)
+    print(f"Mock LLM listening on http://{args.host}:{args.port} (OpenAI base URL: http://{args.host}:{args.port}/v1)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Mock LLM stats: {settings.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# profiling.py
+# Opt-in timing spans per script run, exported as Chrome trace events (open in https://ui.perfetto.dev or
+# chrome://tracing), with optional cProfile output per run.
+#
+#   APP_PROFILE=1 streamlit run app.py          every session is traced
+#   APP_PROFILE=cprofile streamlit run app.py   ... and every run is also cProfiled (one .prof per run)
+#   ?profile=1 / ?profile=cprofile in the URL   the same, for that session only (needs APP_PROFILE_ALLOW_QUERY=1)
+#
+# Traces are appended to {PROFILE_DIR}/trace_{pid}.json (JSON array format; an unterminated array is valid for the
+# viewers, so the file can be read while the app runs). One track (tid) per session.
+#
+# cProfile covers one run at a time per process (Python 3.12 allows a single active profiler): a run that asks for it
+# while another run holds it is traced without cProfile.
+# From Python 3.12 (sys.monitoring) that profiler records every thread in the process, not only the run's script
+# thread (checked on 3.12.1 and 3.13.0; 3.11 records only the enabling thread). Its .prof then includes whatever other
+# sessions executed during the run, and is named process_run_*.prof instead of run_*.prof to say so. For one session's
+# own time, use its trace spans.
+#
+# When a run is not traced, span()/start_span() return after one thread-local lookup and traced functions call
+# straight through.
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+PROFILE_ENV = "APP_PROFILE"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_ALLOW_QUERY_ENV = "APP_PROFILE_ALLOW_QUERY" # Participants could otherwise switch on disk-writing profiling
+PROFILE_DIR = os.environ.get("APP_PROFILE_DIR", os.path.join("data", "profiles"))
+
+class _ThreadState(threading.local):
+    run = None # The traced run on this (script) thread, if any; a class default keeps the lookup exception-free
+
+
+_local = _ThreadState()
+_write_lock = threading.Lock()
+_trace_file = None
+_unfinished_runs = {} # session id -> run not closed by end_run() (stopped early; reruns may use another thread)
+_run_numbers = {} # session id -> runs traced so far
+_cprofile_run = None # The run holding the process's cProfile, if any
+CPROFILE_PROCESS_WIDE = sys.version_info >= (3, 12) # cProfile records all threads, see the header
+
+
+class _NoopSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+_NOOP = _NoopSpan()
+
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+
+def _emit(event):
+    global _trace_file
+    with _write_lock:
+        if _trace_file is None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"trace_{os.getpid()}.json")
+            _trace_file = open(path, "a", encoding="utf-8")
+            if _trace_file.tell() == 0: _trace_file.write("[\n")
+            print(f"Profiling: writing trace events to {path}")
+        _trace_file.write(json.dumps(event) + ",\n")
+        _trace_file.flush()
+
+
+class _Run:
+    def __init__(self, session_id, run_number):
+        self.session_id = session_id
+        self.tid = abs(hash(session_id)) % 1_000_000
+        self.run_number = run_number
+        self.thread = threading.current_thread()
+        self.finished = False
+        self.started_us = _now_us()
+        self.last_activity_us = self.started_us
+        self.open_spans = [] # Started with start_span() and not ended yet
+        self.profile = None # Set by _enable_cprofile()
+
+    def complete(self, name, started_us, ended_us, args=None):
+        self.last_activity_us = max(self.last_activity_us, ended_us)
+        _emit({"name": name, "ph": "X", "ts": started_us, "dur": max(0, ended_us - started_us), "pid": os.getpid(),
+               "tid": self.tid, "args": args or {}})
+
+
+class _Span:
+    __slots__ = ("run", "name", "args", "started_us")
+
+    def __init__(self, run, name, args):
+        self.run, self.name, self.args, self.started_us = run, name, args, _now_us()
+
+    def __enter__(self): return self
+
+    def __exit__(self, exc_type, exc, tb):
+        args = self.args
+        if exc_type is not None: args = {**args, "exit": exc_type.__name__} # StopException/RerunException show up here
+        self.run.complete(self.name, self.started_us, _now_us(), args)
+        return False
+
+
+def _requested_mode():
+    mode = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if os.environ.get(PROFILE_ALLOW_QUERY_ENV, "").strip() == "1":
+        try:
+            import streamlit as st
+            mode = (st.query_params.get(PROFILE_QUERY_PARAM) or mode).strip().lower()
+        except Exception:
+            pass
+    return None if mode in ("", "0", "off", "false") else mode
+
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        if ctx: return ctx.session_id
+    except Exception:
+        pass
+    return f"thread-{threading.get_ident()}"
+
+
+def begin_run():
+    """Call at the top of the script. Also closes the session's previous run if st.stop()/st.rerun() cut it short."""
+    _local.run = None
+    session_id = _session_id()
+    with _write_lock:
+        previous = _unfinished_runs.get(session_id)
+        if previous is not None and (previous.thread is threading.current_thread() or not previous.thread.is_alive()):
+            del _unfinished_runs[session_id]
+        else:
+            previous = None # Still running elsewhere (only happens when sessions share an id, as under AppTest)
+    if previous is not None: _finish(previous, previous.last_activity_us) # Ends at its last recorded activity
+    mode = _requested_mode()
+    if mode is None: return
+    with _write_lock:
+        _run_numbers[session_id] = _run_numbers.get(session_id, 0) + 1
+        run = _Run(session_id, _run_numbers[session_id])
+        _unfinished_runs[session_id] = run
+    if mode == "cprofile": run.profile = _enable_cprofile(run)
+    _local.run = run
+
+
+def _enable_cprofile(run):
+    """An enabled cProfile for run, or None (with a warning) while another run or profiling tool holds the profiler."""
+    global _cprofile_run
+    with _write_lock:
+        holder = _cprofile_run
+    if holder is not None and not holder.thread.is_alive():
+        _finish(holder, holder.last_activity_us) # Cut short by st.stop()/st.rerun(), and its session has not come back
+    with _write_lock:
+        if _cprofile_run is not None:
+            print("Profiling: another run is being cProfiled; tracing this run without cProfile.")
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e: # "Another profiling tool is already active" (e.g. a debugger)
+            print(f"Profiling: cProfile unavailable ({e}); tracing this run without it.")
+            return None
+        _cprofile_run = run
+        return profile
+
+
+def end_run():
+    """Call at the end of the script: closes open spans, the run span and the run's cProfile."""
+    run = _local.run
+    if run is None: return
+    _local.run = None
+    with _write_lock:
+        if _unfinished_runs.get(run.session_id) is run: del _unfinished_runs[run.session_id]
+    _finish(run, _now_us())
+
+
+def _finish(run, ended_us):
+    global _cprofile_run
+    with _write_lock: # A stale run can be finished by its own session and by _enable_cprofile() at once
+        if run.finished: return
+        run.finished = True
+    for span in reversed(run.open_spans):
+        run.complete(span.name, span.started_us, ended_us, span.args)
+    run.complete("script run", run.started_us, ended_us, {"session": run.session_id, "run": run.run_number})
+    if run.profile:
+        run.profile.disable()
+        with _write_lock:
+            if _cprofile_run is run: _cprofile_run = None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        session = "".join(c for c in run.session_id if c.isalnum())[:8]
+        prefix = "process_run" if CPROFILE_PROCESS_WIDE else "run"
+        run.profile.dump_stats(os.path.join(PROFILE_DIR, f"{prefix}_{session}_{run.run_number:04d}.prof"))
+
+
+def span(name, **args):
+    """Context manager timing a section of the current run (no-op when the run is not traced)."""
+    run = _local.run
+    if run is None: return _NOOP
+    return _Span(run, name, args)
+
+
+def start_span(name, **args):
+    """Starts a span that ends with end_span() or, at the latest, with the run (for sections that st.stop()/st.rerun() may cut short)."""
+    run = _local.run
+    if run is None: return None
+    started = _Span(run, name, args)
+    run.open_spans.append(started)
+    return started
+
+
+def end_span(started, **args):
+    if started is None: return
+    run = started.run
+    if started in run.open_spans: run.open_spans.remove(started)
+    run.complete(started.name, started.started_us, _now_us(), {**started.args, **args})
+
+
+def instant(name, **args):
+    """Marks a point in time on the run's track (e.g. first streamed token)."""
+    run = _local.run
+    if run is None: return
+    _emit({"name": name, "ph": "i", "s": "t", "ts": _now_us(), "pid": os.getpid(), "tid": run.tid, "args": args})
+
+
+def traced(func):
+    """Decorator: times each call as a span named after the function when the run is traced."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _local.run
+        if run is None: return func(*args, **kwargs)
+        with _Span(run, name, {}):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,68 @@
+# routing.py
+# Adaptive model routing: a low-latency model (config.MODEL) for routine probing turns, a stronger model
+# (config.MODEL_STRONG) for the summary step of the interview outline and other configured triggers. A study bundle
+# (studies.py) may set its own pair of models and summary triggers; without one the config.py values apply.
+import config
+
+SUMMARY_GIVEN_MARKER = "how well does this brief summary capture" # From the outline's summary step; the rating follows
+
+
+def provider_for_model(model):
+    """'openai' or 'anthropic' from the model name (same rule app.py always used), None if unknown."""
+    name = (model or "").lower()
+    if "gpt" in name: return "openai"
+    if "claude" in name: return "anthropic"
+    return None
+
+
+def _models(study):
+    if study is None: return config.MODEL, config.MODEL_STRONG
+    return study.model, study.model_strong
+
+
+def routed_models(study=None):
+    """Every model a turn can be routed to."""
+    model, model_strong = _models(study)
+    models = [model]
+    if config.ROUTING_ENABLED and model_strong not in models: models.append(model_strong)
+    return models
+
+
+def providers_in_use(study=None):
+    """Providers whose clients must be initialised."""
+    return {provider_for_model(model) for model in routed_models(study)}
+
+
+def _contains_any(text, phrases):
+    text = (text or "").lower()
+    return any(phrase.lower() in text for phrase in phrases)
+
+
+def choose_model(messages, study=None):
+    """Returns (model, reason) for the next interviewer reply given the history (user message already appended)."""
+    model, model_strong = _models(study)
+    summary_triggers = study.routing_summary_triggers if study is not None else config.ROUTING_SUMMARY_TRIGGERS
+    if not config.ROUTING_ENABLED:
+        return model, "routing disabled"
+
+    respondent_turns = 0
+    summary_phase = False
+    summary_given = False
+    last_user = ""
+    for message in messages:
+        role, content = message.get("role"), message.get("content", "")
+        if role == "user":
+            respondent_turns += 1; last_user = content
+        elif role == "assistant":
+            if _contains_any(content, [SUMMARY_GIVEN_MARKER]): summary_given = True
+            elif _contains_any(content, summary_triggers): summary_phase = True
+
+    if summary_given:
+        return model, "after summary" # Only the rating/closing code is left
+    if _contains_any(last_user, config.ROUTING_USER_TRIGGERS):
+        return model_strong, "summary requested"
+    if summary_phase:
+        return model_strong, "summary phase"
+    if config.ROUTING_ESCALATE_AFTER_TURNS and respondent_turns >= config.ROUTING_ESCALATE_AFTER_TURNS:
+        return model_strong, f"turn {respondent_turns}"
+    return model, "routine"
@@ -0,0 +1,288 @@
+# search_index.py
+# Offline TF-IDF search over respondent answers ("who else said something like this?").
+#
+# Every respondent answer (one turn, see analytics.split_turns) is a document. The index lives in a directory:
+#   manifest.json            segments, document count, indexed usernames, and the files of its generation
+#   vocab_GGGGG.json         term -> id
+#   df_GGGGG.npy             document frequency per term id
+#   seg_NNNNN/               one immutable segment per batch added, stored term-major (CSC) so a query only touches
+#                            the postings of its own terms: indptr.npy, doc_ids.npy, tf.npy (1 + log tf),
+#                            norms_GGGGG.npy (TF-IDF row norms, rewritten when document frequencies change),
+#                            docs.jsonl + doc_offsets.npy (answer text and where each record starts)
+# Arrays are memory-mapped on open. Adding interviews writes a new segment; past MAX_SEGMENTS they are merged into one.
+# One writer at a time. Each commit writes its vocabulary, document frequencies and norms under a new generation
+# number GGGGG and then replaces manifest.json, which is the only publish step: readers see either the old or the
+# new generation, never a mix. The previous generation's files and merged-away segments are kept for readers that
+# opened its manifest, and removed by the commit after.
+# The index is only updated by running `add` on an export; completing an interview does not update it.
+#
+# Usage (from the code folder):
+#   python search_index.py add pilot_survey_results.csv      # index interviews not indexed yet
+#   python search_index.py query "I learn more from internships than from courses" -k 10
+#   python search_index.py rebuild pilot_survey_results.csv  # from scratch
+# Exports holding transcript references are read from config.TRANSCRIPT_BLOB_STORE or --blob-store (see blob_store.py).
+# For a study bundle's results sheet add --study <id> (column layout and outline from the bundle, see analytics.py).
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+import shutil
+import time
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+import analytics
+import blob_store
+import studies
+
+DEFAULT_INDEX_DIR = os.path.join("data", "search_index")
+MAX_SEGMENTS = 8
+MIN_TOKEN_LENGTH = 2
+GENERATION_FILE_PATTERN = re.compile(r"(?:vocab|df|norms)(?:_(\d+))?\.(?:json|npy)") # Unnumbered: generation 0 (older indexes)
+
+
+def tokenize(text):
+    return [w for w in analytics.WORD_PATTERN.findall(text.lower()) if len(w) >= MIN_TOKEN_LENGTH and w not in analytics.STOPWORDS]
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(payload, ensure_ascii=False))
+    os.replace(tmp_path, path)
+
+
+def _write_array(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _generation_file(stem, generation, extension):
+    return f"{stem}_{generation:05d}.{extension}"
+
+
+class Segment:
+    """Read-only view of one segment directory (arrays memory-mapped)."""
+
+    def __init__(self, path, norms_file="norms.npy"):
+        self.path = path
+        self.indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(path, "doc_ids.npy"), mmap_mode="r")
+        self.tf = np.load(os.path.join(path, "tf.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, norms_file), mmap_mode="r") if os.path.exists(os.path.join(path, norms_file)) else None
+        self.n_terms = len(self.indptr) - 1
+        self.n_docs = len(self.doc_offsets)
+
+    def matrix(self, n_terms):
+        """docs x terms CSC matrix, padded to the current vocabulary size."""
+        indptr = np.concatenate([self.indptr, np.full(n_terms - self.n_terms, self.indptr[-1], dtype=np.int64)])
+        return sparse.csc_matrix((np.asarray(self.tf), np.asarray(self.doc_ids), indptr), shape=(self.n_docs, n_terms))
+
+    def compute_norms(self, idf):
+        term_of_entry = np.repeat(np.arange(self.n_terms), np.diff(self.indptr))
+        squared = (np.asarray(self.tf, dtype=np.float64) * idf[term_of_entry]) ** 2
+        return np.sqrt(np.bincount(self.doc_ids, weights=squared, minlength=self.n_docs)).astype(np.float32)
+
+    def doc(self, doc_id):
+        with open(os.path.join(self.path, "docs.jsonl"), "rb") as f:
+            f.seek(int(self.doc_offsets[doc_id]))
+            return json.loads(f.readline())
+
+    def iter_docs(self):
+        with open(os.path.join(self.path, "docs.jsonl"), "rb") as f:
+            for line in f: yield json.loads(line)
+
+
+class SearchIndex:
+    def __init__(self, directory=DEFAULT_INDEX_DIR):
+        self.directory = directory
+        self.manifest = {"segments": [], "next_segment": 1, "documents": 0, "usernames": []}
+        self.vocab = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self._merged_away = [] # Segment names the next manifest retires
+        manifest_path = os.path.join(directory, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f: self.manifest = json.load(f)
+            with open(os.path.join(directory, self.manifest.get("vocab", "vocab.json")), encoding="utf-8") as f: self.vocab = json.load(f)
+            self.df = np.load(os.path.join(directory, self.manifest.get("df", "df.npy")))
+        norms = self.manifest.get("norms", {})
+        self.segments = [Segment(os.path.join(directory, name), norms.get(name, "norms.npy")) for name in self.manifest["segments"]]
+
+    # --- Writing ---
+    def idf(self):
+        n_docs = self.manifest["documents"]
+        return (np.log((1 + n_docs) / (1 + self.df)) + 1.0).astype(np.float64) # Smoothed, never zero
+
+    def _write_segment(self, name, matrix, doc_lines):
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        matrix = matrix.tocsc(); matrix.sort_indices()
+        np.save(os.path.join(path, "indptr.npy"), matrix.indptr.astype(np.int64))
+        np.save(os.path.join(path, "doc_ids.npy"), matrix.indices.astype(np.int32))
+        np.save(os.path.join(path, "tf.npy"), matrix.data.astype(np.float32))
+        offsets, position = [], 0
+        with open(os.path.join(path, "docs.jsonl"), "wb") as f:
+            for line in doc_lines:
+                offsets.append(position); f.write(line); position += len(line)
+        np.save(os.path.join(path, "doc_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        return Segment(path)
+
+    def add_documents(self, documents):
+        """Indexes (username, turn, part, text) records as one new segment. Returns the number of documents added."""
+        rows, cols, values, doc_lines = [], [], [], []
+        for username, turn, part, text in documents:
+            counts = Counter(tokenize(text))
+            if not counts: continue
+            doc_id = len(doc_lines)
+            for term, count in counts.items():
+                term_id = self.vocab.setdefault(term, len(self.vocab))
+                rows.append(doc_id); cols.append(term_id); values.append(1.0 + math.log(count))
+            doc_lines.append((json.dumps({"username": username, "turn": turn, "part": part, "text": text}, ensure_ascii=False) + "\n").encode("utf-8"))
+        if not doc_lines: return 0
+
+        matrix = sparse.csc_matrix((np.asarray(values, dtype=np.float32), (np.asarray(rows), np.asarray(cols))),
+                                   shape=(len(doc_lines), len(self.vocab)))
+        name = f"seg_{self.manifest['next_segment']:05d}"
+        self.segments.append(self._write_segment(name, matrix, doc_lines))
+        self.manifest["segments"].append(name); self.manifest["next_segment"] += 1
+        self.df = np.concatenate([self.df, np.zeros(len(self.vocab) - len(self.df), dtype=np.int64)]) + np.diff(matrix.indptr)
+        self.manifest["documents"] += len(doc_lines)
+        if len(self.segments) > MAX_SEGMENTS: self.merge_segments()
+        return len(doc_lines)
+
+    def merge_segments(self):
+        """Merges every segment into one (fewer files to touch per query)."""
+        if len(self.segments) < 2: return
+        n_terms = len(self.vocab)
+        matrix = sparse.vstack([segment.matrix(n_terms) for segment in self.segments], format="csc")
+        doc_lines = (json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n" for segment in self.segments for doc in segment.iter_docs())
+        name = f"seg_{self.manifest['next_segment']:05d}"
+        old_names = [os.path.basename(segment.path) for segment in self.segments]
+        self.segments = [self._write_segment(name, matrix, doc_lines)]
+        self.manifest["segments"] = [name]; self.manifest["next_segment"] += 1
+        self._merged_away.extend(old_names)
+
+    def commit(self):
+        """Writes the norms, document frequencies and vocabulary of a new generation and publishes its manifest."""
+        generation = self.manifest.get("generation", 0) + 1
+        idf = self.idf()
+        norms = {}
+        for segment in self.segments:
+            norms[os.path.basename(segment.path)] = _generation_file("norms", generation, "npy")
+            _write_array(os.path.join(segment.path, norms[os.path.basename(segment.path)]), segment.compute_norms(idf))
+        manifest = {**self.manifest, "generation": generation, "vocab": _generation_file("vocab", generation, "json"),
+                    "df": _generation_file("df", generation, "npy"), "norms": norms, "retired": self._merged_away}
+        _write_array(os.path.join(self.directory, manifest["df"]), self.df)
+        _write_json(os.path.join(self.directory, manifest["vocab"]), self.vocab)
+        _write_json(os.path.join(self.directory, "manifest.json"), manifest) # Publish
+        for name in self.manifest.get("retired", []): shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        self.manifest, self._merged_away = manifest, []
+        self._remove_generations_before(generation - 1)
+        self.segments = [Segment(segment.path, norms[os.path.basename(segment.path)]) for segment in self.segments] # Reopen with the new norms
+
+    def _remove_generations_before(self, generation):
+        """Deletes vocabulary, document frequency and norms files older than the given generation."""
+        directories = [self.directory] + [segment.path for segment in self.segments]
+        for directory in directories:
+            for name in os.listdir(directory):
+                match = GENERATION_FILE_PATTERN.fullmatch(name)
+                if match and int(match.group(1) or 0) < generation:
+                    try: os.remove(os.path.join(directory, name))
+                    except OSError: pass # Still mapped by a reader on a platform that refuses; the next commit retries
+
+    def add_export(self, export_path, study=None):
+        """Indexes the answers of every interview in a results export that is not in the index yet."""
+        indexed = set(self.manifest["usernames"])
+        parts = analytics.outline_parts(analytics.study_outline(study))
+        new_usernames = []
+
+        def documents():
+            for _, row in analytics.read_export(export_path, analytics.export_layout(study)[0]):
+                username = row["username"]
+                if not username or username in indexed: continue
+                indexed.add(username); new_usernames.append(username)
+                turns = analytics.split_turns(analytics.transcript_from_row(row))
+                labels = analytics.align_parts([question for question, _ in turns], parts)
+                for turn_number, ((_, answer), part) in enumerate(zip(turns, labels), start=1):
+                    yield username, turn_number, part, answer.strip()
+
+        added = self.add_documents(documents())
+        self.manifest["usernames"].extend(new_usernames)
+        self.commit()
+        return len(new_usernames), added
+
+    # --- Reading ---
+    def query_vector(self, text):
+        counts = Counter(t for t in tokenize(text) if t in self.vocab)
+        return {self.vocab[term]: 1.0 + math.log(count) for term, count in counts.items()}
+
+    def search(self, text, k=10):
+        """Top-k answers by cosine similarity of TF-IDF vectors: [{score, username, turn, part, text}]."""
+        query = self.query_vector(text)
+        if not query or not self.segments: return []
+        idf = self.idf()
+        weights = {term_id: weight * idf[term_id] for term_id, weight in query.items()}
+        query_norm = math.sqrt(sum(w * w for w in weights.values()))
+        best = [] # (score, segment index, doc id)
+        for segment_index, segment in enumerate(self.segments):
+            scores = np.zeros(segment.n_docs, dtype=np.float64)
+            for term_id, weight in weights.items():
+                if term_id >= segment.n_terms: continue
+                start, end = segment.indptr[term_id], segment.indptr[term_id + 1]
+                scores[segment.doc_ids[start:end]] += segment.tf[start:end] * (idf[term_id] * weight) # doc ids unique per term
+            candidates = np.flatnonzero(scores)
+            if not len(candidates): continue
+            scores = scores[candidates] / (np.asarray(segment.norms)[candidates] * query_norm)
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            for i in top:
+                heapq.heappush(best, (float(scores[i]), segment_index, int(candidates[i])))
+                if len(best) > k: heapq.heappop(best)
+        results = []
+        for score, segment_index, doc_id in sorted(best, reverse=True):
+            doc = self.segments[segment_index].doc(doc_id); doc["score"] = round(score, 4)
+            results.append(doc)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TF-IDF search over respondent answers.")
+    parser.add_argument("--index", default=DEFAULT_INDEX_DIR, help="Index directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("add", "Index interviews from a results export that are not indexed yet."),
+                            ("rebuild", "Delete the index and build it from a results export.")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("export", help="CSV export of the results sheet.")
+        command.add_argument("--blob-store", default=None, help="Transcript blob store (default: config.TRANSCRIPT_BLOB_STORE).")
+        command.add_argument("--study", default=studies.DEFAULT_STUDY_ID, help="Study bundle whose results sheet this is (default: the built-in study).")
+    query = commands.add_parser("query", help="Answers most similar to a text.")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=10)
+    commands.add_parser("compact", help="Merge all segments into one.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "rebuild": shutil.rmtree(args.index, ignore_errors=True)
+    index = SearchIndex(args.index)
+    if args.command in ("add", "rebuild"):
+        if args.blob_store: blob_store.configure(args.blob_store)
+        interviews, documents = index.add_export(args.export, studies.load_study(args.study))
+        print(f"Indexed {interviews} new interviews ({documents} answers) in {time.perf_counter() - started:.2f}s; "
+              f"{index.manifest['documents']} answers in {len(index.segments)} segment(s).")
+    elif args.command == "compact":
+        index.merge_segments(); index.commit()
+        print(f"{index.manifest['documents']} answers in {len(index.segments)} segment(s).")
+    else:
+        results = index.search(args.text, args.k)
+        print(f"{len(results)} result(s) in {(time.perf_counter() - started) * 1000:.1f} ms (including loading the index)")
+        for result in results:
+            print(f"\n{result['score']:.3f}  {result['username']}  turn {result['turn']} ({result['part']})\n  {result['text'][:300]}")
+
+
+if __name__ == "__main__":
+    main()
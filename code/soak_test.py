@@ -0,0 +1,281 @@
+# soak_test.py
+# Chaos/soak test: keeps simulated participants running against the local stand-ins for a long time (hours before a
+# fielding window) while the stand-ins inject faults, and ends with a go/no-go verdict.
+#
+# Faults: mock LLM 429/500s, latency spikes and streams dropped mid-reply (mock_llm.py); Firestore errors and
+# timeouts on any RPC, Sheets API errors and timeouts on append (fake_backends.FaultInjector). Respondents are driven
+# by loadtest.simulate_respondent: after a failed turn or survey submit they wait, refresh and try again.
+#
+# Measured:
+#   recovery       time from a failed turn/submit to its eventual success (p50/p95/max)
+#   data loss      messages the respondent saw that are missing from Firestore; surveys submitted (the app showed
+#                  the completed page) but in neither the results sheet nor Firestore (checked per respondent as it
+#                  finishes, after which its documents and rows are dropped from the fakes so they do not count as
+#                  memory growth). Submits the app showed as failed are reported separately, not as loss.
+#   memory growth  RSS trend after the warm-up (least-squares slope, MiB/hour)
+#   latency drift  turn latency p50/p95 per time window; drift = last window p95 / first window p95
+#
+# Usage (from the code folder):
+#   python soak_test.py --duration-minutes 240 --concurrency 30 --json-out soak.json
+#   python soak_test.py --duration-minutes 2 --concurrency 4 --interview-turns 3   # quick smoke run
+# Exits 1 on NO-GO.
+import argparse
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+import loadtest
+
+COLLECTION = "interviews" # The built-in study's collection (respondents run without ?study=)
+
+
+# --- Respondent Audit ---
+def audit_respondent(db, worksheet, result):
+    """Data-loss counts of one finished respondent; then drops its documents and rows from the fakes."""
+    username, audit = result["username"], result.pop("audit")
+    document_path = f"{COLLECTION}/{username}"
+    stored = db.documents(document_path + "/messages/")
+    stored_messages = Counter((data.get("role"), data.get("content")) for data in stored.values())
+    lost_messages = sum((Counter(audit["messages"]) - stored_messages).values())
+    interview = db.document_data(document_path) or {}
+    in_firestore, in_sheet = bool(interview.get("survey_data")), bool(worksheet.pop_rows(username))
+    db.purge(document_path)
+    return {
+        "messages_seen": len(audit["messages"]), "messages_lost": lost_messages,
+        "survey_submitted": audit["survey_submitted"],
+        "survey_submit_failures": result["survey_submit_failures"], # Visible to the respondent, so not data loss
+        "survey_lost": audit["survey_submitted"] and not (in_sheet or in_firestore),
+        "survey_missing_from_sheet": audit["survey_submitted"] and not in_sheet,
+    }
+
+
+# --- Trend Metrics ---
+def slope_per_hour(samples):
+    """Least-squares slope of (unix time, value) samples, per hour; None with fewer than two samples."""
+    if len(samples) < 2: return None
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_v = sum(v for _, v in samples) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not variance: return None
+    return sum((t - mean_t) * (v - mean_v) for t, v in samples) / variance * 3600
+
+
+def latency_windows(results, started_at, duration_seconds, windows):
+    """Turn latency p50/p95 per equal time window of the run (windows without turns are left out)."""
+    buckets = [[] for _ in range(windows)]
+    for r in results:
+        for finished_at, latency in zip(r["turn_finished_at"], r["turn_latencies"]):
+            index = int((finished_at - started_at) / duration_seconds * windows)
+            buckets[min(max(index, 0), windows - 1)].append(latency)
+    return [{"window": i + 1, "turns": len(b), "p50": loadtest.percentile(b, 50), "p95": loadtest.percentile(b, 95)}
+            for i, b in enumerate(buckets) if b]
+
+
+# --- Soak Run ---
+def run_soak(args):
+    sys.path.insert(0, loadtest.CODE_DIR)
+    import fake_backends
+    import mock_llm
+    import utils
+
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="skills_survey_soak_")) # The app's local data/ backups
+    llm_settings = mock_llm.MockLLMSettings(
+        tokens_per_second=args.tokens_per_second, first_token_latency=args.first_token_latency,
+        error_rate=args.llm_error_rate, interview_turns=args.interview_turns, seed=args.seed,
+        latency_spike_rate=args.llm_spike_rate, latency_spike_seconds=args.llm_spike_seconds,
+        drop_stream_rate=args.llm_drop_rate)
+    server, base_url = mock_llm.start_in_background(llm_settings)
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["ANTHROPIC_BASE_URL"] = base_url
+    firestore_faults = fake_backends.FaultInjector(
+        error_rate=args.firestore_error_rate, timeout_rate=args.firestore_timeout_rate,
+        timeout_seconds=args.storage_timeout_seconds, seed=args.seed + 1)
+    sheets_faults = fake_backends.FaultInjector(
+        error_rate=args.sheets_error_rate, timeout_rate=args.sheets_timeout_rate,
+        timeout_seconds=args.storage_timeout_seconds, error_statuses=(429, 500), seed=args.seed + 2)
+    worksheet = fake_backends.install_fake_sheets(utils, fake_backends.FakeWorksheet(faults=sheets_faults))
+    db = fake_backends.install_fake_firestore(utils, fake_backends.FakeFirestore(faults=firestore_faults))
+    with redirect_stdout(io.StringIO()):
+        loadtest.install_shared_runtime()
+
+    options = {
+        "run_id": time.strftime("%Y%m%d%H%M%S"), "seed": args.seed, "timeout": args.timeout,
+        "max_turns": args.interview_turns + 5, "turn_attempts": args.attempts, "think_time": args.think_time,
+        "retry_wait": args.retry_wait, "audit": True,
+    }
+    duration = args.duration_minutes * 60
+    started_at = time.time()
+    deadline = time.perf_counter() + duration
+    indices = itertools.count()
+    results, audits, lock = [], [], threading.Lock()
+
+    def participant_loop():
+        while time.perf_counter() < deadline:
+            result = loadtest.simulate_respondent(next(indices), options)
+            audit = audit_respondent(db, worksheet, result)
+            with lock:
+                results.append(result); audits.append(audit)
+
+    sampler = loadtest.RssSampler(interval=1.0); sampler.start()
+    print(f"Soak test: {args.duration_minutes:g} min, {args.concurrency} concurrent participants; LLM at {base_url}")
+    try:
+        with redirect_stdout(open(os.devnull, "w")):
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                loops = [pool.submit(participant_loop) for _ in range(args.concurrency)]
+                next_progress = time.time() + args.progress_seconds
+                while not all(loop.done() for loop in loops):
+                    time.sleep(1.0)
+                    if time.time() >= next_progress:
+                        next_progress += args.progress_seconds
+                        with lock:
+                            done, lost = len(results), sum(a["messages_lost"] for a in audits)
+                        print(f"  {(time.time() - started_at) / 60:6.1f} min: {done} participants finished, {lost} messages lost, "
+                              f"RSS {loadtest.current_rss_bytes() / 1024 / 1024:.0f} MiB", file=sys.__stdout__, flush=True)
+                for loop in loops: loop.result()
+    finally:
+        sampler.stop()
+        server.shutdown()
+    elapsed = time.time() - started_at
+
+    warmup_end = started_at + elapsed * args.warmup_fraction
+    windows = latency_windows(results, started_at, elapsed, args.windows)
+    recoveries = [s for r in results for s in r["recovery_seconds"]]
+    completed = sum(1 for r in results if r["completed"])
+    growth = slope_per_hour([(t, rss / 1024 / 1024) for t, rss in sampler.samples if t >= warmup_end])
+    first_p95, last_p95 = (windows[0]["p95"], windows[-1]["p95"]) if windows else (None, None)
+    return {
+        "duration_seconds": elapsed,
+        "participants": len(results),
+        "completed": completed,
+        "completion_rate": completed / len(results) if results else 0.0,
+        "turns": sum(len(r["turn_latencies"]) for r in results),
+        "turn_retries": sum(r["turn_retries"] for r in results),
+        "recovery_seconds": {"count": len(recoveries), "p50": loadtest.percentile(recoveries, 50),
+                             "p95": loadtest.percentile(recoveries, 95), "max": max(recoveries, default=None)},
+        "data_loss": {
+            "messages_seen": sum(a["messages_seen"] for a in audits),
+            "messages_lost": sum(a["messages_lost"] for a in audits),
+            "participants_with_lost_messages": sum(1 for a in audits if a["messages_lost"]),
+            "surveys_submitted": sum(1 for a in audits if a["survey_submitted"]),
+            "survey_submit_failures": sum(a["survey_submit_failures"] for a in audits),
+            "surveys_never_submitted": sum(1 for a in audits if a["survey_submit_failures"] and not a["survey_submitted"]),
+            "surveys_lost": sum(1 for a in audits if a["survey_lost"]),
+            "surveys_missing_from_sheet": sum(1 for a in audits if a["survey_missing_from_sheet"]),
+        },
+        "memory": {"start_rss_mib": sampler.samples[0][1] / 1024 / 1024 if sampler.samples else None,
+                   "peak_rss_mib": sampler.peak / 1024 / 1024, "growth_mib_per_hour": growth},
+        "latency_windows": windows,
+        "latency_drift": last_p95 / first_p95 if first_p95 else None,
+        "stages_reached": dict(Counter(str(r["stage_reached"]) for r in results)),
+        "faults": {"llm": dict(llm_settings.stats), "firestore": dict(firestore_faults.stats), "sheets": dict(sheets_faults.stats)},
+        "errors_sample": [e for r in results for e in r["errors"]][:20],
+    }
+
+
+# --- Verdict ---
+def evaluate(report, args):
+    """(criterion, measured, limit, passed) rows; a missing measurement fails its criterion."""
+    loss, rec = report["data_loss"], report["recovery_seconds"]
+    checks = [
+        ("messages lost", loss["messages_lost"], args.max_lost_messages, lambda v, l: v <= l),
+        ("surveys lost", loss["surveys_lost"], args.max_lost_surveys, lambda v, l: v <= l),
+        ("completion rate", report["completion_rate"], args.min_completion_rate, lambda v, l: v >= l),
+        ("recovery p95 (s)", rec["p95"] if rec["count"] else 0.0, args.max_recovery_seconds, lambda v, l: v <= l),
+        ("memory growth (MiB/h)", report["memory"]["growth_mib_per_hour"], args.max_memory_growth, lambda v, l: v <= l),
+        ("latency drift (p95 last/first)", report["latency_drift"], args.max_latency_drift, lambda v, l: v <= l),
+    ]
+    return [(name, value, limit, value is not None and ok(value, limit)) for name, value, limit, ok in checks]
+
+
+def print_report(report, checks):
+    fmt = lambda v, unit="": f"{v:.2f}{unit}" if isinstance(v, float) else ("n/a" if v is None else f"{v}{unit}")
+    loss, rec, mem = report["data_loss"], report["recovery_seconds"], report["memory"]
+    print("\n=== Soak test report ===")
+    print(f"Duration:          {report['duration_seconds'] / 60:.1f} min")
+    print(f"Participants:      {report['participants']} ({report['completed']} completed, {report['completion_rate']:.1%}); stages {report['stages_reached']}")
+    print(f"Turns:             {report['turns']} ({report['turn_retries']} retried)")
+    print(f"Recovery:          {rec['count']} recoveries, p50 {fmt(rec['p50'], 's')}  p95 {fmt(rec['p95'], 's')}  max {fmt(rec['max'], 's')}")
+    print(f"Data loss:         {loss['messages_lost']} of {loss['messages_seen']} messages ({loss['participants_with_lost_messages']} participants); "
+          f"{loss['surveys_lost']} of {loss['surveys_submitted']} surveys ({loss['surveys_missing_from_sheet']} missing from the sheet)")
+    print(f"Failed submits:    {loss['survey_submit_failures']} shown as failed to the participant "
+          f"({loss['surveys_never_submitted']} participants never got their survey through; not counted as lost)")
+    print(f"Memory:            start {fmt(mem['start_rss_mib'], ' MiB')}, peak {fmt(mem['peak_rss_mib'], ' MiB')}, growth {fmt(mem['growth_mib_per_hour'], ' MiB/h')} after warm-up")
+    print("Turn latency:      " + "  ".join(f"w{w['window']} p50 {fmt(w['p50'], 's')}/p95 {fmt(w['p95'], 's')}" for w in report["latency_windows"]))
+    print(f"Latency drift:     {fmt(report['latency_drift'], 'x')}")
+    print(f"Faults injected:   LLM {report['faults']['llm']}")
+    print(f"                   Firestore {report['faults']['firestore']}")
+    print(f"                   Sheets {report['faults']['sheets']}")
+    if report["errors_sample"]:
+        print("Errors (sample):")
+        for e in report["errors_sample"][:10]: print(f"  - {e}")
+    print("\nCriteria:")
+    for name, value, limit, passed in checks:
+        print(f"  {'PASS' if passed else 'FAIL'}  {name:<32} {fmt(value):>10}   limit {limit}")
+    print(f"\nVerdict: {'GO' if all(passed for *_, passed in checks) else 'NO-GO'}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Soak the interview app under injected faults and give a go/no-go verdict.")
+    parser.add_argument("--duration-minutes", type=float, default=120.0, help="Participants keep starting until this has passed.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Participants in flight at any time.")
+    parser.add_argument("--interview-turns", type=int, default=6)
+    parser.add_argument("--think-time", type=float, default=2.0, help="Max random pause (s) before each answer.")
+    parser.add_argument("--attempts", type=int, default=5, help="Times a participant retries a failed turn or submit.")
+    parser.add_argument("--retry-wait", type=float, default=3.0, help="Pause (s) before refreshing after a failure.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="AppTest timeout per script run (s).")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    faults = parser.add_argument_group("faults")
+    faults.add_argument("--llm-error-rate", type=float, default=0.03, help="LLM requests failed with 429/500.")
+    faults.add_argument("--llm-spike-rate", type=float, default=0.03, help="LLM requests delayed by a latency spike.")
+    faults.add_argument("--llm-spike-seconds", type=float, default=8.0)
+    faults.add_argument("--llm-drop-rate", type=float, default=0.02, help="LLM streams cut off mid-reply.")
+    faults.add_argument("--firestore-error-rate", type=float, default=0.005, help="Firestore RPCs failed with 429/503.")
+    faults.add_argument("--firestore-timeout-rate", type=float, default=0.002, help="Firestore RPCs that time out.")
+    faults.add_argument("--sheets-error-rate", type=float, default=0.05, help="Sheet appends failed with 429/500.")
+    faults.add_argument("--sheets-timeout-rate", type=float, default=0.02, help="Sheet appends that time out.")
+    faults.add_argument("--storage-timeout-seconds", type=float, default=2.0, help="Wait before an injected storage timeout fails.")
+    criteria = parser.add_argument_group("go/no-go criteria")
+    criteria.add_argument("--max-lost-messages", type=int, default=0)
+    criteria.add_argument("--max-lost-surveys", type=int, default=0)
+    criteria.add_argument("--min-completion-rate", type=float, default=0.95)
+    criteria.add_argument("--max-recovery-seconds", type=float, default=60.0, help="Limit on the recovery p95.")
+    criteria.add_argument("--max-memory-growth", type=float, default=50.0, help="Limit on RSS growth (MiB/hour).")
+    criteria.add_argument("--max-latency-drift", type=float, default=1.5, help="Limit on last/first window p95 turn latency.")
+    parser.add_argument("--windows", type=int, default=4, help="Time windows for the latency drift.")
+    parser.add_argument("--warmup-fraction", type=float, default=0.1, help="Share of the run left out of the memory trend.")
+    parser.add_argument("--progress-seconds", type=float, default=60.0)
+    parser.add_argument("--workdir", default=None, help="Directory for the app's local data/ backups (default: temp dir).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", default=None, help="Write the report and verdict as JSON to this path.")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    if args.json_out: args.json_out = os.path.abspath(args.json_out) # run_soak changes into the work directory
+    report = run_soak(args)
+    checks = evaluate(report, args)
+    print_report(report, checks)
+    go = all(passed for *_, passed in checks)
+    if args.json_out:
+        report["criteria"] = [{"criterion": name, "measured": value, "limit": limit, "passed": passed}
+                              for name, value, limit, passed in checks]
+        report["verdict"] = "GO" if go else "NO-GO"
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json_out}")
+    if not go: raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
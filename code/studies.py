@@ -0,0 +1,227 @@
+# studies.py
+# Study bundles: one deployment serves several studies, selected per session with ?study=<id>. A bundle holds
+# everything study-specific (interview prompt, closing codes and messages, models, welcome/consent text, survey schema)
+# and its storage targets (Firestore collection, results sheet), so studies share one warm process, one LLM client
+# pool and one Firestore client while their data stays apart.
+#
+# Bundles live in studies/<id>.json next to this file and are loaded, validated and compiled (shared system prompt
+# record, closing-code lookup) once per process. Without ?study= the session runs the built-in study defined by
+# config.py, stored where it always was (collection 'interviews', sheet 'pilot_survey_results').
+#
+# Bundle keys ("title", one of "system_prompt"/"prompt_file", and "consent_markdown" are required):
+#   title                 page title
+#   system_prompt         the full system prompt, or
+#   prompt_file           a text file with it, relative to studies/
+#   closing_messages      {code: message shown when the interviewer replies with exactly that code} (default:
+#                         config.CLOSING_MESSAGES); every code must appear in the prompt
+#   model, model_strong   default: config.MODEL / config.MODEL_STRONG (see routing.py)
+#   routing_summary_triggers  default: config.ROUTING_SUMMARY_TRIGGERS
+#   welcome_markdown, consent_markdown, consent_label   welcome page text ('{username}' is replaced)
+#   collection            Firestore collection (default: interviews_<id>)
+#   sheet_name            results spreadsheet (default: <id>_survey_results); must be shared with the service account
+#   survey                list of questions: {"key", "label", "type": "select"|"text"|"slider", "options" (select),
+#                         "min"/"max"/"default" (slider, default 0/100/50), "required" (select, default true), "help"}
+#                         (default: the built-in survey form of app.py); keys name the results-sheet columns, so the
+#                         sheet's own column names (username, submission_time_utc, consent_given, transcript_part_*)
+#                         are reserved
+import functools
+import json
+import os
+import re
+
+import config
+import message_store
+import routing
+
+STUDY_QUERY_PARAM = "study"
+SESSION_KEY = "study_id"
+DEFAULT_STUDY_ID = "default"
+STUDIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "studies")
+DEFAULT_COLLECTION = "interviews"
+DEFAULT_SHEET_NAME = "pilot_survey_results"
+USERNAME_STORAGE_KEY = "skills_survey_username_uuid"
+
+STUDY_ID_PATTERN = re.compile(r"[a-z0-9][a-z0-9_-]{0,39}")
+BUNDLE_KEYS = {"title", "system_prompt", "prompt_file", "closing_messages", "model", "model_strong",
+               "routing_summary_triggers", "welcome_markdown", "consent_markdown", "consent_label",
+               "collection", "sheet_name", "survey"}
+QUESTION_TYPES = {"select", "text", "slider"}
+SELECT_PLACEHOLDER = "Select..."
+SHEET_LEADING_COLUMNS = ["username", "submission_time_utc", "consent_given"] # Before the survey columns of every row
+TRANSCRIPT_COLUMN_PREFIX = "transcript_part_" # The transcript columns after them: transcript_part_1 ... _5
+DEFAULT_WELCOME = "Hi there, thanks for your interest in this research project! Please read the information below before you begin."
+DEFAULT_CONSENT_LABEL = "I have read and understood the information above, I am 18 years or older, and I voluntarily consent to participate in this study."
+
+
+class StudyError(Exception):
+    """A study bundle is missing or invalid."""
+
+
+class Study:
+    """A validated study bundle (read-only; one instance per study per process, shared by all its sessions)."""
+
+    def __init__(self, study_id, title, system_prompt, closing_messages, model, model_strong, routing_summary_triggers,
+                 collection, sheet_name, survey=None, welcome_markdown=None, consent_markdown=None, consent_label=None):
+        self.study_id = study_id
+        self.title = title
+        self.system_prompt = system_prompt
+        self.system_message = message_store.shared_system_message(system_prompt)
+        self.closing_messages = dict(closing_messages)
+        self.model = model
+        self.model_strong = model_strong
+        self.routing_summary_triggers = list(routing_summary_triggers)
+        self.collection = collection
+        self.sheet_name = sheet_name
+        self.survey = survey
+        self.welcome_markdown = welcome_markdown
+        self.consent_markdown = consent_markdown
+        self.consent_label = consent_label
+
+    @property
+    def is_default(self):
+        return self.study_id == DEFAULT_STUDY_ID
+
+    @property
+    def username_storage_key(self):
+        """Browser local-storage key of the participant id (one id per study, so local backups never collide)."""
+        return USERNAME_STORAGE_KEY if self.is_default else f"{USERNAME_STORAGE_KEY}_{self.study_id}"
+
+    @property
+    def aggregates_document(self):
+        """Document under aggregates/ holding this study's survey counter shards (survey_aggregates.py)."""
+        return "survey" if self.is_default else f"survey_{self.study_id}"
+
+    @property
+    def aggregate_fields(self):
+        """(categorical, numeric, slider) survey fields to aggregate; None for the built-in survey's own lists."""
+        if self.survey is None: return None
+        sliders = [q["key"] for q in self.survey if q["type"] == "slider"]
+        return [q["key"] for q in self.survey if q["type"] == "select"], sliders, sliders
+
+    @property
+    def sheet_survey_columns(self):
+        """Names of a bundle survey's results-sheet columns before the transcript parts; None for the built-in survey
+        (its layout is spelled out in utils.save_survey_data_to_gsheet and analytics.SURVEY_COLUMNS)."""
+        if self.survey is None: return None
+        return SHEET_LEADING_COLUMNS + [q["key"] for q in self.survey]
+
+    def sheet_values(self, survey_responses):
+        """Survey columns of the results-sheet row for a bundle survey, in question order."""
+        return [str(survey_responses.get(q["key"], "")) for q in self.survey]
+
+
+# --- Loading & Validation ---
+def _fail(study_id, message):
+    raise StudyError(f"Study '{study_id}': {message}")
+
+
+def _validate_survey(study_id, survey):
+    if not isinstance(survey, list) or not survey: _fail(study_id, "'survey' must be a non-empty list of questions.")
+    keys = set()
+    for number, question in enumerate(survey, 1):
+        if not isinstance(question, dict): _fail(study_id, f"survey question {number} is not an object.")
+        key, kind = question.get("key"), question.get("type")
+        if not isinstance(key, str) or not re.fullmatch(r"[a-z][a-z0-9_]*", key):
+            _fail(study_id, f"survey question {number} needs a 'key' of lowercase letters, digits and underscores.")
+        if key in keys: _fail(study_id, f"survey key '{key}' is used twice.")
+        if key in SHEET_LEADING_COLUMNS or key.startswith(TRANSCRIPT_COLUMN_PREFIX):
+            _fail(study_id, f"survey key '{key}' is reserved for a column of the results sheet.")
+        keys.add(key)
+        if kind not in QUESTION_TYPES: _fail(study_id, f"survey question '{key}' has type {kind!r}, expected one of {sorted(QUESTION_TYPES)}.")
+        if not question.get("label"): _fail(study_id, f"survey question '{key}' needs a 'label'.")
+        if kind == "select":
+            options = question.get("options")
+            if not isinstance(options, list) or not options or not all(isinstance(o, str) for o in options):
+                _fail(study_id, f"survey question '{key}' needs a list of string 'options'.")
+        if kind == "slider":
+            low, high = question.get("min", 0), question.get("max", 100)
+            if not (isinstance(low, int) and isinstance(high, int) and low < high and low <= question.get("default", 50) <= high):
+                _fail(study_id, f"survey slider '{key}' needs integer min < max with the default in between.")
+    return survey
+
+
+def _study_from_bundle(study_id, bundle):
+    unknown = set(bundle) - BUNDLE_KEYS
+    if unknown: _fail(study_id, f"unknown keys {sorted(unknown)}.")
+    if not bundle.get("title"): _fail(study_id, "'title' is required.")
+    if ("system_prompt" in bundle) == ("prompt_file" in bundle): _fail(study_id, "give exactly one of 'system_prompt' and 'prompt_file'.")
+    if "prompt_file" in bundle:
+        try:
+            with open(os.path.join(STUDIES_DIR, bundle["prompt_file"]), encoding="utf-8") as f: system_prompt = f.read()
+        except OSError as e: _fail(study_id, f"cannot read prompt_file: {e}")
+    else:
+        system_prompt = bundle["system_prompt"]
+    if not isinstance(system_prompt, str) or not system_prompt.strip(): _fail(study_id, "the system prompt is empty.")
+
+    closing_messages = bundle.get("closing_messages", config.CLOSING_MESSAGES)
+    if not isinstance(closing_messages, dict) or not closing_messages: _fail(study_id, "'closing_messages' must map codes to messages.")
+    missing = [code for code in closing_messages if code not in system_prompt]
+    if missing: _fail(study_id, f"closing codes {missing} do not appear in the system prompt.")
+
+    model, model_strong = bundle.get("model", config.MODEL), bundle.get("model_strong", config.MODEL_STRONG)
+    for name in (model, model_strong):
+        if routing.provider_for_model(name) is None: _fail(study_id, f"model '{name}' must contain 'gpt' or 'claude'.")
+
+    collection = bundle.get("collection", f"{DEFAULT_COLLECTION}_{study_id}")
+    if not isinstance(collection, str) or not re.fullmatch(r"[A-Za-z0-9_-]+", collection) or collection == DEFAULT_COLLECTION:
+        _fail(study_id, f"'collection' must be a plain collection id other than '{DEFAULT_COLLECTION}'.")
+    if not bundle.get("consent_markdown"): _fail(study_id, "'consent_markdown' (information sheet and consent form) is required.")
+
+    return Study(
+        study_id, bundle["title"], system_prompt, closing_messages, model, model_strong,
+        bundle.get("routing_summary_triggers", config.ROUTING_SUMMARY_TRIGGERS), collection,
+        bundle.get("sheet_name", f"{study_id}_survey_results"),
+        survey=_validate_survey(study_id, bundle["survey"]) if "survey" in bundle else None,
+        welcome_markdown=bundle.get("welcome_markdown", DEFAULT_WELCOME), consent_markdown=bundle["consent_markdown"],
+        consent_label=bundle.get("consent_label", DEFAULT_CONSENT_LABEL))
+
+
+@functools.lru_cache(maxsize=None) # Failures are not cached: a fixed bundle is picked up on the next session
+def load_study(study_id):
+    """The Study for an id, loaded and validated on first use in this process. Raises StudyError."""
+    if study_id == DEFAULT_STUDY_ID:
+        return Study(DEFAULT_STUDY_ID, "Skills & AI Interview", config.SYSTEM_PROMPT, config.CLOSING_MESSAGES,
+                     config.MODEL, config.MODEL_STRONG, config.ROUTING_SUMMARY_TRIGGERS, DEFAULT_COLLECTION, DEFAULT_SHEET_NAME)
+    if not isinstance(study_id, str) or not STUDY_ID_PATTERN.fullmatch(study_id):
+        raise StudyError(f"Invalid study id {study_id!r}.")
+    path = os.path.join(STUDIES_DIR, f"{study_id}.json")
+    try:
+        with open(path, encoding="utf-8") as f: bundle = json.load(f)
+    except FileNotFoundError: raise StudyError(f"Unknown study '{study_id}'.") from None
+    except (OSError, ValueError) as e: raise StudyError(f"Study '{study_id}': cannot read {path}: {e}") from None
+    if not isinstance(bundle, dict): _fail(study_id, "the bundle must be a JSON object.")
+    return _study_from_bundle(study_id, bundle)
+
+
+def available_studies():
+    """Ids of the built-in study and every bundle file (not validated)."""
+    try: bundles = sorted(name[:-5] for name in os.listdir(STUDIES_DIR) if name.endswith(".json"))
+    except OSError: bundles = []
+    return [DEFAULT_STUDY_ID] + [study_id for study_id in bundles if study_id != DEFAULT_STUDY_ID]
+
+
+def current_study():
+    """The study of the running Streamlit session (chosen by app.py); the built-in study outside a session."""
+    try:
+        import streamlit as st
+        study_id = st.session_state.get(SESSION_KEY)
+    except Exception:
+        study_id = None
+    return load_study(study_id or DEFAULT_STUDY_ID)
+
+
+def main():
+    """Validates every bundle: python studies.py"""
+    failed = False
+    for study_id in available_studies():
+        try:
+            study = load_study(study_id)
+            print(f"{study_id}: OK ({study.model} / {study.model_strong}, collection '{study.collection}', sheet '{study.sheet_name}', "
+                  f"{'built-in survey' if study.survey is None else f'{len(study.survey)} survey questions'})")
+        except StudyError as e:
+            print(f"{study_id}: INVALID - {e}"); failed = True
+    if failed: raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
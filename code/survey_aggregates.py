@@ -0,0 +1,250 @@
+# survey_aggregates.py
+# Precomputed survey statistics, updated by each save_survey_data call instead of re-reading every submission.
+#
+# Firestore layout: aggregates/survey/shards/{0..config.AGGREGATE_SHARDS-1} (aggregates/survey_<study id>/... for
+# study bundles, which aggregate their own select and slider questions; see studies.py). Each submission increments one random
+# shard (a single document only sustains about one write per second); readers sum the shards, so reading costs
+# AGGREGATE_SHARDS document reads however many respondents there are. Each shard holds:
+#   respondents
+#   fields.<field>.count / .hist.<value or bin>      for every survey field
+#   fields.<field>.sum / .sumsq                     for numeric fields (means and variances follow from these)
+#   by_major.<major>.respondents / .fields...       the same, per major
+# ai_model is free text; it is counted in AI_MODEL_BUCKETS, so the histogram keys stay a fixed set.
+# interviews/{username}.survey_aggregated_responses holds the answers that were counted. A resubmission adds the difference
+# to them (which can leave single shards negative; their sum is what counts), so the aggregates follow the survey_data it
+# overwrote. Only submissions saved to Firestore survey_data are counted, as verify and rebuild read nothing else.
+#
+# Usage (from the code folder):
+#   python survey_aggregates.py show      # current aggregates
+#   python survey_aggregates.py verify    # recompute from every stored submission and compare
+#   python survey_aggregates.py rebuild   # recompute and replace the stored aggregates
+#   add --study <id> for a study bundle
+import argparse
+import copy
+import json
+import math
+import random
+import re
+
+from google.cloud import firestore
+
+import config
+
+AGGREGATES_COLLECTION = "aggregates"
+AGGREGATES_DOCUMENT = "survey"
+INTERVIEWS_COLLECTION = "interviews"
+CATEGORICAL_FIELDS = ["age", "gender", "major", "year", "gpa", "ai_model"]
+NUMERIC_FIELDS = ["age", "gpa", "learning_enjoyment", "university_enjoyment", "ai_usage_percentage"]
+SLIDER_FIELDS = ["learning_enjoyment", "university_enjoyment", "ai_usage_percentage"] # 0-100, histogram in bins of 10
+SLIDER_BIN_WIDTH = 10
+BLANK = "(blank)"
+# ai_model buckets in match order: (bucket, substrings of the folded answer); anything else counts as "other"
+AI_MODEL_BUCKETS = [("copilot", ["copilot"]), ("chatgpt", ["chatgpt", "gpt", "openai"]), ("claude", ["claude", "anthropic"]),
+                    ("gemini", ["gemini", "bard"]), ("perplexity", ["perplexity"]), ("deepseek", ["deepseek"]),
+                    ("llama", ["llama", "meta ai"]), ("mistral", ["mistral", "le chat"]), ("none", ["none", "no ai"])]
+AI_MODEL_OTHER = "other"
+
+
+def _number(value):
+    """Float for numeric answers ('21', '7.5', 50); None for options like 'Under 18' or 'Below 5.0'."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool): return float(value)
+    if isinstance(value, str) and re.fullmatch(r"\s*\d+(?:[.,]\d+)?\s*", value): return float(value.replace(",", "."))
+    return None
+
+
+def _ai_model_bucket(value):
+    folded = " ".join(str(value or "").lower().split())
+    if not folded: return BLANK
+    return next((bucket for bucket, needles in AI_MODEL_BUCKETS if any(needle in folded for needle in needles)), AI_MODEL_OTHER)
+
+
+def _category(field, value):
+    if field == "ai_model": return _ai_model_bucket(value) # Free text: a fixed set of buckets, not one key per spelling
+    return str(value) if value not in (None, "") else BLANK
+
+
+def counted_responses(survey_responses, fields=None):
+    """The answers the aggregates use, as stored in interviews/{username}.survey_aggregated_responses."""
+    categorical_fields, numeric_fields, slider_fields = fields or (CATEGORICAL_FIELDS, NUMERIC_FIELDS, SLIDER_FIELDS)
+    keys = dict.fromkeys([*categorical_fields, *numeric_fields, *slider_fields])
+    return {key: survey_responses.get(key) for key in keys}
+
+
+def submission_deltas(survey_responses, fields=None):
+    """Nested dict of the counts one submission adds (the same shape as a shard and as the combined aggregates).
+
+    fields: (categorical, numeric, slider) field lists, default the built-in survey's.
+    """
+    categorical_fields, numeric_fields, slider_fields = fields or (CATEGORICAL_FIELDS, NUMERIC_FIELDS, SLIDER_FIELDS)
+    counts = {}
+    for field in slider_fields:
+        value = _number(survey_responses.get(field))
+        if value is None: continue
+        bin_start = int(min(value // SLIDER_BIN_WIDTH * SLIDER_BIN_WIDTH, 100 - SLIDER_BIN_WIDTH))
+        counts[field] = {"count": 1, "hist": {str(bin_start): 1}}
+    for field in categorical_fields:
+        counts[field] = {"count": 1, "hist": {_category(field, survey_responses.get(field)): 1}}
+    for field in numeric_fields:
+        value = _number(survey_responses.get(field))
+        if value is None or field not in counts: continue
+        counts[field].update({"numeric_count": 1, "sum": value, "sumsq": value * value})
+    deltas = {"respondents": 1, "fields": counts}
+    if "major" not in categorical_fields: return deltas
+    return {**deltas, "by_major": {_category("major", survey_responses.get("major")): copy.deepcopy(deltas)}}
+
+
+def merge_into(total, deltas):
+    """Adds a nested dict of counts into another, in place."""
+    for key, value in deltas.items():
+        if isinstance(value, dict): merge_into(total.setdefault(key, {}), value)
+        else: total[key] = total.get(key, 0) + value
+    return total
+
+
+def _negated(deltas):
+    return {key: _negated(value) if isinstance(value, dict) else -value for key, value in deltas.items()}
+
+
+def _without_zeros(deltas):
+    """Drops zero counts and the maps left empty, so a resubmission only writes what changed."""
+    pruned = {}
+    for key, value in deltas.items():
+        if isinstance(value, dict): value = _without_zeros(value)
+        if value: pruned[key] = value
+    return pruned
+
+
+def _as_increments(deltas):
+    return {key: _as_increments(value) if isinstance(value, dict) else firestore.Increment(value) for key, value in deltas.items()}
+
+
+def _shards_ref(db, document=AGGREGATES_DOCUMENT):
+    return db.collection(AGGREGATES_COLLECTION).document(document).collection("shards")
+
+
+# --- Writing ---
+def record_submission(db, username, survey_responses, collection=INTERVIEWS_COLLECTION, document=AGGREGATES_DOCUMENT, fields=None):
+    """Counts a submission saved to survey_data (transaction on the interview document). Returns True if the aggregates changed.
+
+    A resubmission replaces the answers counted before: only the difference to survey_aggregated_responses is added.
+    """
+    if not db or not username: return False
+    user_ref = db.collection(collection).document(username)
+    shard_ref = _shards_ref(db, document).document(str(random.randrange(config.AGGREGATE_SHARDS)))
+    responses = counted_responses(survey_responses, fields)
+
+    @firestore.transactional
+    def _record(transaction):
+        snapshot = user_ref.get(transaction=transaction)
+        previous = (snapshot.to_dict() or {}).get("survey_aggregated_responses") if snapshot.exists else None
+        deltas = submission_deltas(responses, fields)
+        if previous is not None:
+            deltas = _without_zeros(merge_into(deltas, _negated(submission_deltas(previous, fields))))
+        if not deltas: return False
+        transaction.set(shard_ref, _as_increments(deltas), merge=True)
+        transaction.set(user_ref, {"survey_aggregated_responses": responses}, merge=True)
+        return True
+
+    try:
+        counted = _record(db.transaction())
+        if not counted: print(f"Survey aggregates: submission of {username} was already counted with the same answers.")
+        return counted
+    except Exception as e:
+        print(f"Warning: Failed to update survey aggregates for {username}: {e}") # verify/rebuild will show the gap
+        return False
+
+
+# --- Reading ---
+def read_aggregates(db, document=AGGREGATES_DOCUMENT):
+    """Combined counts of all shards (AGGREGATE_SHARDS document reads)."""
+    total = {}
+    for shard in _shards_ref(db, document).stream():
+        merge_into(total, shard.to_dict() or {})
+    return total
+
+
+def field_statistics(aggregates):
+    """{field: {count, mean, variance, std, hist}} from combined counts (sample variance, None below two values)."""
+    stats = {}
+    for field, values in (aggregates.get("fields") or {}).items():
+        entry = {"count": values.get("count", 0), "hist": {key: n for key, n in values.get("hist", {}).items() if n}} # Resubmissions leave zeros
+        n = values.get("numeric_count", 0)
+        if n:
+            mean = values["sum"] / n
+            variance = max(0.0, (values["sumsq"] - n * mean * mean) / (n - 1)) if n > 1 else None
+            entry.update({"numeric_count": n, "mean": mean, "variance": variance,
+                          "std": math.sqrt(variance) if variance is not None else None})
+        stats[field] = entry
+    return stats
+
+
+# --- Verification ---
+def recompute_from_submissions(db, collection=INTERVIEWS_COLLECTION, fields=None):
+    """(aggregates, {username: counted responses}) computed from scratch from every stored survey submission (reads every interview)."""
+    total, submissions = {}, {}
+    for doc in db.collection(collection).stream():
+        survey_data = (doc.to_dict() or {}).get("survey_data") or {}
+        if not survey_data.get("survey_responses"): continue
+        submissions[doc.id] = counted_responses(survey_data["survey_responses"], fields)
+        merge_into(total, submission_deltas(submissions[doc.id], fields))
+    return total, submissions
+
+
+def differences(expected, actual, path=""):
+    """Dotted paths whose counts differ between two aggregate dicts."""
+    diffs = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        left, right = expected.get(key), actual.get(key)
+        if isinstance(left, dict) or isinstance(right, dict):
+            diffs.extend(differences(left or {}, right or {}, f"{path}{key}."))
+        elif not math.isclose(left or 0, right or 0, rel_tol=1e-9, abs_tol=1e-6):
+            diffs.append(f"{path}{key}: stored {right}, recomputed {left}")
+    return diffs
+
+
+def rebuild(db, collection=INTERVIEWS_COLLECTION, document=AGGREGATES_DOCUMENT, fields=None):
+    """Replaces the shards with aggregates recomputed from scratch and records the answers counted for every submission.
+
+    Submissions saved while this runs can be lost from the aggregates: rebuild outside fielding, or run verify after.
+    """
+    total, submissions = recompute_from_submissions(db, collection, fields)
+    for shard in _shards_ref(db, document).stream():
+        shard.reference.delete()
+    _shards_ref(db, document).document("0").set(total)
+    usernames = list(submissions)
+    for start in range(0, len(usernames), 400): # Batches are limited to 500 writes
+        batch = db.batch()
+        for username in usernames[start:start + 400]:
+            batch.set(db.collection(collection).document(username), {"survey_aggregated_responses": submissions[username]}, merge=True)
+        batch.commit()
+    return total, submissions
+
+
+def main():
+    import studies
+    import utils # Firestore client from the Streamlit secrets (or the emulator)
+    parser = argparse.ArgumentParser(description="Show, verify or rebuild the precomputed survey aggregates.")
+    parser.add_argument("command", choices=["show", "verify", "rebuild"])
+    parser.add_argument("--study", default=studies.DEFAULT_STUDY_ID, help="Study bundle id (default: the built-in study).")
+    args = parser.parse_args()
+    study = studies.load_study(args.study)
+    db = utils.get_firestore_client()
+    if not db: raise SystemExit("No Firestore client.")
+
+    if args.command == "show":
+        aggregates = read_aggregates(db, study.aggregates_document)
+        print(f"Respondents: {aggregates.get('respondents', 0)}")
+        print(json.dumps(field_statistics(aggregates), indent=2, ensure_ascii=False))
+    elif args.command == "verify":
+        expected, submissions = recompute_from_submissions(db, study.collection, study.aggregate_fields)
+        diffs = differences(expected, read_aggregates(db, study.aggregates_document))
+        print(f"Recomputed from {len(submissions)} submissions: {len(diffs)} difference(s).")
+        for line in diffs[:50]: print(f"  {line}")
+        if diffs: raise SystemExit(1)
+    else:
+        total, submissions = rebuild(db, study.collection, study.aggregates_document, study.aggregate_fields)
+        print(f"Rebuilt aggregates from {len(submissions)} submissions ({total.get('respondents', 0)} respondents).")
+
+
+if __name__ == "__main__":
+    main()
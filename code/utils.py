@@ -7,7 +7,14 @@ import pandas as pd
 import gspread
 from google.oauth2.service_account import Credentials
 import config
+import message_store
+import survey_aggregates
+import profiling
+import studies
+import blob_store
 import random # For GSheet throttle sleep
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
 # --- NEW Firestore Imports ---
 from google.cloud import firestore
@@ -19,6 +26,11 @@ from google.oauth2 import service_account as google_service_account # Alias to a
 @st.cache_resource
 def get_firestore_client():
     """Initializes and returns a Firestore client using credentials from Streamlit secrets."""
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # Local emulator (load testing / development): no service account needed
+        db = firestore.Client()
+        print(f"Firestore client initialized against emulator at {os.environ['FIRESTORE_EMULATOR_HOST']}.")
+        return db
     try:
         creds_dict = st.secrets["firestore_credentials"]
         creds = google_service_account.Credentials.from_service_account_info(creds_dict)
@@ -35,9 +47,49 @@ def get_firestore_client():
         return None
 # --- END Firestore Client Initialization ---
 
+def _interview_ref(db, username):
+    """The user's interview document in the current study's collection (studies.py)."""
+    return db.collection(studies.current_study().collection).document(username)
+
+
+# --- Google Sheets Worksheet Initialization ---
+RESULTS_SHEET_NAME = studies.DEFAULT_SHEET_NAME # The built-in study's; bundle studies name their own
+
+@st.cache_resource
+def get_results_worksheet(sheet_name=RESULTS_SHEET_NAME):
+    """Authorizes gspread and opens a results worksheet once per process and sheet (raises on failure, nothing cached)."""
+    scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+    creds_dict = st.secrets["connections"]["gsheets"]
+    creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+    gc = gspread.authorize(creds)
+    worksheet = gc.open(sheet_name).sheet1
+    print(f"GSheet worksheet '{sheet_name}' opened.")
+    return worksheet
+# --- END Google Sheets Worksheet Initialization ---
+
+
+# --- Transcript Blob Store (see blob_store.py) ---
+@st.cache_resource
+def get_transcript_blob_store(spec):
+    """Opens the transcript blob store once per process (gs:// stores use the Firestore service account)."""
+    credentials_info = st.secrets.get("firestore_credentials") if spec.startswith("gs://") else None
+    return blob_store.open_store(spec, dict(credentials_info) if credentials_info else None)
+
+@profiling.traced
+def save_transcript_blob(username, formatted_transcript):
+    """Stores the transcript in config.TRANSCRIPT_BLOB_STORE. Returns its reference, or None (no store configured, or
+    the store failed: the caller then keeps the transcript inline)."""
+    if not config.TRANSCRIPT_BLOB_STORE: return None
+    try:
+        return blob_store.put_text(get_transcript_blob_store(config.TRANSCRIPT_BLOB_STORE), formatted_transcript)
+    except Exception as e:
+        print(f"Warning: Could not store the transcript blob for {username}, keeping it inline in the sheet: {e}")
+        return None
+
 
 # --- Firestore Utility Functions ---
 
+@profiling.traced
 def save_message_to_firestore(username, message_data):
     """Saves a single message to Firestore."""
     db = get_firestore_client()
@@ -47,12 +99,15 @@ def save_message_to_firestore(username, message_data):
     try:
         message_data_with_ts = message_data.copy()
         message_data_with_ts['timestamp'] = firestore.SERVER_TIMESTAMP
-        doc_ref = db.collection("interviews").document(username).collection("messages").add(message_data_with_ts)
+        doc_ref = _interview_ref(db, username).collection("messages").add(message_data_with_ts)
         return True
     except Exception as e:
         print(f"Error saving message to Firestore for user {username}: {e}")
         return False
+    finally:
+        invalidate_resume_state(username)
 
+@profiling.traced
 def save_interview_state_to_firestore(username, state_data):
     """Saves key interview state variables to Firestore, removing obsolete keys."""
     db = get_firestore_client()
@@ -68,13 +123,98 @@ def save_interview_state_to_firestore(username, state_data):
         state_data_with_ts = state_data_cleaned
         state_data_with_ts['last_updated'] = firestore.SERVER_TIMESTAMP
 
-        doc_ref = db.collection("interviews").document(username)
+        doc_ref = _interview_ref(db, username)
         doc_ref.set(state_data_with_ts, merge=True)
         return True
     except Exception as e:
         print(f"Error saving state to Firestore for user {username}: {e}")
         return False
+    finally:
+        invalidate_resume_state(username)
+
+def _read_messages(state_doc_ref):
+    """Reads a user's messages subcollection in timestamp order as {'role', 'content'} dicts."""
+    loaded_messages = []
+    messages_ref = state_doc_ref.collection("messages").order_by("timestamp", direction=firestore.Query.ASCENDING)
+    for doc in messages_ref.stream():
+        msg = doc.to_dict()
+        if 'role' in msg and 'content' in msg:
+             loaded_messages.append({'role': msg['role'], 'content': msg['content']})
+    return loaded_messages
+
+# --- Resume State Prefetch ---
+# A returning participant's bootstrap reads the state document and the messages stream. app.py calls
+# prefetch_resume_state as soon as it knows the username: the messages query starts on a worker thread, and
+# load_interview_state_from_firestore reads the state document on the script thread meanwhile, so the two overlap
+# with one worker per session. If the pool is busy and the query has not started by then, the script thread cancels
+# it and runs it itself: a full pool never makes a resume slower than two reads in a row.
+# A started query serves other sessions of the same user in this process (e.g. a second tab) for
+# config.RESUME_PREFETCH_TTL_SECONDS; the process's own writes to the user's messages or state drop it. Turn handling
+# (load_messages_from_firestore, the turn lease) always reads Firestore directly.
+_resume_executor = ThreadPoolExecutor(max_workers=config.RESUME_PREFETCH_WORKERS, thread_name_prefix="resume-prefetch")
+_resume_cache = {} # (collection, username) -> (started_at, future of the messages)
+_resume_cache_lock = threading.Lock()
+
+def _resume_key(username):
+    return (studies.current_study().collection, username) # Resolved here: the worker threads have no Streamlit session
+
+def _fresh_resume_entry(key):
+    """The cached entry for key if it is still fresh (expired entries are dropped on the way)."""
+    now = time.monotonic()
+    with _resume_cache_lock:
+        for expired in [k for k, entry in _resume_cache.items() if now - entry[0] >= config.RESUME_PREFETCH_TTL_SECONDS]:
+            del _resume_cache[expired]
+        return _resume_cache.get(key)
+
+def _resume_messages(db, username):
+    """The future of the user's messages query, submitted unless a fresh one exists."""
+    key = _resume_key(username)
+    entry = _fresh_resume_entry(key)
+    if entry is not None: return entry[1]
+    state_doc_ref = _interview_ref(db, username)
+    with _resume_cache_lock:
+        entry = _resume_cache.get(key)
+        if entry is None: # Not started by another session in the meantime
+            entry = (time.monotonic(), _resume_executor.submit(_read_messages, state_doc_ref))
+            _resume_cache[key] = entry
+    return entry[1]
+
+def _await_resume_messages(username, future, state_doc_ref):
+    """The messages from the prefetch, or read on this thread if the query is still queued (or was cancelled)."""
+    if future.cancel():
+        with _resume_cache_lock:
+            key = _resume_key(username)
+            if key in _resume_cache and _resume_cache[key][1] is future: del _resume_cache[key]
+        return _read_messages(state_doc_ref)
+    try:
+        return future.result()
+    except CancelledError: # Cancelled by another session of the same user
+        return _read_messages(state_doc_ref)
+
+def prefetch_resume_state(username):
+    """Starts reading the user's messages on a worker thread; returns without waiting."""
+    db = get_firestore_client()
+    if db and username: _resume_messages(db, username)
+
+def invalidate_resume_state(username):
+    """Drops the user's prefetched reads (after a write, or when a read failed)."""
+    with _resume_cache_lock:
+        _resume_cache.pop(_resume_key(username), None)
 
+@profiling.traced
+def load_messages_from_firestore(username):
+    """Loads only the messages (e.g. to pick up a turn completed by another tab). Returns None on failure."""
+    db = get_firestore_client()
+    if not db or not username:
+        print("Error: Cannot load messages, invalid input or DB client.")
+        return None
+    try:
+        return _read_messages(_interview_ref(db, username))
+    except Exception as e:
+        print(f"Error loading messages from Firestore for user {username}: {e}")
+        return None
+
+@profiling.traced
 def load_interview_state_from_firestore(username):
     """Loads interview state and messages from Firestore, ignoring obsolete keys."""
     db = get_firestore_client()
@@ -84,8 +224,9 @@ def load_interview_state_from_firestore(username):
     loaded_state = {}
     loaded_messages = []
     try:
-        state_doc_ref = db.collection("interviews").document(username)
-        state_doc = state_doc_ref.get()
+        messages_future = _resume_messages(db, username) # Usually started by prefetch_resume_state already
+        state_doc_ref = _interview_ref(db, username)
+        state_doc = state_doc_ref.get() # On this thread, while the messages query runs on a worker
         if state_doc.exists:
             loaded_state_raw = state_doc.to_dict()
             obsolete_keys = ["manual_question_index", "manual_answers_storage", "manual_answers_formatted", "partial_ai_transcript_formatted", "manual_fallback_triggered", "last_updated"]
@@ -96,21 +237,123 @@ def load_interview_state_from_firestore(username):
         else:
             print(f"No existing state found in Firestore for user {username}")
 
-        messages_ref = state_doc_ref.collection("messages").order_by("timestamp", direction=firestore.Query.ASCENDING)
-        docs = messages_ref.stream()
-        for doc in docs:
-            msg = doc.to_dict()
-            msg.pop('timestamp', None)
-            if 'role' in msg and 'content' in msg:
-                 loaded_messages.append({'role': msg['role'], 'content': msg['content']})
+        loaded_messages = _await_resume_messages(username, messages_future, state_doc_ref)
         if loaded_messages:
              print(f"Loaded {len(loaded_messages)} messages from Firestore for user {username}")
         return loaded_state, loaded_messages
     except Exception as e:
         print(f"Error loading state/messages from Firestore for user {username}: {e}")
+        invalidate_resume_state(username) # The next attempt reads again
         return {}, []
 
-# --- Interview Save (Formats Transcript for GSheet, Saves Timing Locally) ---
+# --- Per-User Turn Lease (serialises LLM turns across tabs, processes and replicas) ---
+# Stored at interviews/{username}/locks/turn: {holder, status: running|done, acquired_at, expires_at, message_count}.
+# message_count is the number of stored messages when the last turn was released: a tab taking the lease compares it
+# with its own history to find out, without another read, whether a turn completed elsewhere since it last synced.
+# A lease whose holder stops heartbeating expires after config.TURN_LEASE_TTL_SECONDS and can be taken over.
+# All functions fail open (the interview continues uncoordinated) if Firestore is unavailable.
+
+def _turn_lease_ref(db, username):
+    return _interview_ref(db, username).collection("locks").document("turn")
+
+def _lease_is_held_by_other(lease, holder_id, now):
+    return (lease.get("status") == "running" and lease.get("holder") != holder_id
+            and lease.get("expires_at", 0) > now)
+
+@profiling.traced
+def acquire_turn_lease(username, holder_id):
+    """Transactionally takes the user's turn lease if it is free, finished or expired. Returns (held, message_count):
+    message_count is the stored message count recorded by the last release (0 before the first turn), or None if
+    unknown (the previous holder never released, or Firestore is unavailable)."""
+    db = get_firestore_client()
+    if not db or not username: return True, None
+    lease_ref = _turn_lease_ref(db, username)
+
+    @firestore.transactional
+    def _acquire(transaction):
+        snapshot = lease_ref.get(transaction=transaction)
+        now = time.time()
+        lease = snapshot.to_dict() if snapshot.exists else None
+        if lease and _lease_is_held_by_other(lease, holder_id, now):
+            return False, None
+        transaction.set(lease_ref, {"holder": holder_id, "status": "running", "acquired_at": now,
+                                    "expires_at": now + config.TURN_LEASE_TTL_SECONDS})
+        if lease is None: return True, 0
+        return True, lease.get("message_count") if lease.get("status") == "done" else None
+
+    try:
+        return _acquire(db.transaction())
+    except Exception as e:
+        print(f"Warning: Could not acquire turn lease for {username}, continuing without it: {e}")
+        return True, None
+
+def renew_turn_lease(username, holder_id, last_renewed):
+    """Heartbeat: extends the lease if a third of the TTL has passed since last_renewed. Returns the new last_renewed."""
+    now = time.time()
+    if now - last_renewed < config.TURN_LEASE_TTL_SECONDS / 3: return last_renewed
+    db = get_firestore_client()
+    if not db or not username: return now
+    lease_ref = _turn_lease_ref(db, username)
+
+    @firestore.transactional
+    def _renew(transaction):
+        snapshot = lease_ref.get(transaction=transaction)
+        if snapshot.exists and snapshot.to_dict().get("holder") == holder_id:
+            transaction.update(lease_ref, {"expires_at": time.time() + config.TURN_LEASE_TTL_SECONDS})
+
+    try:
+        _renew(db.transaction())
+    except Exception as e:
+        print(f"Warning: Could not renew turn lease for {username}: {e}")
+    return now
+
+@profiling.traced
+def release_turn_lease(username, holder_id, message_count=None):
+    """Marks the lease done if this holder still owns it, recording the stored message count for the next holder."""
+    db = get_firestore_client()
+    if not db or not username: return
+    lease_ref = _turn_lease_ref(db, username)
+
+    @firestore.transactional
+    def _release(transaction):
+        snapshot = lease_ref.get(transaction=transaction)
+        if snapshot.exists and snapshot.to_dict().get("holder") == holder_id:
+            release = {"status": "done", "expires_at": time.time()}
+            if message_count is not None: release["message_count"] = message_count
+            transaction.update(lease_ref, release)
+
+    try:
+        _release(db.transaction())
+    except Exception as e:
+        print(f"Warning: Could not release turn lease for {username}: {e}")
+
+def wait_for_turn_lease(username, holder_id):
+    """Polls until no other holder has a live lease (True) or config.TURN_LEASE_WAIT_SECONDS pass (False).
+
+    The poll interval doubles from TURN_LEASE_POLL_SECONDS up to TURN_LEASE_POLL_MAX_SECONDS (never past the lease's
+    expiry), so a long wait costs a few dozen reads. A failed read counts as the lease still being held."""
+    db = get_firestore_client()
+    if not db or not username: return True
+    lease_ref = _turn_lease_ref(db, username)
+    deadline = time.time() + config.TURN_LEASE_WAIT_SECONDS
+    delay = config.TURN_LEASE_POLL_SECONDS
+    while time.time() < deadline:
+        wait = delay
+        try:
+            snapshot = lease_ref.get()
+            lease = snapshot.to_dict() if snapshot.exists else None
+            if not lease or not _lease_is_held_by_other(lease, holder_id, time.time()):
+                return True
+            wait = min(wait, max(config.TURN_LEASE_POLL_SECONDS, lease.get("expires_at", 0) - time.time()))
+        except Exception as e:
+            print(f"Warning: Could not read turn lease for {username}, treating it as held: {e}")
+        time.sleep(min(wait, max(0.0, deadline - time.time())))
+        delay = min(delay * 2, config.TURN_LEASE_POLL_MAX_SECONDS)
+    return False
+
+
+# --- Interview Save (Marks Transcript Final, Saves Timing Locally) ---
+@profiling.traced
 def save_interview_data(
     username,
     transcripts_directory,
@@ -120,29 +363,16 @@ def save_interview_data(
     is_final_save=False,
     messages_to_format=None
 ):
-    """Formats AI transcript for GSheet if is_final_save=True. Saves timing data locally."""
+    """Marks the AI transcript final if is_final_save=True (it is formatted on demand, see get_formatted_transcript). Saves timing data locally."""
     os.makedirs(transcripts_directory, exist_ok=True)
     os.makedirs(times_directory, exist_ok=True)
     if is_final_save:
-        try:
-            messages = messages_to_format if messages_to_format is not None else st.session_state.get("messages", [])
-            if messages:
-                lines = []
-                for message in messages:
-                    if message.get('role') == 'system': continue
-                    if message.get('content', '') in config.CLOSING_MESSAGES.keys(): continue
-                    is_closing_message_display = any(message.get('content', '') == display_text for code, display_text in config.CLOSING_MESSAGES.items())
-                    if is_closing_message_display: continue
-                    lines.append(f"{message.get('role', 'Unknown').capitalize()}: {message.get('content', '')}")
-                formatted_transcript_string = "\n---\n".join(lines)
-                st.session_state.current_formatted_transcript_for_gsheet = formatted_transcript_string
-                print("Formatted AI transcript prepared for GSheet.")
-            else:
-                print(f"Warning: No messages provided or found for transcript formatting for user {username}.")
-                st.session_state.current_formatted_transcript_for_gsheet = "ERROR: No messages found for formatting."
-        except Exception as e:
-            print(f"Error processing final transcript for {username}: {e}")
-            st.session_state.current_formatted_transcript_for_gsheet = f"ERROR: Processing transcript failed - {e}"
+        messages = messages_to_format if messages_to_format is not None else st.session_state.get("messages", [])
+        if messages:
+            st.session_state.transcript_final = True
+            print("AI transcript marked final for GSheet.")
+        else:
+            print(f"Warning: No messages provided or found for transcript formatting for user {username}.")
 
     time_filename = f"{username}{file_name_addition_time}_time.csv"
     time_path = os.path.join(times_directory, time_filename)
@@ -161,6 +391,32 @@ def save_interview_data(
         print(f"Error saving local time data to {time_path}: {e}")
 
 
+def get_formatted_transcript(messages=None):
+    """Formats the AI transcript for GSheet/Firestore from the session messages (nothing is kept in session state)."""
+    try:
+        messages = messages if messages is not None else st.session_state.get("messages", [])
+        if not messages:
+            return "ERROR: No messages found for formatting."
+        return message_store.format_transcript(messages, studies.current_study().closing_messages)
+    except Exception as e:
+        print(f"Error processing final transcript: {e}")
+        return f"ERROR: Processing transcript failed - {e}"
+
+
+# --- Session Memory Accounting ---
+def log_session_memory(username):
+    """Prints the bytes held by this session's state (total and largest keys). Enabled by config.MEMORY_ACCOUNTING."""
+    if not config.MEMORY_ACCOUNTING: return None
+    try:
+        total, per_key = message_store.session_footprint(st.session_state.items())
+        largest = sorted(per_key.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        print(f"Session memory for {username}: {total} bytes ({len(st.session_state.get('messages', []))} msgs). Largest keys: {largest}")
+        return total
+    except Exception as e:
+        print(f"Warning: Session memory accounting failed for {username}: {e}")
+        return None
+
+
 # --- Survey Utility Functions ---
 def create_survey_directory():
     """Creates the local survey directory."""
@@ -171,7 +427,7 @@ def check_if_survey_completed(username):
     db = get_firestore_client()
     if db and username:
         try:
-            state_doc_ref = db.collection("interviews").document(username)
+            state_doc_ref = _interview_ref(db, username)
             state_doc = state_doc_ref.get()
             if state_doc.exists:
                 state_data = state_doc.to_dict()
@@ -181,6 +437,7 @@ def check_if_survey_completed(username):
             print(f"Error checking survey completion in Firestore for {username}: {e}")
     return False
 
+@profiling.traced
 def save_survey_data_local(username, survey_responses):
     """Saves the survey responses locally as a JSON file (ephemeral backup)."""
     file_path = os.path.join(config.SURVEY_DIRECTORY, f"{username}_survey.json")
@@ -201,6 +458,7 @@ def save_survey_data_local(username, survey_responses):
         print(f"Error saving local survey backup for {username}: {e}")
         return False
 
+@profiling.traced
 def save_survey_data_to_firestore(username, survey_responses, consent_given, formatted_transcript, gsheet_save_status):
     """Saves survey responses (incl NIS, new sliders) and AI transcript to Firestore."""
     db = get_firestore_client()
@@ -222,56 +480,64 @@ def save_survey_data_to_firestore(username, survey_responses, consent_given, for
             "survey_data": survey_data_subdoc,
             "last_updated": firestore.SERVER_TIMESTAMP
         }
-        interview_doc_ref = db.collection("interviews").document(username)
+        interview_doc_ref = _interview_ref(db, username)
         interview_doc_ref.set(data_to_merge, merge=True)
         print(f"Survey data saved/merged into Firestore for user {username}")
         return True
     except Exception as e:
         print(f"Error saving survey data to Firestore for user {username}: {e}")
         return False
+    finally:
+        invalidate_resume_state(username)
 
-def save_survey_data_to_gsheet(username, survey_responses):
+@profiling.traced
+def save_survey_data_to_gsheet(username, survey_responses, formatted_transcript=None):
     """Saves survey responses (incl NIS, new sliders) and AI transcript to Google Sheets."""
     st.session_state["gsheet_save_successful"] = False
+    study = studies.current_study()
+    sheet_name = study.sheet_name
     try:
-        scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        creds_dict = st.secrets["connections"]["gsheets"]
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        gc = gspread.authorize(creds)
-
-        sheet_name = "pilot_survey_results"
-        worksheet = gc.open(sheet_name).sheet1
+        worksheet = get_results_worksheet(sheet_name)
         submission_time_utc = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
         consent_given = st.session_state.get("consent_given", "ERROR: Consent status missing")
 
-        ai_transcript_formatted = st.session_state.get("current_formatted_transcript_for_gsheet", "ERROR: AI Transcript not processed.")
+        ai_transcript_formatted = formatted_transcript if formatted_transcript is not None else get_formatted_transcript()
 
-        CHUNK_SIZE = 40000
-        ai_transcript_chunks = [ai_transcript_formatted[i:i + CHUNK_SIZE] for i in range(0, len(ai_transcript_formatted), CHUNK_SIZE)]
         MAX_TRANSCRIPT_COLUMNS = 5
-        ai_transcript_parts_for_sheet = ai_transcript_chunks[:MAX_TRANSCRIPT_COLUMNS] + [""] * (MAX_TRANSCRIPT_COLUMNS - len(ai_transcript_chunks))
-        if len(ai_transcript_chunks) > MAX_TRANSCRIPT_COLUMNS:
-            print(f"Warning: AI Transcript for {username} was longer than {MAX_TRANSCRIPT_COLUMNS} columns ({len(ai_transcript_chunks)} chunks) and has been truncated in GSheet.")
+        transcript_reference = save_transcript_blob(username, ai_transcript_formatted)
+        if transcript_reference:
+            # Whole transcript in the blob store; the first transcript column holds its reference (which is also its hash)
+            ai_transcript_parts_for_sheet = [transcript_reference] + [""] * (MAX_TRANSCRIPT_COLUMNS - 1)
+        else:
+            CHUNK_SIZE = 40000
+            ai_transcript_chunks = [ai_transcript_formatted[i:i + CHUNK_SIZE] for i in range(0, len(ai_transcript_formatted), CHUNK_SIZE)]
+            ai_transcript_parts_for_sheet = ai_transcript_chunks[:MAX_TRANSCRIPT_COLUMNS] + [""] * (MAX_TRANSCRIPT_COLUMNS - len(ai_transcript_chunks))
+            if len(ai_transcript_chunks) > MAX_TRANSCRIPT_COLUMNS:
+                print(f"Warning: AI Transcript for {username} was longer than {MAX_TRANSCRIPT_COLUMNS} columns ({len(ai_transcript_chunks)} chunks) and has been truncated in GSheet.")
 
         # --- UPDATED row_to_append: Added learning_enjoyment and university_enjoyment ---
         # New columns are J and K. Subsequent columns shift right.
-        row_to_append = [
-            username,                                       # Col A: Username
-            submission_time_utc,                            # Col B: Timestamp
-            str(consent_given),                             # Col C: Consent Given
-            survey_responses.get("age", ""),                # Col D: Age
-            survey_responses.get("gender", ""),             # Col E: Gender
-            survey_responses.get("major", ""),              # Col F: Major
-            survey_responses.get("year", ""),               # Col G: Year of Study
-            survey_responses.get("gpa", ""),                # Col H: GPA
-            survey_responses.get("student_nis", ""),        # Col I: Student Number (NIS)
-            str(survey_responses.get("learning_enjoyment", "")), # Col J: Learning Enjoyment (0-100) - NEW
-            str(survey_responses.get("university_enjoyment", "")), # Col K: University Enjoyment (0-100) - NEW
-            str(survey_responses.get("ai_usage_percentage", "")), # Col L: AI Usage % (Shifted from J)
-            survey_responses.get("ai_model", ""),           # Col M: AI Model Name (Shifted from K)
-            # AI Transcript Parts (Cols N-R - Shifted from L-P)
-            *ai_transcript_parts_for_sheet
-        ]
+        # Bundle studies with their own survey: username, timestamp, consent, one column per question, transcript parts
+        if study.survey is not None:
+            row_to_append = [username, submission_time_utc, str(consent_given), *study.sheet_values(survey_responses), *ai_transcript_parts_for_sheet]
+        else:
+            row_to_append = [
+                username,                                       # Col A: Username
+                submission_time_utc,                            # Col B: Timestamp
+                str(consent_given),                             # Col C: Consent Given
+                survey_responses.get("age", ""),                # Col D: Age
+                survey_responses.get("gender", ""),             # Col E: Gender
+                survey_responses.get("major", ""),              # Col F: Major
+                survey_responses.get("year", ""),               # Col G: Year of Study
+                survey_responses.get("gpa", ""),                # Col H: GPA
+                survey_responses.get("student_nis", ""),        # Col I: Student Number (NIS)
+                str(survey_responses.get("learning_enjoyment", "")), # Col J: Learning Enjoyment (0-100) - NEW
+                str(survey_responses.get("university_enjoyment", "")), # Col K: University Enjoyment (0-100) - NEW
+                str(survey_responses.get("ai_usage_percentage", "")), # Col L: AI Usage % (Shifted from J)
+                survey_responses.get("ai_model", ""),           # Col M: AI Model Name (Shifted from K)
+                # AI Transcript Parts (Cols N-R - Shifted from L-P)
+                *ai_transcript_parts_for_sheet
+            ]
         # --- End Row Definition ---
 
         time.sleep(random.uniform(0.1, 1.5))
@@ -302,15 +568,16 @@ def save_survey_data_to_gsheet(username, survey_responses):
         return False
 
 
+@profiling.traced
 def save_survey_data(username, survey_responses):
     """Main function to save survey data (incl NIS, new sliders). Tries GSheet first, then Firestore backup."""
     create_survey_directory()
 
     consent_given = st.session_state.get("consent_given", False)
-    ai_transcript = st.session_state.get("current_formatted_transcript_for_gsheet", "ERROR: Transcript not available")
+    ai_transcript = get_formatted_transcript()
 
     # --- Attempt GSheet Save (now includes new sliders) ---
-    gsheet_success = save_survey_data_to_gsheet(username, survey_responses)
+    gsheet_success = save_survey_data_to_gsheet(username, survey_responses, ai_transcript)
 
     # --- Save info to Firestore (now includes new sliders) ---
     firestore_save_attempted = save_survey_data_to_firestore(
@@ -329,6 +596,10 @@ def save_survey_data(username, survey_responses):
          final_state_update = {"survey_completed_flag": True}
          save_interview_state_to_firestore(username, final_state_update)
          print(f"Survey completion flag set to True in Firestore for {username}")
+         if firestore_save_attempted: # Aggregates count what verify/rebuild can see: the Firestore survey_data
+             study = studies.current_study()
+             survey_aggregates.record_submission(get_firestore_client(), username, survey_responses, study.collection,
+                                                 study.aggregates_document, study.aggregate_fields)
     else:
          print(f"Survey completion flag NOT set in Firestore for {username} due to saving failures.")
 